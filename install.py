@@ -5,34 +5,134 @@
 # dependencies = [
 #   "typer",
 #   "rich",
-#   "pygithub",
 #   "requests",
 #   "psutil",
 # ]
 # ///
 
+import collections
+import contextlib
 import getpass
+import hashlib
+import json
+import mmap
 import os
 import platform
 import re
+import selectors
 import shlex
 import signal
 import subprocess
 import sys
+import threading
+import time
 from typing import Literal
 
-import typer
-from rich.console import Console
-from rich.panel import Panel
-from rich.prompt import Confirm, Prompt
-from rich.table import Table
+# Budget for compiling and importing this script on top of a bare interpreter
+# start, which the script cannot influence; see --profile-startup
+STARTUP_BUDGET_MS = 100
+STARTUP_SAMPLES = 3  # Timed runs per measurement; the fastest one counts
 
-app = typer.Typer()
-console = Console(force_terminal=True)  # Force terminal mode to ensure proper rendering
+
+class LazyConsole:
+    """Stand-in for the rich Console that only imports rich when first used.
+
+    rich is by far the heaviest import, and fast paths like ``status`` or
+    ``--profile-startup`` should not pay for it until they actually print.
+    """
+
+    def __init__(self, **options):
+        self._options = options
+        self._console = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if self._console is None:
+            with self._lock:
+                if self._console is None:
+                    from rich.console import Console
+
+                    self._console = Console(**self._options)
+        return getattr(self._console, name)
+
+
+class CliParameter:
+    """A typer.Option or typer.Argument declared without importing typer.
+
+    typer and click alone cost more than the startup budget, so command
+    signatures hold these placeholders and build_app swaps in the real
+    parameters only once the CLI is about to parse its arguments.
+    """
+
+    def __init__(self, kind, *args, **kwargs):
+        self.kind = kind
+        self.args = args
+        self.kwargs = kwargs
+
+
+def cli_option(*args, **kwargs):
+    """Declare a typer.Option for a command registered with cli_command."""
+    return CliParameter("Option", *args, **kwargs)
+
+
+def cli_argument(*args, **kwargs):
+    """Declare a typer.Argument for a command registered with cli_command."""
+    return CliParameter("Argument", *args, **kwargs)
+
+
+CLI_COMMANDS = []  # Functions build_app turns into subcommands, in order
+
+
+def cli_command(func):
+    """Register func as a subcommand of the CLI that build_app creates."""
+    CLI_COMMANDS.append(func)
+    return func
+
+
+console = LazyConsole(force_terminal=True)  # Force terminal mode to ensure proper rendering
 
 DOTFILES_DIR = os.path.expanduser("~/.dotfiles")
 REPO_URL = "https://github.com/hadronomy/dotfiles"
 DEFAULT_USER = "hadronomy"
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "dotfiles"
+)
+# Content-addressed store for downloaded installers, tarballs and repo snapshots
+ARTIFACT_DIR = os.path.join(CACHE_DIR, "artifacts")
+ARTIFACT_CACHE_MAX_BYTES = 2 * 1024**3  # Least recently used artifacts go first
+ARTIFACT_UNPINNED_TTL = 24 * 3600  # Reuse artifacts without a pinned hash this long
+DEFAULT_JOBS = 4  # Install steps allowed to run at the same time
+# Pin the installer by pointing at a versioned release and setting its SHA-256
+NIX_INSTALLER_URL = os.environ.get(
+    "DOTFILES_NIX_INSTALLER_URL", "https://nixos.org/nix/install"
+)
+NIX_INSTALLER_SHA256 = os.environ.get("DOTFILES_NIX_INSTALLER_SHA256", "")
+# Overridable so the key upload flow can be pointed at a local mock server
+GITHUB_URL = os.environ.get("DOTFILES_GITHUB_URL", "https://github.com")
+GITHUB_API_URL = os.environ.get("DOTFILES_GITHUB_API_URL", "https://api.github.com")
+GITHUB_CLIENT_ID = "Iv1.5da81c42435d41c5"  # Client ID for a generic GitHub OAuth App
+HTTP_TIMEOUT = 30  # Seconds before a single HTTP request gives up
+DOWNLOAD_HEDGE_DELAY = 5.0  # Seconds before a slow download gets a second request
+DOWNLOAD_ATTEMPT_TIMEOUT = 120.0  # Deadline for a single download attempt
+DOWNLOAD_STALL_TIMEOUT = 15.0  # Seconds without data before an attempt is dropped
+DOWNLOAD_ATTEMPTS = 3  # Attempts per download lane
+STATE_DIR = os.path.join(
+    os.environ.get("XDG_STATE_HOME", os.path.expanduser("~/.local/state")),
+    "dotfiles",
+)
+INSTALL_JOURNAL = os.path.join(STATE_DIR, "install-state.json")
+CUSTOMIZATION_MANIFEST = os.path.join(STATE_DIR, "customization-manifest.json")
+NIX_ENV_CACHE = os.path.join(STATE_DIR, "nix-env-cache.json")
+GITHUB_KEY_CACHE = os.path.join(STATE_DIR, "github-keys.json")
+HOME_MANAGER_STATE = os.path.join(STATE_DIR, "home-manager-generation.json")
+# Repository paths whose content decides what home-manager switch builds
+GENERATION_INPUTS = ["flake.nix", "flake.lock", "home", "modules", "packages"]
+SPECULATIVE_BUILD_LOG = os.path.join(STATE_DIR, "speculative-build.log")
+SPECULATIVE_BUILD_WAIT_SHARE = 0.25  # Most of the apply budget a build may wait for
+# Serve locked github inputs from <mirror>/<owner>/<repo>/archive/<rev>.tar.gz
+FLAKE_INPUT_MIRROR = os.environ.get("DOTFILES_FLAKE_MIRROR", "")
+NIX_STORE_DIR = os.environ.get("NIX_STORE_DIR", "/nix/store")
+NIX_BASE32_ALPHABET = "0123456789abcdfghijklmnpqrsvwxyz"
 CURRENT_USER = getpass.getuser()
 USER_CONFIG = {
     "username": CURRENT_USER,
@@ -45,8 +145,448 @@ USER_CONFIG = {
 }
 
 
-def run_command(command, check=True, shell=False, dry_run=False, env=None):
-    """Runs a shell command and streams the output in real-time with rich formatting."""
+# Deadlines (seconds for the whole phase), per-command timeouts and retry budgets.
+# A deadline or timeout of None means unbounded, e.g. while waiting on the user.
+PHASE_POLICIES = {
+    "default": {
+        "deadline": None,
+        "command_timeout": 1800,
+        "retries": 2,
+        "backoff": 2.0,
+        "max_backoff": 30.0,
+    },
+    "nix-download": {"deadline": 600},
+    # The Nix installer and home-manager switch are not safe to run twice
+    "nix": {"deadline": 1800, "command_timeout": 1200, "retries": 0},
+    "home-manager": {"deadline": 2400, "command_timeout": 1200},
+    "clone": {"deadline": 600, "command_timeout": 300, "retries": 3},
+    "user-info": {"command_timeout": 600},
+    "customize": {"deadline": 600, "command_timeout": 120},
+    "prefetch": {"deadline": 1800, "command_timeout": 900},
+    "apply": {"deadline": 3600, "command_timeout": 3600, "retries": 0},
+}
+# Output that marks a failed command as worth retrying, or as never worth it
+TRANSIENT_ERROR_PATTERNS = [
+    r"Could not resolve host",
+    r"Temporary failure in name resolution",
+    r"Connection (timed out|reset|refused)",
+    r"Operation timed out",
+    r"Timeout was reached",
+    r"unable to download",
+    r"HTTP error (429|5\d\d)",
+    r"The requested URL returned error: (429|5\d\d)",
+    r"TLS handshake|SSL_ERROR|SSL connect error",
+    r"early EOF|the remote end hung up unexpectedly",
+] + [
+    pattern
+    for pattern in os.environ.get("DOTFILES_TRANSIENT_PATTERNS", "").split("\n")
+    if pattern
+]
+PERMANENT_ERROR_PATTERNS = [
+    r"Permission denied",
+    r"HTTP error 40[134]",
+    r"Repository not found",
+]
+CAPTURE_TIMEOUT = 120  # Default timeout for short commands whose output is captured
+_EXECUTION = threading.local()  # Phase and deadline of the code running on a thread
+RETRY_STATS = {}  # phase -> {"retries": count, "seconds": time lost to retries}
+_RETRY_STATS_LOCK = threading.Lock()
+# Commands started by run_command, so a failed install can stop its siblings
+_ACTIVE_PROCESSES = set()
+_ACTIVE_PROCESSES_LOCK = threading.Lock()
+SHUTTING_DOWN = threading.Event()  # Set once an install step failed
+STEP_SHUTDOWN_TIMEOUT = 10  # Seconds running steps get to stop after a failure
+_TRACE = {"events": None, "start": 0.0, "threads": {}}  # Events are None when off
+_TRACE_LOCK = threading.Lock()
+
+OUTPUT_TAIL_LINES = 200  # Lines of command output kept in memory for error reports
+ERROR_REPORT_LINES = 20  # Lines of that tail shown when a command fails
+
+
+def stream_process_output(
+    process, on_line, tail_lines=OUTPUT_TAIL_LINES, deadline=None
+):
+    """Drain a process's stdout and stderr concurrently until both pipes close.
+
+    Every complete line is passed to ``on_line(stream, timestamp, line)`` as soon
+    as it arrives, so a child flooding one pipe never stalls the other. Returns a
+    bounded deque with the last ``tail_lines`` ``(stream, timestamp, line)`` tuples,
+    or None if the process was killed for running past the monotonic ``deadline``.
+    """
+    tail = collections.deque(maxlen=tail_lines)
+    partial = {}
+
+    with selectors.DefaultSelector() as selector:
+        for stream, pipe in (("stdout", process.stdout), ("stderr", process.stderr)):
+            if pipe is not None:
+                selector.register(pipe, selectors.EVENT_READ, stream)
+                partial[stream] = b""
+
+        while selector.get_map():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                process.kill()
+                reap_process(process)
+                return None
+
+            for key, _ in selector.select(remaining):
+                stream = key.data
+                chunk = os.read(key.fd, 65536)
+                if chunk:
+                    *lines, partial[stream] = (partial[stream] + chunk).split(b"\n")
+                else:
+                    # EOF: flush whatever is left without a trailing newline
+                    selector.unregister(key.fileobj)
+                    lines = [partial[stream]] if partial[stream] else []
+                    partial[stream] = b""
+
+                timestamp = time.time()
+                for raw_line in lines:
+                    line = raw_line.decode(errors="replace").rstrip("\r")
+                    tail.append((stream, timestamp, line))
+                    on_line(stream, timestamp, line)
+
+    # A child can close its pipes (or hand them to a daemon) and keep running
+    if not reap_process(process, deadline):
+        process.kill()
+        reap_process(process)
+        return None
+    return tail
+
+
+def reap_process(process, deadline=None):
+    """Wait for a child, keeping its resource usage on ``process.rusage``.
+
+    Returns False, leaving the child running, if it has not exited by the
+    monotonic ``deadline``.
+    """
+    delay = 0.001
+    try:
+        while True:
+            flags = 0 if deadline is None else os.WNOHANG
+            pid, status, rusage = os.wait4(process.pid, flags)
+            if pid:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.1)
+        process.rusage = rusage
+        process.returncode = os.waitstatus_to_exitcode(status)
+    except ChildProcessError:
+        # Already reaped elsewhere, so its usage is lost
+        process.rusage = None
+        process.wait()
+    return True
+
+
+def print_output_line(stream, timestamp, line):
+    """Print a single line of command output, dimming stderr."""
+    console.print(
+        line,
+        style="dim" if stream == "stderr" else None,
+        markup=False,
+        highlight=False,
+    )
+
+
+def print_output_tail(tail, limit=ERROR_REPORT_LINES):
+    """Print the last lines captured from a failed command."""
+    from rich.markup import escape
+
+    lines = list(tail)[-limit:]
+    if not lines:
+        return
+    console.print(f"[bold red]Last {len(lines)} lines of output:[/bold red]")
+    for stream, timestamp, line in lines:
+        stamp = time.strftime("%H:%M:%S", time.localtime(timestamp))
+        console.print(f"  [dim]{stamp} {stream}[/dim] {escape(line)}", highlight=False)
+
+
+def start_tracing():
+    """Start recording spans for write_trace."""
+    with _TRACE_LOCK:
+        _TRACE.update(events=[], start=time.perf_counter(), threads={})
+
+
+@contextlib.contextmanager
+def span(name, category="phase", **args):
+    """Record a trace span around the enclosed code while tracing is on.
+
+    Besides wall time, a span collects the CPU time and peak RSS of the
+    commands run on its thread while it is open. Yields a dict of span
+    arguments the caller may add to.
+    """
+    if _TRACE["events"] is None:
+        yield {}
+        return
+
+    record = {"child_cpu_s": 0.0, "child_max_rss_kb": 0, **args}
+    stack = _EXECUTION.__dict__.setdefault("spans", [])
+    stack.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        duration = time.perf_counter() - start
+        stack.pop()
+        thread = threading.current_thread()
+        record["child_cpu_s"] = round(record["child_cpu_s"], 6)
+        with _TRACE_LOCK:
+            if _TRACE["events"] is not None:
+                _TRACE["threads"][thread.native_id] = thread.name
+                _TRACE["events"].append(
+                    {
+                        "name": name,
+                        "cat": category,
+                        "ph": "X",
+                        "ts": (start - _TRACE["start"]) * 1e6,
+                        "dur": duration * 1e6,
+                        "pid": os.getpid(),
+                        "tid": thread.native_id,
+                        "args": record,
+                    }
+                )
+
+
+def record_child_usage(rusage):
+    """Charge a finished child's CPU time and peak RSS to the open spans."""
+    if rusage is None or _TRACE["events"] is None:
+        return
+    for record in getattr(_EXECUTION, "spans", []):
+        record["child_cpu_s"] += rusage.ru_utime + rusage.ru_stime
+        # ru_maxrss is in kilobytes on Linux
+        record["child_max_rss_kb"] = max(record["child_max_rss_kb"], rusage.ru_maxrss)
+
+
+def write_trace(path):
+    """Write the recorded spans as a Chrome trace, viewable in Perfetto."""
+    with _TRACE_LOCK:
+        events = list(_TRACE["events"] or [])
+        threads = dict(_TRACE["threads"])
+    metadata = [
+        {
+            "name": "thread_name",
+            "ph": "M",
+            "pid": os.getpid(),
+            "tid": tid,
+            "args": {"name": name},
+        }
+        for tid, name in threads.items()
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+    console.print(f"[dim]Trace written to {path}[/dim]")
+
+
+def _phase_policy(phase):
+    """Return the execution policy for a phase, falling back to the default one."""
+    return {**PHASE_POLICIES["default"], **PHASE_POLICIES.get(phase, {})}
+
+
+def current_phase():
+    """Name of the install phase running on this thread."""
+    return getattr(_EXECUTION, "phase", "default")
+
+
+@contextlib.contextmanager
+def execution_phase(phase):
+    """Run the enclosed code under a phase's deadline and retry policy."""
+    policy = _phase_policy(phase)
+    previous = (current_phase(), getattr(_EXECUTION, "deadline", None))
+    _EXECUTION.phase = phase
+    _EXECUTION.deadline = (
+        time.monotonic() + policy["deadline"] if policy["deadline"] else None
+    )
+    try:
+        yield policy
+    finally:
+        _EXECUTION.phase, _EXECUTION.deadline = previous
+
+
+def in_current_phase(func):
+    """Wrap ``func`` to run under this thread's phase and deadline on any thread.
+
+    Phases are thread-local, so work handed to a helper thread or pool has to
+    be wrapped or it runs under the default policy with no deadline.
+    """
+    phase, deadline = current_phase(), getattr(_EXECUTION, "deadline", None)
+    interactive = owns_terminal()
+
+    def run(*args, **kwargs):
+        previous = (current_phase(), getattr(_EXECUTION, "deadline", None))
+        previous_interactive = owns_terminal()
+        _EXECUTION.phase, _EXECUTION.deadline = phase, deadline
+        _EXECUTION.interactive = interactive
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _EXECUTION.phase, _EXECUTION.deadline = previous
+            _EXECUTION.interactive = previous_interactive
+
+    return run
+
+
+def owns_terminal():
+    """Whether code on this thread may read the terminal.
+
+    True outside the step graph and in interactive steps. Commands started from
+    any other step get /dev/null as stdin, so they cannot swallow answers meant
+    for a prompt running at the same time.
+    """
+    return getattr(_EXECUTION, "interactive", True)
+
+
+def deadline_remaining():
+    """Seconds left before the current phase's deadline, or None without one."""
+    deadline = getattr(_EXECUTION, "deadline", None)
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def command_timeout(timeout=None):
+    """Bound a command timeout by the current phase's policy and remaining deadline.
+
+    Raises TimeoutExpired right away when the phase deadline has already passed.
+    """
+    limits = [
+        limit
+        for limit in (timeout, _phase_policy(current_phase())["command_timeout"])
+        if limit
+    ]
+    remaining = deadline_remaining()
+    if remaining is not None:
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(
+                f"phase {current_phase()}", _phase_policy(current_phase())["deadline"]
+            )
+        limits.append(remaining)
+    return min(limits) if limits else None
+
+
+def is_transient_error(error):
+    """Whether a failure looks like it could succeed when retried.
+
+    Each of RETRY_CLASSIFIERS is asked in turn; the first one that returns
+    True or False decides, and anything left undecided counts as permanent.
+    """
+    for classifier in RETRY_CLASSIFIERS:
+        verdict = classifier(error)
+        if verdict is not None:
+            return verdict
+    return False
+
+
+def _classify_timeout(error):
+    """Timeouts are transient, unless the phase deadline itself has run out."""
+    if isinstance(error, (subprocess.TimeoutExpired, TimeoutError)):
+        remaining = deadline_remaining()
+        return remaining is None or remaining > 0
+    return None
+
+
+def _classify_output(error):
+    """Classify failed commands by what they printed."""
+    if not isinstance(error, subprocess.CalledProcessError):
+        return None
+    output = error.output or ""
+    if isinstance(output, bytes):
+        output = output.decode(errors="replace")
+    if any(re.search(pattern, output) for pattern in PERMANENT_ERROR_PATTERNS):
+        return False
+    if any(re.search(pattern, output) for pattern in TRANSIENT_ERROR_PATTERNS):
+        return True
+    return None
+
+
+# Classifiers are tried in order; append to this list to teach the installer
+# about other kinds of transient failure
+RETRY_CLASSIFIERS = [_classify_timeout, _classify_output]
+
+
+def backoff_delay(policy, attempt):
+    """Exponential backoff with full jitter, clamped to the phase's remaining time."""
+    import random
+
+    delay = random.uniform(0, min(policy["max_backoff"], policy["backoff"] * 2**attempt))
+    remaining = deadline_remaining()
+    return delay if remaining is None else max(0.0, min(delay, remaining))
+
+
+def record_retry(seconds):
+    """Account time lost to a failed attempt and its backoff to the current phase."""
+    with _RETRY_STATS_LOCK:
+        stats = RETRY_STATS.setdefault(current_phase(), {"retries": 0, "seconds": 0.0})
+        stats["retries"] += 1
+        stats["seconds"] += seconds
+
+
+def _run_command_once(command, shell, env, timeout):
+    """Run a command once, streaming its output, and return the finished process."""
+    if SHUTTING_DOWN.is_set():
+        raise Exception("the install is stopping after a failed step")
+
+    process = subprocess.Popen(
+        command,
+        stdin=None if owns_terminal() else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        shell=shell,
+        env=env,  # Allow passing custom environment variables
+    )
+
+    # Keep the tail around so callers can report errors without scrollback
+    deadline = time.monotonic() + timeout if timeout else None
+    with _ACTIVE_PROCESSES_LOCK:
+        _ACTIVE_PROCESSES.add(process)
+    try:
+        process.output_tail = stream_process_output(
+            process, print_output_line, deadline=deadline
+        )
+    finally:
+        with _ACTIVE_PROCESSES_LOCK:
+            _ACTIVE_PROCESSES.discard(process)
+    record_child_usage(process.rusage)
+    if process.output_tail is None:
+        raise subprocess.TimeoutExpired(command, timeout)
+    return process
+
+
+def terminate_active_processes():
+    """Stop every command run_command is streaming and refuse to start new ones."""
+    SHUTTING_DOWN.set()
+    with _ACTIVE_PROCESSES_LOCK:
+        processes = list(_ACTIVE_PROCESSES)
+    for process in processes:
+        try:
+            process.terminate()
+        except OSError:
+            pass
+
+
+def run_captured(command, timeout=CAPTURE_TIMEOUT, **kwargs):
+    """Run a short command with its output captured, bounded by the phase policy.
+
+    A thin wrapper over ``subprocess.run`` that never waits forever; it raises
+    TimeoutExpired when the command or the current phase runs out of time.
+    """
+    kwargs.setdefault("check", False)
+    if "input" not in kwargs and not owns_terminal():
+        kwargs.setdefault("stdin", subprocess.DEVNULL)
+    return subprocess.run(
+        command, capture_output=True, timeout=command_timeout(timeout), **kwargs
+    )
+
+
+def run_command(
+    command, check=True, shell=False, dry_run=False, env=None, timeout=None
+):
+    """Runs a shell command and streams the output in real-time with rich formatting.
+
+    The command is bounded by ``timeout`` and by the current phase's policy.
+    Failures the retry classifiers consider transient are retried with
+    exponential backoff and jitter while the phase's retry budget lasts.
+    """
     if not shell:
         cmd_str = " ".join(shlex.quote(arg) for arg in command)
     else:
@@ -59,49 +599,480 @@ def run_command(command, check=True, shell=False, dry_run=False, env=None):
         return None
 
     console.print(f"[bold blue]Running:[/bold blue] {cmd_str}")
+    with span(cmd_str, "command") as trace:
+        policy = _phase_policy(current_phase())
+        attempt = 0
+        while True:
+            attempt += 1
+            trace["attempts"] = attempt
+            started = time.monotonic()
+            try:
+                process = _run_command_once(
+                    command, shell, env, command_timeout(timeout)
+                )
+
+                return_code = process.returncode
+                if check and return_code != 0:
+                    raise subprocess.CalledProcessError(
+                        return_code,
+                        command,
+                        output="\n".join(
+                            line for _, _, line in process.output_tail
+                        ),
+                    )
+
+                trace["returncode"] = return_code
+                return process
+
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                if isinstance(e, subprocess.TimeoutExpired):
+                    console.print(
+                        f"[bold red]Command timed out after {e.timeout:.0f}s[/bold red]"
+                    )
+                else:
+                    console.print(
+                        f"[bold red]Command failed with error code {e.returncode}[/bold red]"
+                    )
+                    print_output_tail(process.output_tail)
+
+                remaining = deadline_remaining()
+                if (
+                    attempt > policy["retries"]
+                    or (remaining is not None and remaining <= 0)
+                    or not is_transient_error(e)
+                ):
+                    raise  # Re-raise to handle in the calling function
+
+                delay = backoff_delay(policy, attempt)
+                record_retry(time.monotonic() - started + delay)
+                console.print(
+                    f"[yellow]Transient failure, retrying in {delay:.1f}s "
+                    f"(attempt {attempt + 1} of {policy['retries'] + 1})...[/yellow]"
+                )
+                time.sleep(delay)
+            except FileNotFoundError as e:
+                console.print(f"[bold red]Command not found: {e}[/bold red]")
+                raise  # Re-raise to handle in the calling function
+
+
+def file_sha256(path):
+    """Return the hex SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _download_attempt(url, part_path, deadline, cancelled, sha256=None):
+    """Download url into part_path, resuming from whatever part_path already holds.
+
+    A partial file is only resumed when something can prove the splice: the
+    ETag or Last-Modified recorded next to it (sent as If-Range, so a changed
+    file comes back whole) or a pinned ``sha256``. Otherwise it starts over.
+
+    Raises if the attempt is cancelled, stalls for DOWNLOAD_STALL_TIMEOUT, or
+    runs past the monotonic ``deadline``.
+    """
+    import urllib.error
+    import urllib.request
+
+    meta_path = f"{part_path}.meta"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    validator = None
+    if offset:
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            if meta.get("url") == url:
+                validator = meta.get("validator")
+        except (OSError, ValueError):
+            pass
+        if not validator and not sha256:
+            offset = 0
+
+    request = urllib.request.Request(url, headers={"User-Agent": "dotfiles-installer"})
+    if offset:
+        request.add_header("Range", f"bytes={offset}-")
+        if validator:
+            request.add_header("If-Range", validator)
+
     try:
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            shell=shell,
-            env=env,  # Allow passing custom environment variables
-        )
+        response = urllib.request.urlopen(request, timeout=DOWNLOAD_STALL_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset:
+            return  # The previous attempt already fetched everything
+        raise
+
+    with response:
+        # Servers that ignore Range send the whole file again
+        resumed = offset and getattr(response, "status", None) == 206
+        if not resumed:
+            # Weak ETags are not allowed in If-Range
+            etag = response.headers.get("ETag") or ""
+            validator = (
+                etag if etag and not etag.startswith("W/") else None
+            ) or response.headers.get("Last-Modified")
+            with open(meta_path, "w") as f:
+                json.dump({"url": url, "validator": validator}, f)
+        expected = response.headers.get("Content-Length")
+        received = 0
+        with open(part_path, "ab" if resumed else "wb") as f:
+            while chunk := response.read(65536):
+                if cancelled.is_set():
+                    raise Exception("cancelled")
+                if time.monotonic() > deadline:
+                    raise Exception("attempt deadline exceeded")
+                f.write(chunk)
+                received += len(chunk)
+        # urllib returns a short body without complaint when the server hangs up
+        if expected and expected.isdigit() and received < int(expected):
+            raise Exception(f"connection closed after {received} of {expected} bytes")
+
+
+def download_file(
+    url,
+    dest,
+    sha256=None,
+    hedge_delay=DOWNLOAD_HEDGE_DELAY,
+    attempt_timeout=DOWNLOAD_ATTEMPT_TIMEOUT,
+    attempts=DOWNLOAD_ATTEMPTS,
+):
+    """Download url to dest with hedging, resumption and integrity checks.
+
+    A first lane starts immediately; if it has not finished after
+    ``hedge_delay`` seconds a second lane starts in parallel and whichever
+    finishes first wins. Each lane retries up to ``attempts`` times with a
+    per-attempt deadline, resuming its partial file with Range requests. When
+    ``sha256`` is given, a download only counts once its digest matches.
+
+    Partial files are removed only after every lane has stopped, so a lane
+    that is still winding down cannot recreate one behind the cleanup.
+    """
+    import queue
+
+    cancelled = threading.Event()
+    results = queue.Queue()
+
+    def lane(index):
+        part_path = f"{dest}.part{index}"
+        error = None
+        for attempt in range(1, attempts + 1):
+            if cancelled.is_set():
+                return
+            try:
+                _download_attempt(
+                    url,
+                    part_path,
+                    time.monotonic() + attempt_timeout,
+                    cancelled,
+                    sha256=sha256,
+                )
+                if sha256 and file_sha256(part_path) != sha256.lower():
+                    os.remove(part_path)
+                    raise Exception("checksum mismatch")
+                results.put((part_path, None))
+                return
+            except Exception as e:
+                error = e
+                if cancelled.is_set():
+                    return
+                console.print(
+                    f"[yellow]Download attempt {index}.{attempt} of {url} failed: {e}[/yellow]"
+                )
+                cancelled.wait(min(2**attempt, 10))
+        results.put((None, error))
+
+    lanes = [threading.Thread(target=lane, args=(1,), daemon=True)]
+    lanes[0].start()
 
+    errors = []
+    try:
         while True:
-            stdout_line = process.stdout.readline()
-            stderr_line = process.stderr.readline()
+            try:
+                part_path, error = results.get(timeout=hedge_delay)
+            except queue.Empty:
+                if len(lanes) == 1:
+                    console.print(
+                        f"[yellow]Download of {url} is slow, starting a hedged request...[/yellow]"
+                    )
+                    lanes.append(threading.Thread(target=lane, args=(2,), daemon=True))
+                    lanes[1].start()
+                continue
 
-            if stdout_line:
-                console.print(stdout_line.strip())
-            if stderr_line:
-                console.print(f"[dim]{stderr_line.strip()}[/dim]")
+            if part_path:
+                os.replace(part_path, dest)
+                return dest
+
+            errors.append(error)
+            if len(errors) == len(lanes):
+                raise Exception(f"Download of {url} failed: {errors[-1]}")
+    finally:
+        cancelled.set()
+        # A lane notices cancellation between chunks, or when its read stalls
+        for index, thread in enumerate(lanes, start=1):
+            thread.join(timeout=DOWNLOAD_STALL_TIMEOUT + 1)
+            if thread.is_alive():
+                continue  # Leave its files; the recorded validator guards a resume
+            for path in (f"{dest}.part{index}", f"{dest}.part{index}.meta"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    console.print(f"[yellow]Could not remove {path}: {e}[/yellow]")
 
-            if not stdout_line and not stderr_line and process.poll() is not None:
-                break
 
-        return_code = process.returncode
-        if check and return_code != 0:
-            raise subprocess.CalledProcessError(return_code, command)
+def download_with_tools(url, dest, sha256=None):
+    """Download url to dest with curl, then wget.
 
-        return process
+    The fallback for when download_file fails: these tools honour the system's
+    proxy, netrc and CA configuration, which urllib does not always pick up.
+    """
+    commands = [
+        ["curl", "-fsSL", "--retry", "2", "-o", dest, url],
+        ["wget", "-q", "-O", dest, url],
+    ]
+    error = "neither curl nor wget is installed"
+    for command in commands:
+        if not find_executable(command[0]):
+            continue
+        try:
+            result = run_captured(command, timeout=DOWNLOAD_ATTEMPT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            error = f"{command[0]} timed out"
+            continue
+        if result.returncode != 0:
+            error = f"{command[0]}: {result.stderr.decode(errors='replace').strip()}"
+        elif sha256 and file_sha256(dest) != sha256.lower():
+            error = f"{command[0]}: checksum mismatch"
+        else:
+            return dest
+    if os.path.exists(dest):
+        os.remove(dest)
+    raise Exception(f"Download of {url} failed: {error}")
 
-    except subprocess.CalledProcessError as e:
+
+@contextlib.contextmanager
+def artifact_index():
+    """Lock and load the artifact store index, saving it on exit.
+
+    The lock is a file lock so side-by-side installs on one host can share the
+    store safely.
+    """
+    import fcntl
+
+    os.makedirs(os.path.join(ARTIFACT_DIR, "objects"), exist_ok=True)
+    index_path = os.path.join(ARTIFACT_DIR, "index.json")
+    with open(os.path.join(ARTIFACT_DIR, "index.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+
+        yield index
+
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, index_path)
+
+
+def _artifact_size(path):
+    """Size in bytes of an artifact file or snapshot directory."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def lease_artifact(entry):
+    """Mark an index entry as used by this process until it exits."""
+    entry["users"] = sorted(set(entry.get("users", [])) | {os.getpid()})
+
+
+def artifact_in_use(entry):
+    """Whether a running installer still uses an artifact; forgets exited ones."""
+    live = []
+    for pid in entry.get("users", []):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            continue
+        except PermissionError:
+            pass  # Alive, but owned by someone else
+        live.append(pid)
+    entry["users"] = live
+    return bool(live)
+
+
+def evict_artifacts(index, max_bytes=ARTIFACT_CACHE_MAX_BYTES):
+    """Drop least recently used artifacts until the store fits in max_bytes.
+
+    Pinned artifacts and artifacts a running installer still uses are kept.
+    """
+    import shutil
+
+    total = sum(entry["size"] for entry in index.values())
+    for key, entry in sorted(index.items(), key=lambda item: item[1]["last_used"]):
+        if total <= max_bytes:
+            break
+        if entry.get("pinned") or artifact_in_use(entry):
+            continue
+        path = entry["path"]
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+        total -= entry["size"]
+        del index[key]
+
+
+def fetch_artifact(url, sha256=None):
+    """Return a verified local copy of url from the artifact store.
+
+    Objects are stored under their SHA-256. With a pinned ``sha256`` any stored
+    object with that digest is reused; without one, the object last fetched
+    from url is reused for ARTIFACT_UNPINNED_TTL. Stored objects are re-hashed
+    before use, so a corrupted object is fetched again.
+    """
+    objects_dir = os.path.join(ARTIFACT_DIR, "objects")
+    with artifact_index() as index:
+        entry = index.get(url)
+        digest = (sha256 or "").lower() or (entry or {}).get("sha256")
+        fresh = sha256 or (
+            entry and time.time() - entry["fetched_at"] < ARTIFACT_UNPINNED_TTL
+        )
+        path = os.path.join(objects_dir, digest) if digest else None
+        if fresh and path and os.path.exists(path) and file_sha256(path) == digest:
+            console.print(f"[dim]Reusing cached artifact for {url}[/dim]")
+            entry = index.setdefault(url, {"fetched_at": time.time()})
+            entry.update(
+                sha256=digest,
+                path=path,
+                size=os.path.getsize(path),
+                last_used=time.time(),
+                pinned=bool(sha256),
+            )
+            lease_artifact(entry)
+            return path
+
+    # Download outside the lock so other installs are not blocked meanwhile
+    tmp_path = os.path.join(
+        objects_dir, f".download-{os.getpid()}-{threading.get_ident()}"
+    )
+    try:
+        download_file(url, tmp_path, sha256=sha256)
+    except Exception as e:
+        console.print(f"[yellow]{e}; retrying with curl or wget...[/yellow]")
+        download_with_tools(url, tmp_path, sha256=sha256)
+    digest = file_sha256(tmp_path)
+    path = os.path.join(objects_dir, digest)
+    os.replace(tmp_path, path)
+
+    with artifact_index() as index:
+        now = time.time()
+        index[url] = {
+            "sha256": digest,
+            "path": path,
+            "size": os.path.getsize(path),
+            "fetched_at": now,
+            "last_used": now,
+            "pinned": bool(sha256),
+        }
+        lease_artifact(index[url])
+        evict_artifacts(index)
+    return path
+
+
+def fetch_git_snapshot(url):
+    """Return a shallow checkout of url's default branch from the artifact store.
+
+    Published snapshots are never modified. An update is prepared in a private
+    directory without holding the store lock. It starts from a local copy of
+    the current snapshot, so the shallow fetch only transfers new objects. The
+    lock is then taken just long enough to publish the result with an atomic
+    rename. If the fetch fails, the current snapshot is used as-is.
+    """
+    import shutil
+    import tempfile
+
+    repos_dir = os.path.join(ARTIFACT_DIR, "repos")
+    name = hashlib.sha256(url.encode()).hexdigest()
+    key = f"git+{url}"
+
+    with artifact_index() as index:
+        current = index.get(key)
+        if current and git_head(current["path"]):
+            lease_artifact(current)  # Keep it from being evicted while copied
+        else:
+            current = None
+
+    os.makedirs(repos_dir, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=f".{name[:16]}-", dir=repos_dir)
+    try:
+        if current:
+            try:
+                run_command(["git", "clone", "--quiet", current["path"], tmp_path])
+                run_command(["git", "-C", tmp_path, "remote", "set-url", "origin", url])
+                run_command(["git", "-C", tmp_path, "fetch", "--depth", "1", "origin"])
+                run_command(["git", "-C", tmp_path, "reset", "--hard", "FETCH_HEAD"])
+            except Exception as e:
+                console.print(
+                    f"[yellow]Could not update snapshot of {url}, reusing it: {e}[/yellow]"
+                )
+                return current["path"]
+        else:
+            run_command(["git", "clone", "--depth", "1", url, tmp_path])
+
+        head = git_head(tmp_path)
+        path = os.path.join(repos_dir, f"{name}-{head}")
+        with artifact_index() as index:
+            if not os.path.isdir(path):
+                os.replace(tmp_path, path)
+
+            # The previous snapshot may still be in use; evict it like any other
+            previous = index.get(key)
+            if previous and previous["path"] != path:
+                index[f"{key}#{previous['sha256']}"] = previous
+
+            now = time.time()
+            index[key] = {
+                "sha256": head,
+                "path": path,
+                "size": _artifact_size(path),
+                "fetched_at": now,
+                "last_used": now,
+            }
+            lease_artifact(index[key])
+            evict_artifacts(index)
+        return path
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def download_nix_installer(dry_run=False):
+    """Fetches the Nix installation script and returns its path."""
+    if dry_run:
         console.print(
-            f"[bold red]Command failed with error code {e.returncode}[/bold red]"
+            f"[bold yellow][DRY RUN][/bold yellow] Would download the Nix installer from {NIX_INSTALLER_URL}"
         )
-        if not dry_run:
-            raise  # Re-raise to handle in the calling function
-        return None
-    except FileNotFoundError as e:
-        console.print(f"[bold red]Command not found: {e}[/bold red]")
-        if not dry_run:
-            raise  # Re-raise to handle in the calling function
         return None
 
+    # Download the Nix installation script
+    console.print("[yellow]Downloading Nix installer...[/yellow]")
+    return fetch_artifact(NIX_INSTALLER_URL, sha256=NIX_INSTALLER_SHA256)
 
-def install_nix(dry_run=False):
+
+def install_nix(dry_run=False, install_script_path=None):
     """Installs Nix package manager."""
     if dry_run:
         console.print(
@@ -114,50 +1085,9 @@ def install_nix(dry_run=False):
 
     if system == "Linux":
         try:
-            # Use a temporary directory in the user's home directory to avoid permission issues
-            temp_dir = os.path.expanduser("~/.dotfiles/tmp")
-            os.makedirs(temp_dir, exist_ok=True)
-            install_script_path = os.path.join(temp_dir, "nix_install.sh")
-
-            # Download the Nix installation script
-            console.print("[yellow]Downloading Nix installer...[/yellow]")
-            try:
-                # Try with curl first (most robust for redirects)
-                run_command(
-                    [
-                        "curl",
-                        "-L",
-                        "-o",
-                        install_script_path,
-                        "https://nixos.org/nix/install",
-                    ],
-                    check=True,
-                )
-            except Exception as curl_error:
-                console.print(
-                    f"[yellow]Curl failed: {curl_error}, trying wget...[/yellow]"
-                )
-                try:
-                    # Try wget as backup
-                    run_command(
-                        [
-                            "wget",
-                            "-O",
-                            install_script_path,
-                            "https://nixos.org/nix/install",
-                        ],
-                        check=True,
-                    )
-                except Exception as wget_error:
-                    # Last resort, try Python's urllib
-                    console.print(
-                        f"[yellow]Wget failed: {wget_error}, using Python...[/yellow]"
-                    )
-                    import urllib.request
-
-                    urllib.request.urlretrieve(
-                        "https://nixos.org/nix/install", install_script_path
-                    )
+            # Reuse an installer that was already fetched by the scheduler
+            if install_script_path is None or not os.path.exists(install_script_path):
+                install_script_path = download_nix_installer()
 
             # Make the script executable
             os.chmod(install_script_path, 0o755)
@@ -184,12 +1114,6 @@ def install_nix(dry_run=False):
             # Add experimental features to nix.conf
             configure_nix_experimental_features()
 
-            # Clean up
-            try:
-                os.remove(install_script_path)
-            except Exception:
-                pass
-
             # Verify Nix is available
             if verify_nix_installation():
                 console.print(
@@ -228,18 +1152,122 @@ def install_nix(dry_run=False):
     )
 
 
+# Variables bash manages itself; they always differ and are never worth caching
+SHELL_VOLATILE_VARS = {"_", "SHLVL", "PWD", "OLDPWD"}
+
+
+def capture_profile_environment(profile_path):
+    """Source a shell profile in bash and return the environment it leaves behind.
+
+    The environment is read with ``env -0`` so values containing newlines
+    survive intact.
+    """
+    result = run_captured(
+        ["bash", "-c", 'source "$1" >/dev/null 2>&1; env -0', "bash", profile_path],
+        check=True,
+    )
+
+    env = {}
+    for entry in result.stdout.split(b"\0"):
+        key, sep, value = entry.partition(b"=")
+        if sep and key:
+            env[os.fsdecode(key)] = os.fsdecode(value)
+    return env
+
+
+def environment_delta(before, after):
+    """Return the variables after sets or changes relative to before.
+
+    Variables that after no longer has map to None.
+    """
+    delta = {
+        key: value
+        for key, value in after.items()
+        if before.get(key) != value and key not in SHELL_VOLATILE_VARS
+    }
+    delta.update(
+        {
+            key: None
+            for key in before
+            if key not in after and key not in SHELL_VOLATILE_VARS
+        }
+    )
+    return delta
+
+
+def apply_environment_delta(delta):
+    """Apply an environment delta to the current process."""
+    for key, value in delta.items():
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = value
+    invalidate_path_index()
+
+
+def _profile_cache_key(profile_path):
+    """Identify a profile by its resolved path and mtime.
+
+    Store paths all share the same mtime, so the resolved path is what changes
+    when nix.sh is upgraded.
+    """
+    real_path = os.path.realpath(profile_path)
+    return f"{real_path}:{os.stat(real_path).st_mtime_ns}"
+
+
+def load_cached_profile_delta(profile_path):
+    """Return the cached environment delta for a profile, if it applies here.
+
+    Returns an empty delta when the current environment already has it applied
+    (e.g. a nested invocation), the delta when the environment matches the one
+    it was captured from, and None when the profile has to be sourced again.
+    """
+    try:
+        with open(NIX_ENV_CACHE, "r") as f:
+            entry = json.load(f).get(_profile_cache_key(profile_path))
+    except (OSError, ValueError):
+        return None
+
+    if not entry:
+        return None
+
+    current = {key: os.environ.get(key) for key in entry["delta"]}
+    if current == entry["delta"]:
+        return {}
+    if current == entry["base"]:
+        return entry["delta"]
+    return None
+
+
+def save_cached_profile_delta(profile_path, before, delta):
+    """Cache the delta a profile applies on top of the environment before."""
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        entry = {
+            "base": {key: before.get(key) for key in delta},
+            "delta": delta,
+        }
+        tmp_path = f"{NIX_ENV_CACHE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({_profile_cache_key(profile_path): entry}, f)
+        os.replace(tmp_path, NIX_ENV_CACHE)
+    except OSError as e:
+        console.print(f"[yellow]Could not cache Nix environment: {e}[/yellow]")
+
+
+NIX_PROFILE_PATHS = [
+    os.path.expanduser("~/.nix-profile/etc/profile.d/nix.sh"),
+    "/etc/profile.d/nix.sh",
+    "/nix/var/nix/profiles/default/etc/profile.d/nix.sh",
+    "/root/.nix-profile/etc/profile.d/nix.sh",  # For root installations
+]
+
+
 def source_nix_profile():
     """Source Nix profile and update environment variables in the current process."""
     # Find and source nix.sh
-    possible_nix_profiles = [
-        os.path.expanduser("~/.nix-profile/etc/profile.d/nix.sh"),
-        "/etc/profile.d/nix.sh",
-        "/nix/var/nix/profiles/default/etc/profile.d/nix.sh",
-        "/root/.nix-profile/etc/profile.d/nix.sh",  # For root installations
-    ]
-
     nix_profile_path = None
-    for profile in possible_nix_profiles:
+    for profile in NIX_PROFILE_PATHS:
         if os.path.exists(profile):
             nix_profile_path = profile
             console.print(f"[green]Found Nix profile at {profile}[/green]")
@@ -248,21 +1276,26 @@ def source_nix_profile():
     if nix_profile_path:
         # Source nix.sh and update environment variables
         console.print(f"[yellow]Sourcing {nix_profile_path}...[/yellow]")
-        source_env = f"source {nix_profile_path} && env"
         try:
-            proc = subprocess.Popen(
-                source_env,
-                stdout=subprocess.PIPE,
-                shell=True,
-                executable="/bin/bash",
-            )
+            delta = load_cached_profile_delta(nix_profile_path)
+            if delta is None:
+                before = dict(os.environ)
+                delta = environment_delta(
+                    before, capture_profile_environment(nix_profile_path)
+                )
+                if delta.get("PATH"):
+                    # nix.sh prepends unconditionally, so drop repeated entries
+                    delta["PATH"] = os.pathsep.join(
+                        dict.fromkeys(filter(None, delta["PATH"].split(os.pathsep)))
+                    )
+                save_cached_profile_delta(nix_profile_path, before, delta)
+            else:
+                console.print(
+                    f"[dim]Using cached environment for {nix_profile_path}[/dim]"
+                )
 
-            # Update current process environment with new variables
-            for line in proc.stdout:
-                line = line.decode().strip()
-                if "=" in line:
-                    key, value = line.split("=", 1)
-                    os.environ[key] = value
+            # Update current process environment with the changed variables only
+            apply_environment_delta(delta)
 
             # Update PATH with nix paths
             if "PATH" in os.environ:
@@ -287,7 +1320,7 @@ def source_nix_profile():
         ]:
             expanded_path = os.path.expanduser(nix_bin)
             if os.path.exists(expanded_path):
-                os.environ["PATH"] = f"{expanded_path}:{os.environ['PATH']}"
+                prepend_to_path(expanded_path)
                 console.print(f"[green]Added {expanded_path} to PATH[/green]")
 
         return False
@@ -307,7 +1340,7 @@ def force_reload_nix_env():
     for path in nix_bin_paths:
         expanded_path = os.path.expanduser(path)
         if os.path.exists(expanded_path):
-            os.environ["PATH"] = f"{expanded_path}:{os.environ['PATH']}"
+            prepend_to_path(expanded_path)
             console.print(f"[dim]Added {expanded_path} to PATH[/dim]")
 
     # Set essential Nix environment variables
@@ -320,7 +1353,7 @@ def force_reload_nix_env():
 
     # Try to use a fallback method by executing nix to check if it's working
     try:
-        subprocess.run(["nix", "--version"], check=True, capture_output=True, text=True)
+        run_captured(["nix", "--version"], check=True, text=True)
         console.print("[green]Nix command is now available![/green]")
         return True
     except Exception:
@@ -337,9 +1370,7 @@ def verify_nix_installation():
     """Verify that Nix is properly installed and available."""
     try:
         # Try to run a simple nix command
-        result = subprocess.run(
-            ["nix", "--version"], check=False, capture_output=True, text=True
-        )
+        result = run_captured(["nix", "--version"], text=True)
 
         if result.returncode == 0:
             console.print(f"[green]Nix verified: {result.stdout.strip()}[/green]")
@@ -437,334 +1468,346 @@ def configure_nix_experimental_features():
         )
 
 
-def install_home_manager_standalone(dry_run=False):
-    """Install Home Manager directly using nix-env to avoid permission issues."""
-    if dry_run:
-        console.print(
-            "[bold yellow][DRY RUN][/bold yellow] Would install Home Manager directly"
-        )
-        return True
+HOME_MANAGER_REPO = "https://github.com/nix-community/home-manager.git"
+NIXPKGS_CHANNEL_URL = "https://nixos.org/channels/nixpkgs-unstable"
+HOME_MANAGER_CHANNEL_URL = (
+    "https://github.com/nix-community/home-manager/archive/master.tar.gz"
+)
+PROBE_TIMEOUT = 10  # Seconds any single pre-flight probe may take
+ROOT_CHANNELS_DIR = "/nix/var/nix/profiles/per-user/root/channels"
+
+
+def _probe_store_writable():
+    """Whether this user can take the Nix big lock (single-user or owned store)."""
+    big_lock = "/nix/var/nix/db/big-lock"
+    return not os.path.exists(big_lock) or os.access(big_lock, os.W_OK)
 
-    console.print("[bold]Installing Home Manager using standalone method...[/bold]")
 
-    # Try the simplest method first - direct install with nix-env
+def _probe_flakes_enabled():
+    """Whether nix-command and flakes are enabled for this user."""
+    if "flakes" in os.environ.get("NIX_CONFIG", ""):
+        return True
     try:
-        console.print("[yellow]Trying nix-env direct installation...[/yellow]")
-        run_command(["nix-env", "-iA", "nixpkgs.home-manager"], check=True)
-        console.print(
-            "[green]Home Manager installed successfully using nix-env![/green]"
+        result = run_captured(
+            ["nix", "--extra-experimental-features", "nix-command", "show-config"],
+            text=True,
+            timeout=PROBE_TIMEOUT,
         )
-        return True
-    except Exception as e:
-        console.print(f"[yellow]nix-env installation failed: {e}[/yellow]")
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition("=")
+        if key.strip() == "experimental-features":
+            return {"nix-command", "flakes"} <= set(value.split())
+    return False
+
 
-    # Try the flake-based approach
+def _probe_channels():
+    """Names of the Nix channels this user has subscribed to."""
+    nix_channel = find_executable("nix-channel")
+    if not nix_channel:
+        return set()
     try:
-        console.print("[yellow]Trying flake-based installation...[/yellow]")
-        run_command(
-            ["nix", "profile", "install", "github:nix-community/home-manager"],
-            check=True,
+        result = run_captured(
+            [nix_channel, "--list"],
+            text=True,
+            timeout=PROBE_TIMEOUT,
         )
-        console.print(
-            "[green]Home Manager installed successfully using flakes![/green]"
+    except (OSError, subprocess.TimeoutExpired):
+        return set()
+    return {line.split()[0] for line in result.stdout.splitlines() if line.strip()}
+
+
+def _probe_nixpkgs_path():
+    """Where ``<nixpkgs>`` resolves from other than the user's own channels.
+
+    Checks root's channels, then NIX_PATH, then asks Nix itself, which also
+    covers a ``nix-path`` setting pointing at the flake registry. Returns a
+    short description of the source, or None when nixpkgs cannot be found.
+    """
+    if os.path.exists(os.path.join(ROOT_CHANNELS_DIR, "nixpkgs")):
+        return "root channel"
+    for entry in os.environ.get("NIX_PATH", "").split(":"):
+        name, _, path = entry.partition("=")
+        if (path and name == "nixpkgs") or (
+            not path and os.path.exists(os.path.join(name, "nixpkgs"))
+        ):
+            return "NIX_PATH"
+    nix_instantiate = find_executable("nix-instantiate")
+    if not nix_instantiate:
+        return None
+    try:
+        result = run_captured(
+            [nix_instantiate, "--find-file", "nixpkgs"],
+            text=True,
+            timeout=PROBE_TIMEOUT,
         )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return "nix-path" if result.returncode == 0 else None
 
-        # Add NIX_PATH to shell config
-        try:
-            shell_rc = None
-            if os.path.exists(os.path.expanduser("~/.zshrc")):
-                shell_rc = os.path.expanduser("~/.zshrc")
-            elif os.path.exists(os.path.expanduser("~/.bashrc")):
-                shell_rc = os.path.expanduser("~/.bashrc")
-
-            if shell_rc:
-                with open(shell_rc, "a") as f:
-                    f.write(
-                        "\n# Added by dotfiles installer\nexport NIX_PATH=$HOME/.nix-defexpr/channels:/nix/var/nix/profiles/per-user/root/channels${NIX_PATH:+:$NIX_PATH}\n"
-                    )
-                console.print(f"[green]Added NIX_PATH to {shell_rc}[/green]")
-        except Exception as e:
-            console.print(f"[yellow]Could not update shell configuration: {e}[/yellow]")
 
-        return True
-    except Exception as e:
-        console.print(f"[yellow]Flake-based installation failed: {e}[/yellow]")
+def _probe_reachable(url):
+    """Whether an HTTP HEAD request to url succeeds quickly."""
+    import urllib.request
 
-    # Try installing directly from GitHub without channels
+    request = urllib.request.Request(url, method="HEAD")
     try:
-        console.print("[yellow]Trying direct installation from GitHub...[/yellow]")
-        tmp_dir = os.path.expanduser("~/.dotfiles/tmp")
-        os.makedirs(tmp_dir, exist_ok=True)
+        with urllib.request.urlopen(request, timeout=PROBE_TIMEOUT) as response:
+            return response.status < 400
+    except Exception:
+        return False
 
-        # Clone the repository
-        repo_path = os.path.join(tmp_dir, "home-manager")
-        if os.path.exists(repo_path):
-            console.print(
-                "[yellow]Removing existing home-manager directory...[/yellow]"
-            )
-            import shutil
 
-            shutil.rmtree(repo_path)
+def probe_home_manager_environment():
+    """Check everything the Home Manager install methods depend on, concurrently."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    probes = {
+        "store_writable": _probe_store_writable,
+        "daemon": lambda: os.path.exists("/nix/var/nix/daemon-socket/socket"),
+        "flakes": _probe_flakes_enabled,
+        "channels": _probe_channels,
+        "nixpkgs_path": _probe_nixpkgs_path,
+        "nixpkgs_reachable": lambda: _probe_reachable(NIXPKGS_CHANNEL_URL),
+        "github_reachable": lambda: _probe_reachable("https://github.com"),
+        "nix_env": lambda: find_executable("nix-env") is not None,
+        "nix_shell": lambda: find_executable("nix-shell") is not None,
+        "nix_channel": lambda: find_executable("nix-channel") is not None,
+    }
+    with ThreadPoolExecutor(max_workers=len(probes)) as executor:
+        futures = {
+            name: executor.submit(in_current_phase(probe))
+            for name, probe in probes.items()
+        }
+    return {name: future.result() for name, future in futures.items()}
+
+
+def plan_home_manager_install(probes, methods=None):
+    """Rank the Home Manager install methods by how likely they are to succeed.
+
+    Returns ``(method, viable, reason)`` tuples, most promising first.
+    """
+    nixpkgs = (
+        "user channel" if "nixpkgs" in probes["channels"] else probes["nixpkgs_path"]
+    )
+    has_nixpkgs = nixpkgs is not None
+    # A multi-user install goes through the daemon, so the lock itself is moot
+    writable = probes["store_writable"] or probes["daemon"]
+    github = probes["github_reachable"]
+
+    # method: (viable, why it should work, what it is missing)
+    candidates = {
+        "nix-env": (
+            probes["nix_env"] and has_nixpkgs and writable,
+            f"nix-env found, nixpkgs from {nixpkgs} and store writable",
+            "needs nix-env, nixpkgs (channel or NIX_PATH) and a writable store",
+        ),
+        "flake": (
+            probes["flakes"] and github and writable,
+            "flakes enabled and GitHub reachable",
+            "needs flakes enabled, GitHub access and a writable store",
+        ),
+        "github": (
+            probes["nix_shell"] and has_nixpkgs and github,
+            f"nix-shell found, nixpkgs from {nixpkgs} and GitHub reachable",
+            "needs nix-shell, nixpkgs (channel or NIX_PATH) and GitHub access",
+        ),
+        "channel": (
+            probes["nix_channel"] and probes["nixpkgs_reachable"] and github,
+            "nix-channel found and channel URLs reachable"
+            + (
+                ""
+                if probes["store_writable"]
+                else " (single-user channels, lock not writable)"
+            ),
+            "needs nix-channel and access to nixos.org and GitHub",
+        ),
+    }
+    # Ties keep this order: cheapest and most reliable methods first
+    order = ["nix-env", "flake", "github", "channel"]
+    plan = [
+        (method, viable, reason if viable else missing)
+        for method in order
+        if methods is None or method in methods
+        for viable, reason, missing in [candidates[method]]
+    ]
+    return sorted(plan, key=lambda item: not item[1])
 
-        run_command(
-            [
-                "git",
-                "clone",
-                "https://github.com/nix-community/home-manager.git",
-                repo_path,
-            ],
-            check=True,
-        )
 
-        # Run the install script
-        run_command(["nix-shell", "-A", "install", repo_path], check=True)
-        console.print("[green]Home Manager installed successfully from GitHub![/green]")
-        return True
-    except Exception as e:
-        console.print(f"[yellow]Direct GitHub installation failed: {e}[/yellow]")
+def print_home_manager_plan(plan):
+    """Show the chosen Home Manager install order and why."""
+    from rich.table import Table
 
-    return False
+    table = Table(show_header=True, title="Home Manager Install Plan")
+    table.add_column("#", justify="right", style="cyan", no_wrap=True)
+    table.add_column("Method", style="magenta")
+    table.add_column("Viable", justify="center")
+    table.add_column("Reason")
+    for idx, (method, viable, reason) in enumerate(plan, 1):
+        table.add_row(
+            str(idx), method, "[green]yes[/green]" if viable else "[red]no[/red]", reason
+        )
+    console.print(table)
 
 
-def install_home_manager(dry_run=False):
-    """Installs Home Manager."""
-    if dry_run:
-        console.print("[bold yellow][DRY RUN][/bold yellow] Would install Home Manager")
-        return
+def _append_nix_path_to_shell_rc():
+    """Add NIX_PATH to the user's shell config for flake-installed Home Manager."""
+    try:
+        shell_rc = None
+        if os.path.exists(os.path.expanduser("~/.zshrc")):
+            shell_rc = os.path.expanduser("~/.zshrc")
+        elif os.path.exists(os.path.expanduser("~/.bashrc")):
+            shell_rc = os.path.expanduser("~/.bashrc")
+
+        if shell_rc:
+            with open(shell_rc, "a") as f:
+                f.write(
+                    "\n# Added by dotfiles installer\nexport NIX_PATH=$HOME/.nix-defexpr/channels:/nix/var/nix/profiles/per-user/root/channels${NIX_PATH:+:$NIX_PATH}\n"
+                )
+            console.print(f"[green]Added NIX_PATH to {shell_rc}[/green]")
+    except Exception as e:
+        console.print(f"[yellow]Could not update shell configuration: {e}[/yellow]")
 
-    console.print("[bold]Installing Home Manager...[/bold]")
 
-    # First try standalone installation which is more likely to work with permission issues
-    if install_home_manager_standalone(dry_run):
-        console.print(
-            "[green]Home Manager installation completed successfully.[/green]"
-        )
-        return
+def _install_home_manager_nix_env(probes):
+    """Install Home Manager from nixpkgs with nix-env."""
+    if "nixpkgs" in probes["channels"]:
+        run_command(["nix-env", "-iA", "nixpkgs.home-manager"], check=True)
+    else:
+        # Root's channel, NIX_PATH or the registry are only reachable as <nixpkgs>
+        run_command(["nix-env", "-f", "<nixpkgs>", "-iA", "home-manager"], check=True)
 
-    # If standalone fails, try the traditional channel-based approach
-    try:
-        # Try to find nix-channel command
-        nix_channel_path = None
-        for path in os.environ["PATH"].split(":"):
-            if os.path.exists(os.path.join(path, "nix-channel")):
-                nix_channel_path = os.path.join(path, "nix-channel")
-                break
 
-        # ...existing code...
+def _install_home_manager_flake(probes):
+    """Install Home Manager into the user profile from its flake."""
+    run_command(
+        ["nix", "profile", "install", "github:nix-community/home-manager"],
+        check=True,
+    )
+    _append_nix_path_to_shell_rc()
 
-        # Standard installation with nix-channel
-        try:
-            # Check for potential permission issues with Nix lock file
-            if os.path.exists("/nix/var/nix/db/big-lock") and not os.access(
-                "/nix/var/nix/db/big-lock", os.W_OK
-            ):
-                console.print(
-                    "[yellow]Detected permission issues with Nix lock files.[/yellow]"
-                )
-                console.print(
-                    "[yellow]Trying single-user approach with separate commands...[/yellow]"
-                )
 
-                # Use single-user specific channels with environment variables
-                env = os.environ.copy()
-                env["NIX_USER_CHANNEL_ROOT"] = os.path.expanduser("~/.nix-channels")
+def _install_home_manager_github(probes):
+    """Run Home Manager's installer from a checkout of its repository."""
+    # Reuse (and refresh) the cached checkout instead of cloning again
+    repo_path = fetch_git_snapshot(HOME_MANAGER_REPO)
+    run_command(["nix-shell", "-A", "install", repo_path], check=True)
 
-                # Add channels separately and ensure each completes before continuing
-                console.print("[yellow]Adding nixpkgs channel...[/yellow]")
-                result = subprocess.run(
-                    [
-                        nix_channel_path,
-                        "--add",
-                        "https://nixos.org/channels/nixpkgs-unstable",
-                        "nixpkgs",
-                    ],
-                    env=env,
-                    check=False,
-                    capture_output=True,
-                    text=True,
-                )
-                if result.returncode != 0:
-                    console.print(
-                        f"[red]Failed to add nixpkgs channel: {result.stderr}[/red]"
-                    )
-                    raise Exception("Failed to add nixpkgs channel")
 
-                console.print("[yellow]Adding home-manager channel...[/yellow]")
-                result = subprocess.run(
-                    [
-                        nix_channel_path,
-                        "--add",
-                        "https://github.com/nix-community/home-manager/archive/master.tar.gz",
-                        "home-manager",
-                    ],
-                    env=env,
-                    check=False,
-                    capture_output=True,
-                    text=True,
-                )
-                if result.returncode != 0:
-                    console.print(
-                        f"[red]Failed to add home-manager channel: {result.stderr}[/red]"
-                    )
-                    raise Exception("Failed to add home-manager channel")
-
-                console.print("[yellow]Updating channels...[/yellow]")
-                result = subprocess.run(
-                    [nix_channel_path, "--update"],
-                    env=env,
-                    check=False,
-                    capture_output=True,
-                    text=True,
-                )
-                if result.returncode != 0:
-                    console.print(
-                        f"[red]Failed to update channels: {result.stderr}[/red]"
-                    )
-                    raise Exception("Failed to update channels")
-            else:
-                # Standard approach - but run commands separately to ensure completion
-                result = subprocess.run(
-                    [
-                        nix_channel_path,
-                        "--add",
-                        "https://nixos.org/channels/nixpkgs-unstable",
-                        "nixpkgs",
-                    ],
-                    check=False,
-                    capture_output=True,
-                    text=True,
-                )
-                if result.returncode != 0:
-                    console.print(
-                        f"[red]Failed to add nixpkgs channel: {result.stderr}[/red]"
-                    )
+def _install_home_manager_channel(probes):
+    """Subscribe to the nixpkgs and home-manager channels and run the installer."""
+    nix_channel = find_executable("nix-channel")
+    if not nix_channel:
+        raise Exception("nix-channel not found")
+    env = None
+    if not probes["store_writable"]:
+        # Use single-user specific channels with environment variables
+        console.print(
+            "[yellow]Detected permission issues with Nix lock files, using single-user channels...[/yellow]"
+        )
+        env = os.environ.copy()
+        env["NIX_USER_CHANNEL_ROOT"] = os.path.expanduser("~/.nix-channels")
 
-                result = subprocess.run(
-                    [
-                        nix_channel_path,
-                        "--add",
-                        "https://github.com/nix-community/home-manager/archive/master.tar.gz",
-                        "home-manager",
-                    ],
-                    check=False,
-                    capture_output=True,
-                    text=True,
-                )
-                if result.returncode != 0:
-                    console.print(
-                        f"[red]Failed to add home-manager channel: {result.stderr}[/red]"
-                    )
+    run_command([nix_channel, "--add", NIXPKGS_CHANNEL_URL, "nixpkgs"], env=env)
+    run_command(
+        [nix_channel, "--add", HOME_MANAGER_CHANNEL_URL, "home-manager"], env=env
+    )
+    try:
+        run_command([nix_channel, "--update"], env=env)
+    except subprocess.CalledProcessError as e:
+        if env is not None or "Permission denied" not in (e.output or ""):
+            raise
+        console.print("[yellow]Permission denied, trying with sudo...[/yellow]")
+        run_command(["sudo", nix_channel, "--update"])
 
-                result = subprocess.run(
-                    [nix_channel_path, "--update"],
-                    check=False,
-                    capture_output=True,
-                    text=True,
-                )
-                if result.returncode != 0:
-                    console.print(
-                        f"[red]Failed to update channels: {result.stderr}[/red]"
-                    )
+    nix_shell_cmd = find_executable("nix-shell") or "nix-shell"
+    run_command([nix_shell_cmd, "<home-manager>", "-A", "install"], env=env)
 
-                    # If we failed to update, try with sudo
-                    if "Permission denied" in result.stderr:
-                        console.print(
-                            "[yellow]Permission denied, trying with sudo...[/yellow]"
-                        )
-                        try:
-                            sudo_result = subprocess.run(
-                                ["sudo", nix_channel_path, "--update"],
-                                check=False,
-                                capture_output=True,
-                                text=True,
-                            )
-                            if sudo_result.returncode != 0:
-                                console.print(
-                                    f"[red]Sudo update failed: {sudo_result.stderr}[/red]"
-                                )
-                                raise Exception("Failed to update channels with sudo")
-                        except Exception:
-                            # Fall back to standalone installation
-                            console.print(
-                                "[yellow]Channel update failed, falling back to standalone installation...[/yellow]"
-                            )
-                            if install_home_manager_standalone(dry_run):
-                                return
-                            raise Exception(
-                                "All home manager installation methods failed"
-                            )
 
-        except Exception as e:
-            if "Permission denied" in str(e):
-                console.print(
-                    "[yellow]Permission denied when updating channels.[/yellow]"
-                )
-                # Try the standalone installation as our best alternative
-                if install_home_manager_standalone(dry_run):
-                    return
+HOME_MANAGER_INSTALLERS = {
+    "nix-env": _install_home_manager_nix_env,
+    "flake": _install_home_manager_flake,
+    "github": _install_home_manager_github,
+    "channel": _install_home_manager_channel,
+}
 
-            # If we get here, no installation method worked
-            raise Exception(f"Home Manager installation failed: {e}")
 
-        # Find nix-shell and run the installer
-        nix_shell_cmd = "nix-shell"
-        for path in os.environ["PATH"].split(":"):
-            if os.path.exists(os.path.join(path, "nix-shell")):
-                nix_shell_cmd = os.path.join(path, "nix-shell")
-                break
+def run_home_manager_plan(methods=None):
+    """Probe the environment, then try each Home Manager method once, best first.
+
+    Methods the probes rule out are only attempted when no method looks viable.
+    Returns True when one of them succeeded.
+    """
+    console.print("[yellow]Checking how Home Manager can be installed...[/yellow]")
+    probes = probe_home_manager_environment()
+    plan = plan_home_manager_install(probes, methods=methods)
+    print_home_manager_plan(plan)
 
+    viable = [item for item in plan if item[1]] or plan
+    for method, _, reason in viable:
+        console.print(f"[yellow]Trying {method} installation ({reason})...[/yellow]")
         try:
-            console.print("[yellow]Running home-manager installation...[/yellow]")
-            result = subprocess.run(
-                [nix_shell_cmd, "<home-manager>", "-A", "install"],
-                check=False,
-                capture_output=True,
-                text=True,
+            HOME_MANAGER_INSTALLERS[method](probes)
+            console.print(
+                f"[green]Home Manager installed successfully using {method}![/green]"
             )
-
-            if result.returncode != 0:
-                console.print(
-                    f"[red]Home Manager installation failed: {result.stderr}[/red]"
-                )
-                raise Exception("Home Manager installation failed")
-
-            console.print("[green]Home Manager installed successfully![/green]")
+            return True
         except Exception as e:
-            console.print(f"[yellow]Error during installation: {e}[/yellow]")
-            console.print("[yellow]Trying direct installation...[/yellow]")
+            console.print(f"[yellow]{method} installation failed: {e}[/yellow]")
 
-            # Try standalone installation as a last resort
-            if install_home_manager_standalone(dry_run):
-                return
+    return False
 
-            # If we get here, nothing worked
-            raise Exception("All Home Manager installation methods failed")
 
-    except Exception as e:
-        console.print(f"[bold red]Error installing Home Manager: {e}[/bold red]")
+def install_home_manager_standalone(dry_run=False):
+    """Install Home Manager without channels to avoid permission issues."""
+    if dry_run:
         console.print(
-            "[yellow]Please try installing Home Manager manually using one of these methods:[/yellow]"
+            "[bold yellow][DRY RUN][/bold yellow] Would install Home Manager directly"
         )
-        console.print("\n[bold]Method 1: Direct installation with nix-env[/bold]")
-        console.print("Run: nix-env -iA nixpkgs.home-manager")
+        return True
 
-        console.print("\n[bold]Method 2: Flake-based installation[/bold]")
-        console.print("Run: nix profile install github:nix-community/home-manager")
-        console.print("Then add to your shell config file:")
-        console.print(
-            "export NIX_PATH=$HOME/.nix-defexpr/channels:/nix/var/nix/profiles/per-user/root/channels${NIX_PATH:+:$NIX_PATH}"
-        )
+    console.print("[bold]Installing Home Manager using standalone method...[/bold]")
+    return run_home_manager_plan(methods=["nix-env", "flake", "github"])
 
-        console.print("\n[bold]Method 3: Traditional channel-based installation[/bold]")
-        console.print(
-            "1. Run: nix-channel --add https://nixos.org/channels/nixpkgs-unstable nixpkgs"
-        )
+
+def install_home_manager(dry_run=False):
+    """Installs Home Manager."""
+    if dry_run:
+        console.print("[bold yellow][DRY RUN][/bold yellow] Would install Home Manager")
+        return
+
+    console.print("[bold]Installing Home Manager...[/bold]")
+    if run_home_manager_plan():
         console.print(
-            "2. Run: nix-channel --add https://github.com/nix-community/home-manager/archive/master.tar.gz home-manager"
+            "[green]Home Manager installation completed successfully.[/green]"
         )
-        console.print("3. Run: nix-channel --update")
-        console.print("4. Run: nix-shell '<home-manager>' -A install")
-        sys.exit(1)
+        return
+
+    console.print("[bold red]Error installing Home Manager: all methods failed[/bold red]")
+    console.print(
+        "[yellow]Please try installing Home Manager manually using one of these methods:[/yellow]"
+    )
+    console.print("\n[bold]Method 1: Direct installation with nix-env[/bold]")
+    console.print("Run: nix-env -iA nixpkgs.home-manager")
+
+    console.print("\n[bold]Method 2: Flake-based installation[/bold]")
+    console.print("Run: nix profile install github:nix-community/home-manager")
+    console.print("Then add to your shell config file:")
+    console.print(
+        "export NIX_PATH=$HOME/.nix-defexpr/channels:/nix/var/nix/profiles/per-user/root/channels${NIX_PATH:+:$NIX_PATH}"
+    )
+
+    console.print("\n[bold]Method 3: Traditional channel-based installation[/bold]")
+    console.print(
+        "1. Run: nix-channel --add https://nixos.org/channels/nixpkgs-unstable nixpkgs"
+    )
+    console.print(
+        "2. Run: nix-channel --add https://github.com/nix-community/home-manager/archive/master.tar.gz home-manager"
+    )
+    console.print("3. Run: nix-channel --update")
+    console.print("4. Run: nix-shell '<home-manager>' -A install")
+    sys.exit(1)
 
 
 def clone_dotfiles(dry_run=False):
@@ -779,7 +1822,21 @@ def clone_dotfiles(dry_run=False):
         console.print("[bold]Cloning dotfiles repository...[/bold]")
         os.makedirs(os.path.dirname(DOTFILES_DIR), exist_ok=True)
         try:
-            run_command(["git", "clone", "--depth", "1", REPO_URL, DOTFILES_DIR])
+            try:
+                # Clone from the local snapshot so side-by-side installs share it
+                snapshot = fetch_git_snapshot(REPO_URL)
+                run_command(["git", "clone", snapshot, DOTFILES_DIR])
+                run_command(
+                    ["git", "-C", DOTFILES_DIR, "remote", "set-url", "origin", REPO_URL]
+                )
+            except Exception as e:
+                console.print(
+                    f"[yellow]Could not clone from the artifact store: {e}[/yellow]"
+                )
+                import shutil
+
+                shutil.rmtree(DOTFILES_DIR, ignore_errors=True)
+                run_command(["git", "clone", "--depth", "1", REPO_URL, DOTFILES_DIR])
         except Exception as e:
             console.print(f"[bold red]Error cloning dotfiles: {e}[/bold red]")
             sys.exit(1)
@@ -787,13 +1844,30 @@ def clone_dotfiles(dry_run=False):
         console.print("[bold]Dotfiles repository already exists.[/bold]")
 
 
-def customize_dotfiles(dry_run=False, force_customize=False):
-    """Customize dotfiles for the current user if not the default user."""
+def git_head(repo_dir):
+    """Return the commit checked out in a repository, or None if unavailable."""
+    try:
+        result = run_captured(
+            ["git", "-C", repo_dir, "rev-parse", "HEAD"],
+            text=True,
+        )
+        return result.stdout.strip() if result.returncode == 0 else None
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return None
+
+
+def prompt_customization(force_customize=False):
+    """Ask whether to customize the dotfiles and collect user information.
+
+    Returns True when the customization should be applied.
+    """
+    from rich.prompt import Confirm
+
     if CURRENT_USER == DEFAULT_USER and not force_customize:
         console.print(
             "[green]Running as the default user, no customization needed.[/green]"
         )
-        return
+        return False
 
     if not force_customize:
         console.print(
@@ -810,21 +1884,188 @@ def customize_dotfiles(dry_run=False, force_customize=False):
         "Would you like to customize the dotfiles for your user?", default=True
     ):
         collect_user_info()
+        return True
 
-        # Apply the customizations, respecting dry run mode
-        replace_username_in_files(dry_run=dry_run)
-        update_git_config(dry_run=dry_run)
+    return False
 
-        if dry_run:
-            console.print(
-                "[bold yellow][DRY RUN][/bold yellow] Customization would be applied with these settings"
+
+def apply_customization(dry_run=False):
+    """Apply the collected user information to the cloned dotfiles."""
+    # Apply the customizations, respecting dry run mode
+    replace_username_in_files(dry_run=dry_run)
+    update_git_config(dry_run=dry_run)
+
+    if dry_run:
+        console.print(
+            "[bold yellow][DRY RUN][/bold yellow] Customization would be applied with these settings"
+        )
+    else:
+        console.print("[green]Customization complete![/green]")
+
+
+def customize_dotfiles(dry_run=False, force_customize=False):
+    """Customize dotfiles for the current user if not the default user."""
+    if prompt_customization(force_customize=force_customize):
+        apply_customization(dry_run=dry_run)
+
+
+# Answer file schema: top-level keys and the keys of its [signing] table
+ANSWER_FILE_KEYS = {
+    "username": str,
+    "git_name": str,
+    "git_email": str,
+    "onepassword_disable": bool,
+    "signing": dict,
+}
+SIGNING_ANSWER_KEYS = {
+    "method": str,  # "gpg", "ssh" or "none"
+    "key": str,  # Existing GPG key ID, SSH key path or key:: literal
+    "create": bool,  # Generate a new key instead
+    "algorithm": str,
+    "overwrite": bool,  # Replace an existing SSH key file instead of reusing it
+    "upload": bool,  # Add the key to the GitHub account
+}
+NON_INTERACTIVE = False  # Set when answers come from --config; nothing may prompt
+
+
+def load_answer_file(path):
+    """Read and validate a TOML answer file for unattended installs.
+
+    Every problem is collected, not just the first, so a broken file can be
+    fixed in one go. Returns the answers and a list of error messages.
+    """
+    import tomllib
+
+    try:
+        with open(path, "rb") as f:
+            answers = tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        return {}, [f"Could not read {path}: {e}"]
+
+    errors = []
+    for table, schema, prefix in (
+        (answers, ANSWER_FILE_KEYS, ""),
+        (answers.get("signing", {}), SIGNING_ANSWER_KEYS, "signing."),
+    ):
+        if not isinstance(table, dict):
+            continue
+        for key, value in table.items():
+            if key not in schema:
+                errors.append(f"Unknown setting '{prefix}{key}'")
+            elif not isinstance(value, schema[key]):
+                errors.append(
+                    f"'{prefix}{key}' must be a {schema[key].__name__}, got {value!r}"
+                )
+    if errors:
+        return answers, errors
+
+    # Same rule as the interactive prompt: any name, as long as there is one
+    username = answers.get("username", CURRENT_USER)
+    if not username.strip():
+        errors.append(f"'username' must not be empty, got {username!r}")
+    if answers.get("git_email") and "@" not in answers["git_email"]:
+        errors.append(f"'git_email' is not an email address: {answers['git_email']!r}")
+
+    signing = answers.get("signing", {})
+    method = signing.get("method", "none")
+    if method not in ("gpg", "ssh", "none"):
+        errors.append(f"'signing.method' must be gpg, ssh or none, got {method!r}")
+    elif method != "none":
+        algorithms = GPG_KEY_ALGORITHMS if method == "gpg" else SSH_KEY_ALGORITHMS
+        if signing.get("create") == ("key" in signing):
+            errors.append(
+                "Set exactly one of 'signing.key' and 'signing.create = true'"
+            )
+        elif signing.get("create"):
+            if signing.get("algorithm", "ed25519") not in algorithms:
+                errors.append(
+                    f"'signing.algorithm' must be one of {', '.join(algorithms)}"
+                )
+            if method == "gpg" and not (
+                answers.get("git_name") and answers.get("git_email")
+            ):
+                errors.append("Creating a GPG key needs 'git_name' and 'git_email'")
+        elif method == "ssh" and ssh_public_key(signing["key"]) is None:
+            errors.append(f"SSH public key not found for '{signing['key']}'")
+        elif method == "gpg":
+            try:
+                keyring = gpg_keyring()
+            except (OSError, subprocess.TimeoutExpired) as e:
+                errors.append(f"Could not list GPG keys to check 'signing.key': {e}")
+            else:
+                if not any(
+                    signing["key"].upper() in (key["key_id"], key["fingerprint"])
+                    for key in keyring
+                ):
+                    errors.append(f"GPG key '{signing['key']}' is not in the keyring")
+
+    return answers, errors
+
+
+def configure_from_answers(answers):
+    """Fill in USER_CONFIG from a validated answer file, without prompting."""
+    for key in ("username", "git_name", "git_email", "onepassword_disable"):
+        if key in answers:
+            USER_CONFIG[key] = answers[key]
+
+    signing = answers.get("signing", {})
+    method = signing.get("method", "none")
+    USER_CONFIG["use_signing_key"] = method != "none"
+    if method == "none":
+        return
+    USER_CONFIG["signing_method"] = method
+
+    key_type = "gpg" if method == "gpg" else "ssh-signing"
+    if signing.get("create"):
+        algorithm = signing.get("algorithm", "ed25519")
+        if method == "ssh":
+            key_path = ssh_signing_key_path(algorithm)
+            overwrite = signing.get("overwrite", False)
+            if os.path.exists(key_path) and not overwrite:
+                console.print(
+                    f"[green]Reusing existing SSH key: {key_path} "
+                    "(set signing.overwrite = true to replace it)[/green]"
+                )
+                USER_CONFIG["git_signing_key"] = key_path
+                if signing.get("upload"):
+                    add_key_to_github(key_type, key_path)
+                return
+        console.print(
+            f"[bold]Creating new {method.upper()} key in the background...[/bold]"
+        )
+        if method == "gpg":
+            future = start_key_generation(
+                create_gpg_key,
+                USER_CONFIG["git_name"],
+                USER_CONFIG["git_email"],
+                algorithm,
             )
         else:
-            console.print("[green]Customization complete![/green]")
+            future = start_key_generation(
+                create_ssh_key, USER_CONFIG["git_email"], algorithm, overwrite
+            )
+        PENDING_SIGNING_KEY.update(
+            future=future,
+            key_type=key_type,
+            algorithm=algorithm,
+            upload=signing.get("upload", False),
+        )
+        return
+
+    key = signing["key"]
+    if method == "ssh" and not key.startswith("key::"):
+        key = os.path.expanduser(key)
+    USER_CONFIG["git_signing_key"] = key
+    console.print(f"[green]Using {method.upper()} key: {key}[/green]")
+    if signing.get("upload"):
+        add_key_to_github(key_type, key)
 
 
 def collect_user_info():
     """Collect user information for customization."""
+    from rich.panel import Panel
+    from rich.prompt import Confirm, Prompt
+
     console.print("[bold]Collecting user information for customization...[/bold]")
     console.print("")  # Add empty line for better readability
 
@@ -838,12 +2079,6 @@ def collect_user_info():
     sys.stdout.flush()
     USER_CONFIG["git_email"] = Prompt.ask("Your email (for Git config)", default="")
 
-    # OnePassword settings
-    sys.stdout.flush()
-    USER_CONFIG["onepassword_disable"] = Confirm.ask(
-        "Do you want to disable 1Password integration?", default=True
-    )
-
     # Signing key options
     sys.stdout.flush()
     use_signing_key = Confirm.ask("Would you like to use commit signing?", default=True)
@@ -870,17 +2105,105 @@ def collect_user_info():
             "Select a signing method [1-2]", default="2", choices=["1", "2"]
         )
 
-        signing_method = signing_methods[signing_choice]
-        USER_CONFIG["signing_method"] = signing_method.lower()
-
-        if signing_method == "GPG":
-            gpg_key_options(USER_CONFIG)
-        else:  # SSH
-            ssh_key_options(USER_CONFIG)
+        signing_method = signing_methods[signing_choice]
+        USER_CONFIG["signing_method"] = signing_method.lower()
+
+        if signing_method == "GPG":
+            gpg_key_options(USER_CONFIG)
+        else:  # SSH
+            ssh_key_options(USER_CONFIG)
+
+    # Asked last so a new signing key can be generating in the meantime
+    sys.stdout.flush()
+    USER_CONFIG["onepassword_disable"] = Confirm.ask(
+        "Do you want to disable 1Password integration?", default=True
+    )
+
+
+# Batch parameters for new GPG keys; ed25519 signs and cv25519 encrypts
+GPG_KEY_ALGORITHMS = {
+    "ed25519": [
+        "Key-Type: EDDSA",
+        "Key-Curve: Ed25519",
+        "Subkey-Type: ECDH",
+        "Subkey-Curve: Curve25519",  # cv25519, named so gpg 2.2 accepts it
+    ],
+    "rsa4096": [
+        "Key-Type: RSA",
+        "Key-Length: 4096",
+        "Subkey-Type: RSA",
+        "Subkey-Length: 4096",
+    ],
+}
+SSH_KEY_ALGORITHMS = {
+    "ed25519": ["-t", "ed25519"],
+    "ecdsa": ["-t", "ecdsa", "-b", "521"],
+    "rsa4096": ["-t", "rsa", "-b", "4096"],
+}
+# Signing key being generated in the background: future, key_type and upload
+PENDING_SIGNING_KEY = {}
+
+
+def start_key_generation(create_key, *args):
+    """Generate a key on a background thread and return a Future for its ID or path."""
+    import concurrent.futures
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix="keygen"
+    )
+    future = executor.submit(in_current_phase(create_key), *args)
+    executor.shutdown(wait=False)
+    return future
+
+
+def wait_for_signing_key():
+    """Wait for a background signing key, then record it and upload it if asked to.
+
+    Returns the key type, algorithm and key ID or path of the new key, or None
+    when no key was being generated or generation failed.
+    """
+    from rich.prompt import Prompt
+
+    if not PENDING_SIGNING_KEY:
+        return None
+
+    job = dict(PENDING_SIGNING_KEY)
+    PENDING_SIGNING_KEY.clear()
+    label = "GPG" if job["key_type"] == "gpg" else "SSH"
+    with console.status(f"[bold green]Waiting for the new {label} key..."):
+        key = job["future"].result()
+
+    if not key:
+        console.print(
+            f"[yellow]{label} key creation failed or was cancelled.[/yellow]"
+        )
+        if NON_INTERACTIVE:
+            console.print("[yellow]Continuing without commit signing.[/yellow]")
+            USER_CONFIG["use_signing_key"] = False
+            return None
+
+        sys.stdout.flush()
+        USER_CONFIG["git_signing_key"] = (
+            Prompt.ask("Enter your GPG key ID manually", default="")
+            if job["key_type"] == "gpg"
+            else Prompt.ask(
+                "Enter your SSH key path manually", default="~/.ssh/id_ed25519"
+            )
+        )
+        return None
+
+    USER_CONFIG["git_signing_key"] = key
+    console.print(f"[green]Created {label} key: {key}[/green]")
+    if job["upload"]:
+        add_key_to_github(job["key_type"], key)
+    return {"key_type": job["key_type"], "algorithm": job["algorithm"], "key": key}
 
 
 def gpg_key_options(config):
     """Handle GPG key options for Git commit signing."""
+    from rich.prompt import Confirm, Prompt
+    from rich.table import Table
+
     existing_gpg_keys = list_gpg_keys()
 
     if existing_gpg_keys:
@@ -921,23 +2244,22 @@ def gpg_key_options(config):
     # Create a new GPG key if desired
     sys.stdout.flush()
     if Confirm.ask("Would you like to create a new GPG key?", default=True):
-        console.print("[bold]Creating new GPG key...[/bold]")
-        key_id = create_gpg_key(config["git_name"], config["git_email"])
-
-        if key_id:
-            config["git_signing_key"] = key_id
-            console.print(f"[green]Created GPG key: {key_id}[/green]")
+        algorithm = Prompt.ask(
+            "Key algorithm", default="ed25519", choices=list(GPG_KEY_ALGORITHMS)
+        )
+        console.print("[bold]Creating new GPG key in the background...[/bold]")
+        future = start_key_generation(
+            create_gpg_key, config["git_name"], config["git_email"], algorithm
+        )
 
-            # Changed default to True for newly created keys
-            if Confirm.ask(
-                "Would you like to add this key to your GitHub account?", default=True
-            ):
-                add_key_to_github("gpg", key_id)
-        else:
-            console.print("[yellow]GPG key creation failed or was cancelled.[/yellow]")
-            config["git_signing_key"] = Prompt.ask(
-                "Enter your GPG key ID manually", default=""
-            )
+        # Changed default to True for newly created keys
+        sys.stdout.flush()
+        upload = Confirm.ask(
+            "Would you like to add this key to your GitHub account?", default=True
+        )
+        PENDING_SIGNING_KEY.update(
+            future=future, key_type="gpg", algorithm=algorithm, upload=upload
+        )
     else:
         config["git_signing_key"] = Prompt.ask(
             "Enter your GPG key ID manually", default=""
@@ -946,17 +2268,31 @@ def gpg_key_options(config):
 
 def ssh_key_options(config):
     """Handle SSH key options for Git commit signing."""
-    existing_ssh_keys = list_ssh_keys()
+    from rich.prompt import Confirm, Prompt
+    from rich.table import Table
+
+    existing_ssh_keys = ssh_key_inventory()
 
     if existing_ssh_keys:
         console.print("[green]Found existing SSH keys:[/green]")
 
         table = Table(show_header=True)
         table.add_column("#", justify="right", style="cyan", no_wrap=True)
-        table.add_column("Key Path", style="magenta")
-
-        for idx, key_path in enumerate(existing_ssh_keys, 1):
-            table.add_row(str(idx), key_path)
+        table.add_column("Key", style="magenta")
+        table.add_column("Type", style="green")
+        table.add_column("Bits", justify="right")
+        table.add_column("Fingerprint", style="dim")
+        table.add_column("Agent", justify="center")
+
+        for idx, key in enumerate(existing_ssh_keys, 1):
+            table.add_row(
+                str(idx),
+                key["path"] or key["comment"] or "(agent only)",
+                key["type"].removeprefix("ssh-"),
+                str(key["bits"] or ""),
+                key["fingerprint"],
+                "*" if key["in_agent"] else "",
+            )
 
         console.print(table)
 
@@ -970,7 +2306,9 @@ def ssh_key_options(config):
                 "Enter the number of the key to use", default="1", choices=choices
             )
             choice = int(choice_str)
-            config["git_signing_key"] = existing_ssh_keys[choice - 1]
+            key = existing_ssh_keys[choice - 1]
+            # Git accepts a literal public key for keys that only live in the agent
+            config["git_signing_key"] = key["path"] or f"key::{key['key']}"
             console.print(f"[green]Using SSH key: {config['git_signing_key']}[/green]")
 
             # Optionally add to GitHub
@@ -986,73 +2324,130 @@ def ssh_key_options(config):
     # Create a new SSH key if desired
     sys.stdout.flush()
     if Confirm.ask("Would you like to create a new SSH key for signing?", default=True):
-        console.print("[bold]Creating new SSH key...[/bold]")
-        key_path = create_ssh_key(config["git_email"])
+        algorithm = Prompt.ask(
+            "Key algorithm", default="ed25519", choices=list(SSH_KEY_ALGORITHMS)
+        )
 
-        if key_path:
+        # Settle an existing key file here: ssh-keygen must never ask itself
+        key_path = ssh_signing_key_path(algorithm)
+        overwrite = os.path.exists(key_path)
+        if overwrite and not Confirm.ask(
+            f"{key_path} already exists. Replace it with a new key?", default=False
+        ):
             config["git_signing_key"] = key_path
-            console.print(f"[green]Created SSH key: {key_path}[/green]")
-
-            # Changed default to True for newly created keys
+            console.print(f"[green]Using existing SSH key: {key_path}[/green]")
+            sys.stdout.flush()
             if Confirm.ask(
-                "Would you like to add this key to your GitHub account?", default=True
+                "Would you like to add this key to your GitHub account for signing?",
+                default=False,
             ):
                 add_key_to_github("ssh-signing", key_path)
-        else:
-            console.print("[yellow]SSH key creation failed or was cancelled.[/yellow]")
-            config["git_signing_key"] = Prompt.ask(
-                "Enter your SSH key path manually", default="~/.ssh/id_ed25519"
-            )
+            return
+
+        console.print("[bold]Creating new SSH key in the background...[/bold]")
+        future = start_key_generation(
+            create_ssh_key, config["git_email"], algorithm, overwrite
+        )
+
+        # Changed default to True for newly created keys
+        sys.stdout.flush()
+        upload = Confirm.ask(
+            "Would you like to add this key to your GitHub account?", default=True
+        )
+        PENDING_SIGNING_KEY.update(
+            future=future, key_type="ssh-signing", algorithm=algorithm, upload=upload
+        )
     else:
         config["git_signing_key"] = Prompt.ask(
             "Enter your SSH key path manually", default="~/.ssh/id_ed25519"
         )
 
 
-def list_gpg_keys():
-    """List existing GPG keys."""
-    try:
-        result = subprocess.run(
-            ["gpg", "--list-secret-keys", "--keyid-format", "long"],
-            capture_output=True,
-            text=True,
-            check=False,
-        )
+# OpenPGP public key algorithm IDs as printed in gpg's colon listings
+GPG_ALGORITHMS = {
+    "1": "rsa",
+    "16": "elg",
+    "17": "dsa",
+    "18": "ecdh",
+    "19": "ecdsa",
+    "22": "eddsa",
+}
+_GPG_KEYRING = None
+_GPG_KEYRING_LOCK = threading.Lock()
 
-        if result.returncode != 0:
-            return []
 
-        output = result.stdout
-        keys = []
+def _parse_gpg_colons(output):
+    """Parse ``gpg --with-colons`` secret key listings into key records."""
+    keys = []
+    current = None  # The primary key or subkey later fpr records belong to
+    for line in output.splitlines():
+        fields = line.split(":")
+        record = fields[0]
+        if record in ("sec", "ssb") and len(fields) > 11:
+            current = {
+                "key_id": fields[4],
+                "fingerprint": None,
+                "algorithm": GPG_ALGORITHMS.get(fields[3], fields[3]),
+                "bits": int(fields[2]) if fields[2].isdigit() else None,
+                "validity": fields[1],
+                "capabilities": fields[11],
+                "created": int(fields[5]) if fields[5].isdigit() else None,
+                "expires": int(fields[6]) if fields[6].isdigit() else None,
+            }
+            if record == "sec":
+                current.update(uids=[], subkeys=[])
+                keys.append(current)
+            elif keys:
+                keys[-1]["subkeys"].append(current)
+        elif record == "fpr" and current is not None and current["fingerprint"] is None:
+            current["fingerprint"] = fields[9]
+        elif record == "uid" and keys and len(fields) > 9:
+            # Field 10 escapes special characters as \xNN
+            uid = re.sub(r"\\x([0-9a-fA-F]{2})", lambda m: chr(int(m[1], 16)), fields[9])
+            keys[-1]["uids"].append(uid)
+    return keys
 
-        key_id = None
-        user_info = None
-
-        for line in output.splitlines():
-            if "sec" in line and "/" in line:
-                # Extract the key ID
-                parts = line.split("/")
-                if len(parts) >= 2:
-                    key_id = parts[1].split(" ")[0]
-            elif "uid" in line and key_id:
-                # Extract user info
-                if "]" in line:
-                    user_info = line.split("]")[1].strip()
-                else:
-                    user_info = line.split("uid")[1].strip()
 
-                if key_id and user_info:
-                    keys.append((key_id, user_info))
-                    key_id = None
-                    user_info = None
+def gpg_keyring(refresh=False):
+    """Return the secret keys in the GPG keyring as structured records.
 
-        return keys
+    The listing is taken once and reused for the rest of the process; call
+    invalidate_gpg_keyring after anything that changes the keyring.
+    """
+    global _GPG_KEYRING
+    with _GPG_KEYRING_LOCK:
+        if _GPG_KEYRING is None or refresh:
+            result = run_captured(
+                ["gpg", "--list-secret-keys", "--with-colons", "--fixed-list-mode"],
+                text=True,
+            )
+            if result.returncode != 0:
+                return []
+            _GPG_KEYRING = _parse_gpg_colons(result.stdout)
+        return _GPG_KEYRING
+
+
+def invalidate_gpg_keyring():
+    """Forget the cached keyring listing after the keyring was modified."""
+    global _GPG_KEYRING
+    with _GPG_KEYRING_LOCK:
+        _GPG_KEYRING = None
+
+
+def list_gpg_keys():
+    """List existing GPG keys that can still sign, as (key ID, user ID) pairs."""
+    try:
+        return [
+            (key["key_id"], key["uids"][0] if key["uids"] else "")
+            for key in gpg_keyring()
+            if "S" in key["capabilities"] and key["validity"] not in ("r", "e")
+        ]
     except Exception as e:
         console.print(f"[yellow]Error listing GPG keys: {e}[/yellow]")
         return []
 
 
-def create_gpg_key(name, email):
+def create_gpg_key(name, email, algorithm="ed25519"):
     """Create a new GPG key."""
     try:
         # Create a batch file for GPG key generation
@@ -1061,24 +2456,26 @@ def create_gpg_key(name, email):
 
         with open(batch_file, "w") as f:
             f.write(
-                f"""
-Key-Type: RSA
-Key-Length: 4096
-Name-Real: {name}
-Name-Email: {email}
-Expire-Date: 0
-%no-protection
-%commit
-            """.strip()
+                "\n".join(
+                    GPG_KEY_ALGORITHMS[algorithm]
+                    + [
+                        f"Name-Real: {name}",
+                        f"Name-Email: {email}",
+                        "Expire-Date: 0",
+                        "%no-protection",
+                        "%commit",
+                    ]
+                )
+                + "\n"
             )
 
         # Generate the key
         console.print("[yellow]Generating GPG key... this may take a moment.[/yellow]")
-        result = subprocess.run(
-            ["gpg", "--batch", "--generate-key", batch_file],
-            capture_output=True,
+        result = run_captured(
+            ["gpg", "--batch", "--status-fd", "1", "--generate-key", batch_file],
             text=True,
-            check=False,
+            stdin=subprocess.DEVNULL,  # The terminal belongs to the prompts
+            timeout=600,  # Key generation can block waiting for entropy
         )
 
         # Clean up the batch file
@@ -1091,20 +2488,13 @@ Expire-Date: 0
             console.print(f"[red]GPG key generation failed:[/red]\n{result.stderr}")
             return None
 
-        # Get the key ID of the newly created key
-        list_result = subprocess.run(
-            ["gpg", "--list-secret-keys", "--keyid-format", "long", email],
-            capture_output=True,
-            text=True,
-            check=False,
-        )
+        invalidate_gpg_keyring()
 
-        output = list_result.stdout
-        for line in output.splitlines():
-            if "sec" in line and "/" in line:
-                parts = line.split("/")
-                if len(parts) >= 2:
-                    return parts[1].split(" ")[0]
+        # gpg reports the new key's fingerprint on its status channel
+        for line in result.stdout.splitlines():
+            if line.startswith("[GNUPG:] KEY_CREATED "):
+                fingerprint = line.split()[3]
+                return fingerprint[-16:]
 
         return None
     except Exception as e:
@@ -1112,37 +2502,202 @@ Expire-Date: 0
         return None
 
 
-def list_ssh_keys():
-    """List existing SSH keys."""
-    ssh_dir = os.path.expanduser("~/.ssh")
-    if not os.path.exists(ssh_dir):
+SSH_DIR = os.path.expanduser("~/.ssh")
+SSH_AGENT_TIMEOUT = 2  # Seconds to wait on an unresponsive ssh-agent
+SSH_AGENTC_REQUEST_IDENTITIES = 11
+SSH_AGENT_IDENTITIES_ANSWER = 12
+_SSH_KEY_FILES = {}  # ~/.ssh mtime_ns -> parsed key files
+_SSH_KEY_FILES_LOCK = threading.Lock()
+
+
+def _read_ssh_string(blob, offset):
+    """Read one length-prefixed SSH wire string, returning it and the next offset."""
+    length = int.from_bytes(blob[offset : offset + 4], "big")
+    start = offset + 4
+    if start + length > len(blob):
+        raise ValueError("truncated SSH key blob")
+    return blob[start : start + length], start + length
+
+
+def ssh_key_info(blob, comment=""):
+    """Describe an SSH public key from its wire-format blob.
+
+    Returns the key type, size in bits, OpenSSH-style SHA256 fingerprint,
+    comment and the "type base64" form used by authorized_keys and GitHub.
+    """
+    import base64
+
+    key_type, offset = _read_ssh_string(blob, 0)
+    key_type = key_type.decode()
+    if key_type == "ssh-rsa":
+        _, offset = _read_ssh_string(blob, offset)  # Public exponent
+        modulus, _ = _read_ssh_string(blob, offset)
+        bits = int.from_bytes(modulus, "big").bit_length()
+    elif key_type == "ssh-dss":
+        prime, _ = _read_ssh_string(blob, offset)
+        bits = int.from_bytes(prime, "big").bit_length()
+    elif key_type.startswith(("ecdsa-sha2-nistp", "sk-ecdsa-sha2-nistp")):
+        bits = int(re.search(r"nistp(\d+)", key_type).group(1))
+    elif "ed25519" in key_type:
+        bits = 256
+    else:
+        bits = None
+
+    digest = base64.b64encode(hashlib.sha256(blob).digest()).decode().rstrip("=")
+    return {
+        "type": key_type,
+        "bits": bits,
+        "fingerprint": f"SHA256:{digest}",
+        "comment": comment,
+        "key": f"{key_type} {base64.b64encode(blob).decode()}",
+    }
+
+
+def parse_ssh_public_key(line):
+    """Parse an OpenSSH public key line, or return None if it is not one."""
+    import base64
+    import binascii
+
+    parts = line.strip().split(None, 2)
+    if len(parts) < 2:
+        return None
+    try:
+        blob = base64.b64decode(parts[1], validate=True)
+        info = ssh_key_info(blob, parts[2] if len(parts) > 2 else "")
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    return info if info["type"] == parts[0] else None
+
+
+def ssh_agent_keys():
+    """List the keys loaded in the running ssh-agent, or [] if there is none."""
+    import socket
+
+    sock_path = os.environ.get("SSH_AUTH_SOCK")
+    if not sock_path:
         return []
 
-    keys = []
-    for file in os.listdir(ssh_dir):
-        if file.endswith(".pub") and not file.startswith("known_hosts"):
-            private_key = os.path.join(ssh_dir, file[:-4])  # Remove .pub extension
-            if os.path.exists(private_key):
-                keys.append(private_key)
+    def recv_exactly(sock, size):
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("ssh-agent closed the connection")
+            data += chunk
+        return data
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(SSH_AGENT_TIMEOUT)
+            sock.connect(sock_path)
+            sock.sendall((1).to_bytes(4, "big") + bytes([SSH_AGENTC_REQUEST_IDENTITIES]))
+            length = int.from_bytes(recv_exactly(sock, 4), "big")
+            reply = recv_exactly(sock, length)
+    except (OSError, ConnectionError):
+        return []
 
+    if not reply or reply[0] != SSH_AGENT_IDENTITIES_ANSWER:
+        return []
+    keys = []
+    try:
+        count = int.from_bytes(reply[1:5], "big")
+        offset = 5
+        for _ in range(count):
+            blob, offset = _read_ssh_string(reply, offset)
+            comment, offset = _read_ssh_string(reply, offset)
+            keys.append(ssh_key_info(blob, comment.decode(errors="replace")))
+    except (ValueError, UnicodeDecodeError):
+        pass
     return keys
 
 
-def create_ssh_key(email):
-    """Create a new SSH key."""
+def _ssh_key_files():
+    """Parse the key pairs in ~/.ssh, reusing the result until the directory changes."""
+    try:
+        mtime = os.stat(SSH_DIR).st_mtime_ns
+    except OSError:
+        return []
+
+    with _SSH_KEY_FILES_LOCK:
+        if mtime in _SSH_KEY_FILES:
+            return _SSH_KEY_FILES[mtime]
+
+        keys = []
+        for file in sorted(os.listdir(SSH_DIR)):
+            if not file.endswith(".pub") or file.startswith("known_hosts"):
+                continue
+            private_key = os.path.join(SSH_DIR, file[:-4])  # Remove .pub extension
+            if not os.path.exists(private_key):
+                continue
+            try:
+                with open(os.path.join(SSH_DIR, file), "r") as f:
+                    info = parse_ssh_public_key(f.readline())
+            except (OSError, UnicodeDecodeError):
+                continue
+            if info:
+                keys.append({**info, "path": private_key})
+
+        _SSH_KEY_FILES.clear()
+        _SSH_KEY_FILES[mtime] = keys
+        return keys
+
+
+def ssh_key_inventory():
+    """Return the SSH keys on disk and in the ssh-agent as structured records.
+
+    Keys that exist in both places are merged. Agent-only keys have no
+    ``path`` and can only be used through their public key.
+    """
+    inventory = {key["key"]: {**key, "in_agent": False} for key in _ssh_key_files()}
+    for key in ssh_agent_keys():
+        if key["key"] in inventory:
+            inventory[key["key"]]["in_agent"] = True
+        else:
+            inventory[key["key"]] = {**key, "path": None, "in_agent": True}
+    return list(inventory.values())
+
+
+def ssh_public_key(signing_key):
+    """Return the public key for a key path or a ``key::`` literal, or None."""
+    if signing_key.startswith("key::"):
+        return signing_key.removeprefix("key::")
+    try:
+        with open(f"{os.path.expanduser(signing_key)}.pub", "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def ssh_signing_key_path(algorithm):
+    """Where a new SSH signing key of the given algorithm is written."""
+    return os.path.join(SSH_DIR, f"id_signing_{algorithm}")
+
+
+def create_ssh_key(email, algorithm="ed25519", overwrite=False):
+    """Create a new SSH key.
+
+    Runs in the background while the user answers prompts, so it never asks
+    anything: an existing key file is replaced only with ``overwrite``.
+    """
     try:
-        key_path = os.path.expanduser("~/.ssh/id_signing_ed25519")
+        key_path = ssh_signing_key_path(algorithm)
+        if os.path.exists(key_path):
+            if not overwrite:
+                console.print(f"[red]SSH key already exists: {key_path}[/red]")
+                return None
+            for path in (key_path, f"{key_path}.pub"):
+                if os.path.exists(path):
+                    os.remove(path)
 
         # Create .ssh directory if it doesn't exist
         os.makedirs(os.path.dirname(key_path), exist_ok=True)
 
         # Generate the key
         console.print("[yellow]Generating SSH key...[/yellow]")
-        result = subprocess.run(
+        result = run_captured(
             [
                 "ssh-keygen",
-                "-t",
-                "ed25519",
+                *SSH_KEY_ALGORITHMS[algorithm],
                 "-C",
                 email,
                 "-f",
@@ -1150,9 +2705,8 @@ def create_ssh_key(email):
                 "-N",
                 "",  # No passphrase
             ],
-            capture_output=True,
             text=True,
-            check=False,
+            stdin=subprocess.DEVNULL,  # The terminal belongs to the prompts
         )
 
         if result.returncode != 0:
@@ -1165,18 +2719,315 @@ def create_ssh_key(email):
         return None
 
 
+_HTTP_SESSION = None
+_HTTP_SESSION_LOCK = threading.Lock()
+_GITHUB_TOKEN = None  # Device flow token, reused for every upload in this run
+# Set by cleanup and failed uploads so a pending device flow poll stops at once
+GITHUB_AUTH_CANCELLED = threading.Event()
+
+
+def http_session():
+    """Return the process-wide requests session.
+
+    Connections are pooled and kept alive, so repeated polls and API calls to
+    the same host skip the TCP and TLS handshakes after the first request.
+    """
+    global _HTTP_SESSION
+    with _HTTP_SESSION_LOCK:
+        if _HTTP_SESSION is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=DEFAULT_JOBS * 2)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = "hadronomy-dotfiles-installer"
+            _HTTP_SESSION = session
+        return _HTTP_SESSION
+
+
+def github_api(method, path, token, **kwargs):
+    """Call the GitHub REST API through the shared session."""
+    headers = {
+        "Accept": "application/vnd.github+json",
+        "Authorization": f"Bearer {token}",
+        "X-GitHub-Api-Version": "2022-11-28",
+        **kwargs.pop("headers", {}),
+    }
+    return http_session().request(
+        method, f"{GITHUB_API_URL}{path}", headers=headers, timeout=HTTP_TIMEOUT, **kwargs
+    )
+
+
+def request_device_code(scope):
+    """Start a GitHub OAuth device flow and return the device code response."""
+    response = http_session().post(
+        f"{GITHUB_URL}/login/device/code",
+        headers={"Accept": "application/json"},
+        data={"client_id": GITHUB_CLIENT_ID, "scope": scope},
+        timeout=HTTP_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def poll_device_token(device, cancelled=None, sleep=None):
+    """Poll for a device flow access token until it is granted or expires.
+
+    Waits ``interval`` seconds between polls and, on ``slow_down``, adopts the
+    interval the server sends back (or adds 5 seconds when it sends none), as
+    RFC 8628 requires. Raises an Exception on denial, expiry or cancellation;
+    setting ``cancelled`` also cuts the wait between polls short.
+    """
+    if sleep is None:
+        sleep = cancelled.wait if cancelled is not None else time.sleep
+    interval = device.get("interval", 5)
+    deadline = time.monotonic() + device["expires_in"]
+    while time.monotonic() < deadline:
+        sleep(interval)
+        if cancelled is not None and cancelled.is_set():
+            raise Exception("GitHub authorization cancelled")
+
+        response = http_session().post(
+            f"{GITHUB_URL}/login/oauth/access_token",
+            headers={"Accept": "application/json"},
+            data={
+                "client_id": GITHUB_CLIENT_ID,
+                "device_code": device["device_code"],
+                "grant_type": "urn:ietf:params:oauth:grant-type:device_code",
+            },
+            timeout=HTTP_TIMEOUT,
+        )
+        token_data = response.json()
+
+        error = token_data.get("error")
+        if error is None:
+            return token_data["access_token"]
+        if error == "slow_down":
+            interval = token_data.get("interval", interval + 5)
+        elif error != "authorization_pending":
+            raise Exception(token_data.get("error_description", error))
+
+    raise Exception("GitHub authorization timed out")
+
+
+def start_device_poll(device, cancelled):
+    """Poll for the device flow token on a daemon thread and return its Future.
+
+    The main thread stays free to handle signals while it waits, and neither a
+    failure nor interpreter exit waits for the poll: ``cancelled`` stops it.
+    """
+    import concurrent.futures
+
+    future = concurrent.futures.Future()
+
+    def poll():
+        try:
+            future.set_result(poll_device_token(device, cancelled))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(
+        target=in_current_phase(poll), name="device-flow", daemon=True
+    ).start()
+    return future
+
+
+def wait_for_device_token(device, future, cancelled):
+    """Wait for a device flow poll, bounded by the code's expiry and the phase."""
+    import concurrent.futures
+
+    try:
+        with console.status("[bold green]Waiting for GitHub authorization..."):
+            return future.result(timeout=command_timeout(device["expires_in"]))
+    except concurrent.futures.TimeoutError:
+        raise Exception("GitHub authorization timed out")
+    finally:
+        # Stops the poll after a timeout, Ctrl-C or any other failure
+        cancelled.set()
+
+
+def upload_key_to_github(token, key_type, key, title):
+    """Upload a public key with the REST API and return the response."""
+    if key_type == "gpg":
+        return github_api("POST", "/user/gpg_keys", token, json={"armored_public_key": key})
+    path = "/user/ssh_signing_keys" if key_type == "ssh-signing" else "/user/keys"
+    return github_api("POST", path, token, json={"title": title, "key": key})
+
+
+# Where each kind of key lives in the GitHub REST API
+GITHUB_KEY_ENDPOINTS = {
+    "ssh": "/user/keys",
+    "ssh-signing": "/user/ssh_signing_keys",
+    "gpg": "/user/gpg_keys",
+}
+
+
+def key_fingerprints(key_type, entry):
+    """Identifiers GitHub knows a key by: key IDs for GPG, "type base64" for SSH."""
+    if key_type == "gpg":
+        key_ids = [entry.get("key_id")]
+        key_ids += [subkey.get("key_id") for subkey in entry.get("subkeys", [])]
+        return [key_id.upper() for key_id in key_ids if key_id]
+    return [" ".join(entry.get("key", "").split()[:2])]
+
+
+def load_github_key_cache():
+    """Load the cached fingerprint index of keys already on the GitHub account."""
+    try:
+        with open(GITHUB_KEY_CACHE, "r") as f:
+            cache = json.load(f)
+        if cache.get("version") == 1:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {"version": 1, "endpoints": {}}
+
+
+def save_github_key_cache(cache):
+    """Atomically persist the GitHub key index."""
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        tmp_path = f"{GITHUB_KEY_CACHE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, GITHUB_KEY_CACHE)
+    except OSError as e:
+        console.print(f"[yellow]Could not save GitHub key index: {e}[/yellow]")
+
+
+def fetch_github_key_index(token, key_type, cache):
+    """Return the fingerprints of one kind of key on the account, or None without access.
+
+    The first page is requested with the ETag from the previous run, so an
+    unchanged account costs a single 304 response.
+    """
+    path = GITHUB_KEY_ENDPOINTS[key_type]
+    cached = cache["endpoints"].get(path, {})
+    headers = {"If-None-Match": cached["etag"]} if cached.get("etag") else {}
+
+    response = github_api("GET", path, token, params={"per_page": 100}, headers=headers)
+    if response.status_code == 304:
+        return set(cached["fingerprints"])
+    if response.status_code != 200:
+        return None  # Missing scope or bad token; let the caller fall back
+
+    # A 304 on the first page says nothing about later ones, so only cache
+    # the ETag of accounts that fit in a single page
+    etag = response.headers.get("ETag")
+    fingerprints = set()
+    while True:
+        for entry in response.json():
+            fingerprints.update(key_fingerprints(key_type, entry))
+        next_url = response.links.get("next", {}).get("url")
+        if not next_url:
+            break
+        etag = None
+        response = github_api("GET", next_url.removeprefix(GITHUB_API_URL), token)
+        response.raise_for_status()
+
+    cache["endpoints"][path] = {"etag": etag, "fingerprints": sorted(fingerprints)}
+    save_github_key_cache(cache)
+    return fingerprints
+
+
+def read_public_key(key_type, key_path_or_id):
+    """Read the public half of a local key, or None if it cannot be read."""
+    if key_type == "gpg":
+        export_result = run_captured(
+            ["gpg", "--armor", "--export", key_path_or_id], text=True
+        )
+        if export_result.returncode != 0 or not export_result.stdout.strip():
+            console.print("[red]Failed to export GPG key.[/red]")
+            return None
+        return export_result.stdout
+
+    public_key = ssh_public_key(key_path_or_id)
+    if public_key is None:
+        console.print(f"[red]SSH public key not found: {key_path_or_id}.pub[/red]")
+    return public_key
+
+
+def sync_key_to_github(token, key_type, key_path_or_id, public_key=None):
+    """Upload a key unless the account already has it.
+
+    Returns True when the key is on GitHub afterwards, False when the upload
+    failed, and None when the token cannot list keys of this kind.
+    """
+    labels = {"gpg": "GPG key", "ssh": "SSH key", "ssh-signing": "SSH signing key"}
+    cache = load_github_key_cache()
+    existing = fetch_github_key_index(token, key_type, cache)
+    if existing is None:
+        return None
+
+    if public_key is None:
+        public_key = read_public_key(key_type, key_path_or_id)
+        if public_key is None:
+            return False
+    if key_type == "gpg":
+        local = [key_path_or_id.upper()[-16:]]
+    else:
+        local = key_fingerprints(key_type, {"key": public_key})
+    if existing.intersection(local):
+        console.print(f"[green]{labels[key_type]} is already on GitHub.[/green]")
+        return True
+
+    title = f"{platform.node()}-{'signing-' if key_type == 'ssh-signing' else ''}key"
+    response = upload_key_to_github(token, key_type, public_key, title)
+    if response.status_code != 201:
+        console.print(
+            f"[red]Failed to add {labels[key_type]}: {response.json().get('message', 'Unknown error')}[/red]"
+        )
+        return False
+
+    # The account changed, so the next run has to revalidate the whole list
+    entry = cache["endpoints"].setdefault(GITHUB_KEY_ENDPOINTS[key_type], {})
+    entry["etag"] = None
+    entry["fingerprints"] = sorted(
+        existing.union(key_fingerprints(key_type, response.json()))
+    )
+    save_github_key_cache(cache)
+    console.print(f"[green]{labels[key_type]} added to GitHub successfully![/green]")
+    return True
+
+
+def gh_auth_token():
+    """Return the token the GitHub CLI is logged in with, or None."""
+    try:
+        result = run_captured(["gh", "auth", "token"], text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
 def add_key_to_github(key_type: Literal["gpg", "ssh", "ssh-signing"], key_path_or_id):
     """Add a key to GitHub."""
+    global _GITHUB_TOKEN
+    from rich.panel import Panel
+    from rich.prompt import Confirm
+
     try:
         # Check if gh CLI is available
         if command_exists("gh"):
+            # Reuse the CLI's login to skip keys the account already has
+            token = gh_auth_token()
+            if token:
+                import requests
+
+                try:
+                    synced = sync_key_to_github(token, key_type, key_path_or_id)
+                except requests.RequestException as e:
+                    console.print(f"[yellow]Could not list GitHub keys: {e}[/yellow]")
+                    synced = None
+                if synced is not None:
+                    return synced
+
             if key_type == "gpg":
                 # Export the GPG public key
-                export_result = subprocess.run(
+                export_result = run_captured(
                     ["gpg", "--armor", "--export", key_path_or_id],
-                    capture_output=True,
                     text=True,
-                    check=False,
                 )
 
                 if export_result.returncode != 0:
@@ -1192,11 +3043,9 @@ def add_key_to_github(key_type: Literal["gpg", "ssh", "ssh-signing"], key_path_o
 
                 # Add to GitHub using gh CLI
                 console.print("[yellow]Adding GPG key to GitHub...[/yellow]")
-                gh_result = subprocess.run(
+                gh_result = run_captured(
                     ["gh", "gpg-key", "add", tmp_file],
-                    capture_output=True,
                     text=True,
-                    check=False,
                 )
 
                 # Clean up
@@ -1216,16 +3065,10 @@ def add_key_to_github(key_type: Literal["gpg", "ssh", "ssh-signing"], key_path_o
 
             elif key_type == "ssh" or key_type == "ssh-signing":
                 # Read the SSH public key
-                pub_key_path = f"{key_path_or_id}.pub"
-                if not os.path.exists(pub_key_path):
-                    console.print(
-                        f"[red]SSH public key not found: {pub_key_path}[/red]"
-                    )
+                ssh_key = read_public_key(key_type, key_path_or_id)
+                if ssh_key is None:
                     return False
 
-                with open(pub_key_path, "r") as f:
-                    ssh_key = f.read().strip()
-
                 # Add to GitHub using gh CLI
                 title = (
                     f"{platform.node()}-signing-key"
@@ -1239,17 +3082,20 @@ def add_key_to_github(key_type: Literal["gpg", "ssh", "ssh-signing"], key_path_o
 
                 if key_type == "ssh-signing":
                     # First, ensure we have the proper scope for SSH signing keys
-                    auth_status = subprocess.run(
+                    auth_status = run_captured(
                         ["gh", "auth", "status"],
-                        capture_output=True,
                         text=True,
-                        check=False,
                     )
 
                     if "admin:ssh_signing_key" not in auth_status.stdout:
                         console.print(
                             "[yellow]The GitHub CLI needs additional permissions for SSH signing keys.[/yellow]"
                         )
+                        if NON_INTERACTIVE:
+                            console.print(
+                                "[yellow]Run: gh auth refresh -h github.com -s admin:ssh_signing_key, then add the key again.[/yellow]"
+                            )
+                            return False
                         console.print(
                             "[yellow]Running: gh auth refresh -h github.com -s admin:ssh_signing_key[/yellow]"
                         )
@@ -1269,7 +3115,8 @@ def add_key_to_github(key_type: Literal["gpg", "ssh", "ssh-signing"], key_path_o
                                 "github.com",
                                 "-s",
                                 "admin:ssh_signing_key",
-                            ]
+                            ],
+                            timeout=command_timeout(600),
                         )
 
                         if refresh_result != 0:
@@ -1286,14 +3133,12 @@ def add_key_to_github(key_type: Literal["gpg", "ssh", "ssh-signing"], key_path_o
                         )
 
                 # Now add the key
-                cmd = ["gh", "ssh-key", "add", pub_key_path, "--title", title]
+                cmd = ["gh", "ssh-key", "add", "-", "--title", title]
                 if key_type == "ssh-signing":
                     cmd.append("--type")
                     cmd.append("signing")
 
-                gh_result = subprocess.run(
-                    cmd, capture_output=True, text=True, check=False
-                )
+                gh_result = run_captured(cmd, text=True, input=ssh_key)
 
                 if gh_result.returncode != 0:
                     console.print(
@@ -1309,189 +3154,71 @@ def add_key_to_github(key_type: Literal["gpg", "ssh", "ssh-signing"], key_path_o
                 "[yellow]GitHub CLI (gh) not found. Using web authentication flow instead.[/yellow]"
             )
 
-            # Use device flow authentication
+            # Use device flow authentication; it needs someone at a browser
             sys.stdout.flush()
-            if Confirm.ask(
+            if not NON_INTERACTIVE and Confirm.ask(
                 "Would you like to authenticate with GitHub to add your key?",
                 default=True,
             ):
                 try:
-                    import json
-                    import time
                     import webbrowser
 
                     import requests
 
-                    # GitHub OAuth Device Flow
-                    client_id = "Iv1.5da81c42435d41c5"  # Client ID for a generic GitHub OAuth App
-
-                    # Update scope to include ssh_signing_key permissions
-                    scope = "admin:public_key admin:gpg_key admin:ssh_signing_key"
-
-                    # Step 1: Request device code
-                    device_code_url = "https://github.com/login/device/code"
-                    device_response = requests.post(
-                        device_code_url,
-                        headers={"Accept": "application/json"},
-                        data={"client_id": client_id, "scope": scope},
-                    )
-
-                    if device_response.status_code != 200:
-                        console.print(
-                            "[red]Failed to start GitHub authentication.[/red]"
-                        )
-                        return False
-
-                    device_data = device_response.json()
-                    device_code = device_data["device_code"]
-                    user_code = device_data["user_code"]
-                    verification_uri = device_data["verification_uri"]
-                    expires_in = device_data["expires_in"]
-                    interval = device_data["interval"]
-
-                    # Display instructions to the user
-                    console.print(
-                        Panel.fit(
-                            f"\n[bold green]GitHub Authentication Required[/bold green]\n\n"
-                            f"1. Go to: [bold blue]{verification_uri}[/bold blue]\n"
-                            f"2. Enter code: [bold yellow]{user_code}[/bold yellow]\n"
-                            f"3. Authorize this application\n",
-                            title="GitHub Device Flow",
+                    future = None
+                    if _GITHUB_TOKEN is None:
+                        device = request_device_code(
+                            "admin:public_key admin:gpg_key admin:ssh_signing_key"
                         )
-                    )
 
-                    # Try to open the browser automatically
-                    try:
-                        webbrowser.open(verification_uri)
-                    except Exception:
-                        pass
-
-                    # Step 2: Poll for the access token
-                    token_url = "https://github.com/login/oauth/access_token"
-                    start_time = time.time()
-                    access_token = None
-
-                    with console.status(
-                        "[bold green]Waiting for GitHub authorization..."
-                    ) as _:
-                        while time.time() - start_time < expires_in:
-                            token_response = requests.post(
-                                token_url,
-                                headers={"Accept": "application/json"},
-                                data={
-                                    "client_id": client_id,
-                                    "device_code": device_code,
-                                    "grant_type": "urn:ietf:params:oauth:grant-type:device_code",
-                                },
+                        # Display instructions to the user
+                        console.print(
+                            Panel.fit(
+                                f"\n[bold green]GitHub Authentication Required[/bold green]\n\n"
+                                f"1. Go to: [bold blue]{device['verification_uri']}[/bold blue]\n"
+                                f"2. Enter code: [bold yellow]{device['user_code']}[/bold yellow]\n"
+                                f"3. Authorize this application\n",
+                                title="GitHub Device Flow",
                             )
+                        )
 
-                            token_data = token_response.json()
-
-                            if "error" not in token_data:
-                                access_token = token_data["access_token"]
-                                break
-
-                            if token_data["error"] != "authorization_pending":
-                                if token_data["error"] == "slow_down":
-                                    interval += 5
-                                else:
-                                    console.print(
-                                        f"[red]Error: {token_data['error']}[/red]"
-                                    )
-                                    return False
+                        # Poll on a daemon thread so Ctrl-C and cleanup can stop it
+                        GITHUB_AUTH_CANCELLED.clear()
+                        future = start_device_poll(device, GITHUB_AUTH_CANCELLED)
 
-                            time.sleep(interval)
+                        # Try to open the browser automatically
+                        try:
+                            webbrowser.open(device["verification_uri"])
+                        except Exception:
+                            pass
 
-                    if not access_token:
-                        console.print("[red]GitHub authorization timed out.[/red]")
+                    public_key = read_public_key(key_type, key_path_or_id)
+                    if public_key is None:
                         return False
 
-                    # Now use the token with PyGithub
-                    from github import Github, GithubException
-
-                    g = Github(access_token)
-                    user = g.get_user()
-
-                    if key_type == "gpg":
-                        # Export the GPG public key
-                        export_result = subprocess.run(
-                            ["gpg", "--armor", "--export", key_path_or_id],
-                            capture_output=True,
-                            text=True,
-                            check=False,
+                    if future is not None:
+                        _GITHUB_TOKEN = wait_for_device_token(
+                            device, future, GITHUB_AUTH_CANCELLED
                         )
 
-                        if export_result.returncode != 0:
-                            console.print("[red]Failed to export GPG key.[/red]")
-                            return False
-
-                        gpg_key = export_result.stdout
-                        user.create_gpg_key(gpg_key)
+                    synced = sync_key_to_github(
+                        _GITHUB_TOKEN, key_type, key_path_or_id, public_key
+                    )
+                    if synced is None:
                         console.print(
-                            "[green]GPG key added to GitHub successfully![/green]"
+                            "[red]The GitHub token cannot manage keys of this kind.[/red]"
                         )
-
-                    elif key_type == "ssh" or key_type == "ssh-signing":
-                        # Read the SSH public key
-                        pub_key_path = f"{key_path_or_id}.pub"
-                        if not os.path.exists(pub_key_path):
-                            console.print(
-                                f"[red]SSH public key not found: {pub_key_path}[/red]"
-                            )
-                            return False
-
-                        with open(pub_key_path, "r") as f:
-                            ssh_key = f.read().strip()
-
-                        title = f"{platform.node()}-{'signing-' if key_type == 'ssh-signing' else ''}key"
-
-                        if key_type == "ssh-signing":
-                            # For signing keys, we need to use the REST API directly since PyGithub
-                            # doesn't support the key_type parameter yet
-                            headers = {
-                                "Accept": "application/vnd.github+json",
-                                "Authorization": f"Bearer {access_token}",
-                                "X-GitHub-Api-Version": "2022-11-28",
-                            }
-
-                            data = {
-                                "title": title,
-                                "key": ssh_key,
-                            }
-
-                            response = requests.post(
-                                "https://api.github.com/user/ssh_signing_keys",
-                                headers=headers,
-                                data=json.dumps(data),
-                            )
-
-                            if response.status_code == 201:
-                                console.print(
-                                    "[green]SSH signing key added to GitHub successfully![/green]"
-                                )
-                                return True
-                            else:
-                                console.print(
-                                    f"[red]Failed to add SSH signing key: {response.json().get('message', 'Unknown error')}[/red]"
-                                )
-                                return False
-                        else:
-                            # Regular SSH key
-                            user.create_key(title=title, key=ssh_key)
-                            console.print(
-                                "[green]SSH key added to GitHub successfully![/green]"
-                            )
-
-                    return True
+                    return bool(synced)
 
                 except ImportError as e:
                     console.print(f"[red]Failed to import necessary modules: {e}[/red]")
                 except requests.RequestException as e:
                     console.print(f"[red]Network error: {e}[/red]")
-                except GithubException as e:
-                    console.print(f"[red]GitHub API error: {e}[/red]")
                 except Exception as e:
                     console.print(f"[red]Error adding key to GitHub: {e}[/red]")
+                finally:
+                    # Never leave a poll running once this upload is over
+                    GITHUB_AUTH_CANCELLED.set()
 
             console.print(
                 "[yellow]You can add your keys manually at https://github.com/settings/keys[/yellow]"
@@ -1502,65 +3229,225 @@ def add_key_to_github(key_type: Literal["gpg", "ssh", "ssh-signing"], key_path_o
         return False
 
 
-def replace_username_in_files(dry_run=False):
-    """Replace instances of the default username with the current user's username."""
-    console.print(
-        f"[bold]{'[bold yellow][DRY RUN][/bold yellow] Would replace' if dry_run else 'Replacing'} '{DEFAULT_USER}' with '{USER_CONFIG['username']}' in dotfiles...[/bold]"
-    )
-
-    # Define patterns to avoid changing in certain files or types
-    excluded_dirs = [".git", "node_modules", ".cache", "target"]
-    excluded_exts = [
-        ".png",
-        ".jpg",
-        ".jpeg",
-        ".gif",
-        ".webp",
-        ".ico",
-        ".svg",
-        ".ttf",
-        ".woff",
-        ".woff2",
-    ]
+REWRITE_EXCLUDED_DIRS = [".git", "node_modules", ".cache", "target"]
+REWRITE_EXCLUDED_EXTS = [
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gif",
+    ".webp",
+    ".ico",
+    ".svg",
+    ".ttf",
+    ".woff",
+    ".woff2",
+]
+
+
+def find_rewrite_candidates(root, pattern):
+    """List the files under root, relative to it, that may contain pattern.
+
+    Inside a git checkout this asks ``git grep`` for tracked and untracked
+    (but not ignored) text files containing the pattern. Outside one it falls
+    back to walking the tree and every file is a candidate.
+    """
+    try:
+        result = run_captured(
+            ["git", "-C", root, "grep", "-l", "-z", "-I", "-F", "--untracked"]
+            + ["-e", pattern],
+        )
+        # Exit code 1 means the search ran and found nothing
+        if result.returncode in (0, 1):
+            return sorted(
+                {os.fsdecode(path) for path in result.stdout.split(b"\0") if path}
+            )
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        pass
 
-    for root, dirs, files in os.walk(DOTFILES_DIR):
+    files = []
+    for dirpath, dirs, filenames in os.walk(root):
         # Skip excluded directories
-        dirs[:] = [d for d in dirs if d not in excluded_dirs]
+        dirs[:] = [d for d in dirs if d not in REWRITE_EXCLUDED_DIRS]
+        files.extend(
+            os.path.relpath(os.path.join(dirpath, filename), root)
+            for filename in filenames
+        )
+    return sorted(files)
 
-        for file in files:
-            if any(file.endswith(ext) for ext in excluded_exts):
-                continue
 
-            file_path = os.path.join(root, file)
+def load_customization_manifest(root, old, new):
+    """Load the manifest written by the last customization of root.
 
-            try:
-                # Skip binary files
-                if is_binary(file_path):
-                    continue
-
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                    content = f.read()
-
-                # Replace only if content contains the pattern
-                if DEFAULT_USER in content:
-                    if not dry_run:
-                        modified_content = content.replace(
-                            DEFAULT_USER, USER_CONFIG["username"]
-                        )
-                        with open(file_path, "w", encoding="utf-8") as f:
-                            f.write(modified_content)
+    Returns the per-file entries, or an empty dict when the manifest is missing
+    or was written for a different tree or username.
+    """
+    try:
+        with open(CUSTOMIZATION_MANIFEST, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-                    console.print(
-                        f"  {'[bold yellow][DRY RUN][/bold yellow] Would update' if dry_run else 'Updated'}: {file_path}"
-                    )
+    if (
+        manifest.get("version") != 1
+        or manifest.get("root") != root
+        or manifest.get("old") != old
+        or manifest.get("new") != new
+    ):
+        return {}
+    return manifest.get("files", {})
+
+
+def save_customization_manifest(root, old, new, files):
+    """Atomically persist the customization manifest."""
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        tmp_path = f"{CUSTOMIZATION_MANIFEST}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {"version": 1, "root": root, "old": old, "new": new, "files": files},
+                f,
+            )
+        os.replace(tmp_path, CUSTOMIZATION_MANIFEST)
+    except OSError as e:
+        console.print(f"[yellow]Could not save customization manifest: {e}[/yellow]")
+
+
+def rewrite_file(file_path, old, new, known_hash=None, dry_run=False):
+    """Replace old with new (both bytes) in a file and describe the result.
+
+    The file is scanned through mmap so files without a match are never read
+    into memory or decoded, and matching files are rewritten byte-for-byte so
+    content in other encodings survives untouched. Files whose content hash
+    equals ``known_hash`` are left alone. Returns ``(replaced, entry)`` where
+    ``entry`` is the manifest record for the file as it is left on disk.
+    """
+    with open(file_path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size == 0:
+            content_hash = hashlib.sha256().hexdigest()
+            replaced = False
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                content_hash = hashlib.sha256(mapped).hexdigest()
+                # Skip binary files and files whose content did not change
+                replaced = (
+                    content_hash != known_hash
+                    and mapped.find(b"\0", 0, 1024) == -1
+                    and mapped.find(old) != -1
+                )
+                if replaced and not dry_run:
+                    content = mapped[:].replace(old, new)
+
+    if replaced and not dry_run:
+        with open(file_path, "wb") as f:
+            f.write(content)
+        stat = os.stat(file_path)
+        content_hash = hashlib.sha256(content).hexdigest()
+
+    entry = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": content_hash,
+        "replaced": replaced,
+    }
+    return replaced, entry
+
+
+def replace_username_in_files(dry_run=False):
+    """Replace instances of the default username with the current user's username.
+
+    Candidates come from ``git grep``. A manifest of each scanned file's size,
+    mtime and content hash is kept from the previous run, so a candidate left
+    unchanged since then (a binary match, say) is known clean and not scanned
+    again.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    console.print(
+        f"[bold]{'[bold yellow][DRY RUN][/bold yellow] Would replace' if dry_run else 'Replacing'} '{DEFAULT_USER}' with '{USER_CONFIG['username']}' in dotfiles...[/bold]"
+    )
+
+    root = os.path.abspath(DOTFILES_DIR)
+    old = DEFAULT_USER.encode()
+    new = USER_CONFIG["username"].encode()
+    previous = load_customization_manifest(root, DEFAULT_USER, USER_CONFIG["username"])
+
+    candidates = find_rewrite_candidates(root, DEFAULT_USER)
+    # Entries for files that no longer match are kept for when they match again
+    candidate_set = set(candidates)
+    manifest = {
+        rel_path: entry
+        for rel_path, entry in previous.items()
+        if rel_path not in candidate_set
+    }
+    changed = []
+    for rel_path in candidates:
+        if rel_path.endswith(tuple(REWRITE_EXCLUDED_EXTS)):
+            continue
+        try:
+            stat = os.stat(os.path.join(root, rel_path))
+        except OSError:
+            continue  # Deleted from the working tree
+        entry = previous.get(rel_path)
+        if (
+            entry
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+        ):
+            manifest[rel_path] = entry
+        else:
+            changed.append(rel_path)
+
+    touched = []
+    with ThreadPoolExecutor(thread_name_prefix="rewrite") as executor:
+        futures = {
+            executor.submit(
+                in_current_phase(rewrite_file),
+                os.path.join(root, rel_path),
+                old,
+                new,
+                known_hash=previous.get(rel_path, {}).get("sha256"),
+                dry_run=dry_run,
+            ): rel_path
+            for rel_path in changed
+        }
+        for future in as_completed(futures):
+            rel_path = futures[future]
+            file_path = os.path.join(root, rel_path)
+            try:
+                replaced, entry = future.result()
             except Exception as e:
                 console.print(
                     f"[yellow]Warning: Could not process {file_path}: {e}[/yellow]"
                 )
+                continue
+
+            # Keep remembering files that were customized in an earlier run
+            entry["replaced"] = replaced or previous.get(rel_path, {}).get(
+                "replaced", False
+            )
+            manifest[rel_path] = entry
+            if replaced:
+                touched.append(rel_path)
+                console.print(
+                    f"  {'[bold yellow][DRY RUN][/bold yellow] Would update' if dry_run else 'Updated'}: {file_path}"
+                )
+
+    console.print(
+        f"[dim]Scanned {len(changed)} of {len(candidates)} candidate files, "
+        f"{'would update' if dry_run else 'updated'} {len(touched)}.[/dim]"
+    )
+
+    if not dry_run:
+        save_customization_manifest(
+            root, DEFAULT_USER, USER_CONFIG["username"], manifest
+        )
 
 
 def update_git_config(dry_run=False):
     """Update Git configuration with user information."""
+    wait_for_signing_key()
+
     if (
         not USER_CONFIG["git_name"]
         and not USER_CONFIG["git_email"]
@@ -1730,11 +3617,8 @@ def update_git_config(dry_run=False):
                 os.makedirs(os.path.dirname(allowed_signers_path), exist_ok=True)
 
                 # Get the public key content
-                pub_key_path = f"{USER_CONFIG['git_signing_key']}.pub"
-                if os.path.exists(pub_key_path):
-                    with open(pub_key_path, "r") as f:
-                        pub_key = f.read().strip()
-
+                pub_key = ssh_public_key(USER_CONFIG["git_signing_key"])
+                if pub_key:
                     # Write to allowed_signers
                     with open(allowed_signers_path, "w") as f:
                         f.write(f"{USER_CONFIG['git_email']} {pub_key}\n")
@@ -1751,14 +3635,84 @@ def update_git_config(dry_run=False):
         )
 
 
-def is_binary(file_path):
-    """Check if a file is binary."""
-    try:
-        with open(file_path, "rb") as f:
-            chunk = f.read(1024)
-            return b"\0" in chunk
-    except IOError:
-        return True
+# Executables found on PATH, keyed by name, so lookups never spawn a process
+_PATH_INDEX = {"path": None, "dirs": {}, "executables": {}}
+_PATH_INDEX_LOCK = threading.Lock()
+
+
+def set_search_path(entries):
+    """Set PATH from a list of directories, dropping empty and repeated entries."""
+    deduped = list(dict.fromkeys(entry for entry in entries if entry))
+    os.environ["PATH"] = os.pathsep.join(deduped)
+    invalidate_path_index()
+
+
+def prepend_to_path(directory):
+    """Put a directory first on PATH without repeating it."""
+    set_search_path([directory] + os.environ.get("PATH", "").split(os.pathsep))
+
+
+def invalidate_path_index():
+    """Forget the indexed PATH so the next lookup rebuilds it."""
+    with _PATH_INDEX_LOCK:
+        _PATH_INDEX["path"] = None
+
+
+def _path_dir_signatures(dirs):
+    """Identify the current state of each PATH directory (following symlinks)."""
+    signatures = {}
+    for directory in dirs:
+        try:
+            stat = os.stat(directory)
+            signatures[directory] = (stat.st_ino, stat.st_mtime_ns)
+        except OSError:
+            signatures[directory] = None
+    return signatures
+
+
+def _rebuild_path_index(path):
+    """Index every entry of the PATH directories, first directory wins."""
+    dirs = list(dict.fromkeys(entry for entry in path.split(os.pathsep) if entry))
+    executables = {}
+    for directory in dirs:
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    executables.setdefault(entry.name, []).append(entry.path)
+        except OSError:
+            continue
+
+    _PATH_INDEX.update(
+        path=path, dirs=_path_dir_signatures(dirs), executables=executables
+    )
+
+
+def find_executable(command):
+    """Return the full path of an executable on PATH, or None.
+
+    Lookups are answered from an index of the PATH directories. The index is
+    rebuilt when PATH changes, and on a miss when one of its directories changed
+    on disk (e.g. ~/.nix-profile/bin pointing at a new profile generation).
+    """
+    if os.sep in command:
+        return command if os.access(command, os.X_OK) else None
+
+    path = os.environ.get("PATH", os.defpath)
+    with _PATH_INDEX_LOCK:
+        for attempt in range(2):
+            if _PATH_INDEX["path"] != path:
+                _rebuild_path_index(path)
+
+            for candidate in _PATH_INDEX["executables"].get(command, []):
+                if os.access(candidate, os.X_OK) and not os.path.isdir(candidate):
+                    return candidate
+
+            dirs = _PATH_INDEX["dirs"]
+            if attempt > 0 or _path_dir_signatures(dirs) == dirs:
+                break
+            _PATH_INDEX["path"] = None
+
+    return None
 
 
 def command_exists(command, dry_run=False):
@@ -1767,35 +3721,431 @@ def command_exists(command, dry_run=False):
         # In dry-run mode, just assume the command might exist
         return False
 
-    try:
-        # Use 'which' instead of 'command -v' as it's more likely to be available
-        # as an actual executable rather than a shell builtin
-        result = subprocess.run(
-            ["which", command],
-            check=False,  # Don't raise exception on non-zero exit
-            capture_output=True,
-            text=True,
+    return find_executable(command) is not None
+
+
+def nix_base32(digest):
+    """Encode bytes in the base-32 variant Nix uses for store path hashes."""
+    length = (len(digest) * 8 - 1) // 5 + 1
+    chars = []
+    for n in range(length - 1, -1, -1):
+        byte, bit = divmod(n * 5, 8)
+        value = digest[byte] >> bit
+        if byte + 1 < len(digest):
+            value |= digest[byte + 1] << (8 - bit)
+        chars.append(NIX_BASE32_ALPHABET[value & 0x1F])
+    return "".join(chars)
+
+
+def flake_input_store_path(nar_hash):
+    """Return the store path a locked flake input with this narHash is fetched to.
+
+    Fetched inputs are fixed-output "source" paths, so the path follows from
+    the NAR hash alone, the same way Nix's makeFixedOutputPath computes it.
+    """
+    import base64
+
+    algorithm, encoded = nar_hash.split("-", 1)
+    digest = base64.b64decode(encoded).hex()
+    description = f"source:{algorithm}:{digest}:{NIX_STORE_DIR}:source"
+    full = hashlib.sha256(description.encode()).digest()
+    compressed = bytearray(20)
+    for index, byte in enumerate(full):
+        compressed[index % 20] ^= byte
+    return f"{NIX_STORE_DIR}/{nix_base32(compressed)}-source"
+
+
+def locked_flake_ref(locked, mirror=""):
+    """Build a flake reference that fetches exactly a flake.lock entry, or None.
+
+    The narHash is part of the reference, so Nix verifies the content and a
+    mirror can only ever serve the locked tree.
+    """
+    from urllib.parse import urlencode
+
+    kind = locked.get("type")
+    params = {"narHash": locked["narHash"]}
+    if kind == "github" and mirror:
+        url = (
+            f"tarball+{mirror.rstrip('/')}/{locked['owner']}/{locked['repo']}"
+            f"/archive/{locked['rev']}.tar.gz"
+        )
+    elif kind in ("github", "gitlab", "sourcehut"):
+        url = f"{kind}:{locked['owner']}/{locked['repo']}/{locked['rev']}"
+        if "host" in locked:
+            params["host"] = locked["host"]
+    elif kind in ("git", "hg"):
+        url = f"{kind}+{locked['url']}"
+        params.update(
+            (key, locked[key])
+            for key in ("rev", "ref", "submodules", "shallow")
+            if key in locked
         )
-        return result.returncode == 0
-    except FileNotFoundError:
-        # If 'which' is not available, try a different approach
+    elif kind in ("tarball", "file"):
+        url = f"{kind}+{locked['url']}"
+    elif kind == "path":
+        url = f"path:{locked['path']}"
+    else:
+        return None
+    return f"{url}{'&' if '?' in url else '?'}{urlencode(params)}"
+
+
+def flake_lock_inputs(lock_path):
+    """Return the distinct locked inputs of a flake.lock, transitive ones included.
+
+    Inputs are deduplicated by narHash, so a revision several inputs lock to
+    (e.g. nixpkgs pulled in by more than one flake) is listed once, with the
+    names of every node that uses it.
+    """
+    with open(lock_path, "r") as f:
+        lock = json.load(f)
+
+    inputs = {}
+    for name, node in lock.get("nodes", {}).items():
+        locked = node.get("locked")
+        if name == lock.get("root") or not locked or "narHash" not in locked:
+            continue
+        entry = inputs.setdefault(locked["narHash"], {"names": [], "locked": locked})
+        entry["names"].append(name)
+    return list(inputs.values())
+
+
+def prefetch_flake_input(entry, mirror=""):
+    """Fetch one locked input into the store, retrying transient failures."""
+    ref = locked_flake_ref(entry["locked"], mirror)
+    if ref is None:
+        return "unsupported", None
+
+    command = [
+        "nix",
+        "--extra-experimental-features",
+        "nix-command flakes",
+        "flake",
+        "prefetch",
+        "--json",
+        ref,
+    ]
+    policy = _phase_policy(current_phase())
+    for attempt in range(policy["retries"] + 1):
+        started = time.monotonic()
         try:
-            # Try with shutil.which which is a pure Python solution
-            import shutil
+            result = run_captured(command, timeout=None, text=True)
+            if result.returncode == 0:
+                return "fetched", None
+            error = subprocess.CalledProcessError(
+                result.returncode, command, output=result.stderr
+            )
+        except subprocess.TimeoutExpired as e:
+            error = e
+        remaining = deadline_remaining()
+        if (
+            attempt == policy["retries"]
+            or (remaining is not None and remaining <= 0)
+            or not is_transient_error(error)
+        ):
+            break
+        delay = backoff_delay(policy, attempt)
+        record_retry(time.monotonic() - started + delay)
+        time.sleep(delay)
 
-            return shutil.which(command) is not None
-        except Exception:
-            return False
+    output = getattr(error, "output", None) or str(error)
+    return "failed", output.strip().splitlines()[-1] if output.strip() else None
+
+
+def prefetch_flake_inputs(dry_run=False, jobs=DEFAULT_JOBS, mirror=FLAKE_INPUT_MIRROR):
+    """Fetch every input locked in flake.lock concurrently before evaluation.
+
+    Evaluation would otherwise fetch them lazily, one after another. Inputs
+    whose store path already exists are reported as cache hits and skipped.
+    Failures are only reported, as evaluation fetches whatever is missing.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    lock_path = os.path.join(DOTFILES_DIR, "flake.lock")
+    if not os.path.exists(lock_path) or not (dry_run or command_exists("nix")):
+        return
+
+    entries = flake_lock_inputs(lock_path)
+    missing = []
+    for entry in entries:
+        entry["label"] = ", ".join(sorted(entry["names"]))
+        entry["store_path"] = flake_input_store_path(entry["locked"]["narHash"])
+        if not os.path.exists(entry["store_path"]):
+            missing.append(entry)
+    cached = len(entries) - len(missing)
+
+    if dry_run:
+        console.print(
+            f"[bold yellow][DRY RUN][/bold yellow] Would prefetch {len(missing)} of "
+            f"{len(entries)} flake inputs ({cached} already in the store)"
+        )
+        return
+    if not missing:
+        console.print(
+            f"[green]All {len(entries)} flake inputs are already in the store.[/green]"
+        )
+        return
+
+    source = f" from {mirror}" if mirror else ""
+    console.print(
+        f"[bold]Prefetching {len(missing)} flake inputs{source} "
+        f"({cached} of {len(entries)} already in the store)...[/bold]"
+    )
+
+    @in_current_phase
+    def fetch(entry):
+        started = time.monotonic()
+        with span(f"prefetch {entry['label']}", "command") as record:
+            status, detail = prefetch_flake_input(entry, mirror)
+            record["status"] = status
+        return status, detail, time.monotonic() - started
+
+    start = time.monotonic()
+    counts = collections.Counter()
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="prefetch") as executor:
+        futures = {executor.submit(fetch, entry): entry for entry in missing}
+        for done, future in enumerate(as_completed(futures), 1):
+            entry = futures[future]
+            status, detail, elapsed = future.result()
+            counts[status] += 1
+            progress = f"[dim][{done}/{len(missing)}][/dim]"
+            if status == "fetched":
+                console.print(
+                    f"{progress} [green]Fetched[/green] {entry['label']} "
+                    f"[dim]({elapsed:.1f}s)[/dim]"
+                )
+            else:
+                reason = f": {detail}" if detail else ""
+                console.print(
+                    f"{progress} [yellow]Could not prefetch[/yellow] "
+                    f"{entry['label']} ({entry['locked']['type']}){reason}"
+                )
+
+    console.print(
+        f"[green]Flake inputs: {cached} cached, {counts['fetched']} fetched in "
+        f"{time.monotonic() - start:.1f}s, "
+        f"{len(missing) - counts['fetched']} left to evaluation.[/green]"
+    )
+
+
+def generation_fingerprint():
+    """Fingerprint everything home-manager switch evaluates, or None if unknown.
+
+    Tracked files are identified by the blob ids git already keeps in its
+    index, so only files modified in the working tree (e.g. by customization)
+    are read and hashed. Untracked files are left out, as flakes ignore them.
+    """
+    git = ["git", "-C", DOTFILES_DIR, "ls-files", "-z"]
+    try:
+        staged = run_captured([*git, "--stage", "--", *GENERATION_INPUTS])
+        modified = run_captured([*git, "--modified", "--", *GENERATION_INPUTS])
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return None
+    if staged.returncode != 0 or modified.returncode != 0:
+        return None
+
+    blobs = {}
+    for record in staged.stdout.split(b"\0"):
+        if record:
+            info, path = record.split(b"\t", 1)
+            blobs[path.decode()] = info.split()[1].decode()
+
+    for path in modified.stdout.decode().split("\0"):
+        if not path:
+            continue
+        try:
+            with open(os.path.join(DOTFILES_DIR, path), "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            blobs[path] = None
+            continue
+        # Same id git would give the file, so a merely stat-dirty file and a
+        # refreshed index produce the same fingerprint
+        header = f"blob {len(content)}\0".encode()
+        blobs[path] = hashlib.sha1(header + content).hexdigest()
+
+    return fingerprint(DOTFILES_DIR, blobs, USER_CONFIG)
+
+
+def active_home_manager_generation():
+    """Return the store path of the active Home Manager generation, or None."""
+    state_home = os.environ.get("XDG_STATE_HOME", os.path.expanduser("~/.local/state"))
+    profiles = [
+        os.path.join(state_home, "nix", "profiles", "home-manager"),
+        os.path.join("/nix/var/nix/profiles/per-user", CURRENT_USER, "home-manager"),
+    ]
+    for profile in profiles:
+        if os.path.islink(profile) and os.path.exists(profile):
+            return os.path.realpath(profile)
+
+    # Fall back to asking home-manager, e.g. for profiles in unusual places
+    try:
+        result = run_captured(["home-manager", "generations"], text=True)
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return None
+    lines = result.stdout.splitlines() if result.returncode == 0 else []
+    current = [line for line in lines if line.endswith("(current)")] or lines[:1]
+    if not current or " -> " not in current[0]:
+        return None
+    return current[0].split(" -> ", 1)[1].removesuffix("(current)").strip()
+
+
+def load_home_manager_state():
+    """Load the fingerprint and generation recorded by the last successful switch."""
+    try:
+        with open(HOME_MANAGER_STATE, "r") as f:
+            state = json.load(f)
+        if state.get("version") == 1:
+            return state
+    except (OSError, ValueError):
+        pass
+    return {"version": 1}
+
+
+def save_home_manager_state(generation_fp, generation):
+    """Atomically record the configuration fingerprint a generation was built from."""
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        tmp_path = f"{HOME_MANAGER_STATE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "version": 1,
+                    "fingerprint": generation_fp,
+                    "generation": generation,
+                    "applied_at": time.time(),
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        os.replace(tmp_path, HOME_MANAGER_STATE)
+    except OSError as e:
+        console.print(f"[yellow]Could not save Home Manager state: {e}[/yellow]")
+
+
+# Activation package build started in the background right after the clone
+SPECULATIVE_BUILD = {}
+
+
+def start_speculative_build():
+    """Start building the cloned configuration's activation package in the background.
+
+    The build reads the commit just cloned rather than the working tree, so
+    customization can edit files meanwhile. Most of the closure does not depend
+    on the user's answers, so the switch later finds it already in the store.
+    """
+    head = git_head(DOTFILES_DIR)
+    if head is None or not command_exists("nix"):
+        return
+
+    # The clone is shallow, which nix only accepts when told so
+    flake = (
+        f"git+file://{DOTFILES_DIR}?rev={head}&shallow=1"
+        f"#homeConfigurations.{DEFAULT_USER}.activationPackage"
+    )
+    command = [
+        "nix",
+        "--extra-experimental-features",
+        "nix-command flakes",
+        "build",
+        flake,
+        "--impure",
+        "--no-link",
+    ]
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        with open(SPECULATIVE_BUILD_LOG, "wb") as log:
+            process = subprocess.Popen(
+                command, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT
+            )
+    except OSError as e:
+        console.print(f"[yellow]Could not start the background build: {e}[/yellow]")
+        return
+
+    SPECULATIVE_BUILD.update(process=process, started=time.monotonic())
+    console.print(
+        "[dim]Building the configuration in the background "
+        f"(log: {SPECULATIVE_BUILD_LOG})...[/dim]"
+    )
 
 
-def apply_home_manager(dry_run=False):
-    """Applies the Home Manager configuration."""
+def finish_speculative_build(cancel=False):
+    """Wait for the background build, or stop it when ``cancel`` is set.
+
+    A failed or unfinished build is not an error: the switch then builds
+    whatever is missing itself. The wait is capped at a share of the phase's
+    remaining time, so a slow build never eats the switch's budget.
+    """
+    if not SPECULATIVE_BUILD:
+        return
+
+    job = dict(SPECULATIVE_BUILD)
+    SPECULATIVE_BUILD.clear()
+    process = job["process"]
+    if not cancel:
+        with console.status("[bold green]Waiting for the background build..."):
+            try:
+                limit = command_timeout()
+                process.wait(
+                    timeout=limit * SPECULATIVE_BUILD_WAIT_SHARE if limit else None
+                )
+            except subprocess.TimeoutExpired:
+                console.print(
+                    "[yellow]Background build is taking too long; "
+                    "the switch will finish it.[/yellow]"
+                )
+                cancel = True
+
+    if cancel and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        return
+
+    elapsed = time.monotonic() - job["started"]
+    if process.returncode == 0:
+        console.print(f"[green]Background build finished in {elapsed:.0f}s.[/green]")
+    else:
+        console.print(
+            f"[yellow]Background build failed (see {SPECULATIVE_BUILD_LOG}); "
+            "the switch will build the configuration itself.[/yellow]"
+        )
+
+
+def apply_home_manager(dry_run=False, force=False):
+    """Applies the Home Manager configuration.
+
+    The switch is skipped when nothing it evaluates changed since the last
+    successful one and the generation it produced is still active, unless
+    ``force`` is set.
+    """
     if dry_run:
         console.print(
             "[bold yellow][DRY RUN][/bold yellow] Would apply Home Manager configuration"
         )
         return
 
+    generation_fp = generation_fingerprint()
+    if not force and generation_fp is not None:
+        state = load_home_manager_state()
+        generation = state.get("generation")
+        if (
+            state.get("fingerprint") == generation_fp
+            and generation is not None
+            and active_home_manager_generation() == generation
+        ):
+            console.print(
+                f"[green]Home Manager configuration unchanged since {generation}; "
+                "skipping switch (use --force to apply anyway).[/green]"
+            )
+            finish_speculative_build(cancel=True)
+            return
+
+    finish_speculative_build()
     console.print("[bold]Applying Home Manager configuration...[/bold]")
     try:
         run_command(
@@ -1814,9 +4164,259 @@ def apply_home_manager(dry_run=False):
             f"[bold red]Error applying Home Manager configuration: {e}[/bold red]"
         )
         sys.exit(1)
+
+    generation = active_home_manager_generation()
+    if generation_fp is not None and generation is not None:
+        save_home_manager_state(generation_fp, generation)
     console.print("[green]Dotfiles applied successfully![/green]")
 
 
+def fingerprint(*parts):
+    """Hash JSON-serializable inputs into a short, stable fingerprint."""
+    payload = json.dumps(parts, sort_keys=True, default=str).encode()
+    return hashlib.sha256(payload).hexdigest()
+
+
+def load_install_journal():
+    """Load the checkpoints recorded by previous install runs."""
+    try:
+        with open(INSTALL_JOURNAL, "r") as f:
+            journal = json.load(f)
+        if journal.get("version") == 1:
+            return journal
+    except (OSError, ValueError):
+        pass
+    return {"version": 1, "steps": {}}
+
+
+def save_install_journal(journal):
+    """Atomically persist the install journal."""
+    try:
+        # Serialize first so an unserializable value never leaves a partial file
+        payload = json.dumps(journal, indent=2, sort_keys=True)
+        os.makedirs(STATE_DIR, exist_ok=True)
+        tmp_path = f"{INSTALL_JOURNAL}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(payload)
+        os.replace(tmp_path, INSTALL_JOURNAL)
+    except (OSError, TypeError, ValueError) as e:
+        console.print(f"[yellow]Could not save install journal: {e}[/yellow]")
+
+
+def journal_checkpoint_valid(journal, name, step_fingerprint):
+    """Check whether a step was completed by a previous run with the same inputs."""
+    entry = journal["steps"].get(name) if journal else None
+    return bool(entry) and entry.get("fingerprint") == step_fingerprint
+
+
+def add_step(
+    steps,
+    name,
+    func,
+    deps=(),
+    after=(),
+    fingerprint=None,
+    verify=None,
+    restore=None,
+    interactive=False,
+):
+    """Register an install step and the steps it depends on.
+
+    Every step in ``deps`` must already be registered; steps in ``after`` are
+    waited for only if this run registered them. ``interactive`` steps use the
+    terminal (prompts, sudo) and never run at the same time as each other.
+
+    Steps with a ``fingerprint`` callable are checkpointed in the install
+    journal. On a later run they are skipped when the fingerprint still matches,
+    ``verify`` (if given) confirms the result is still in place, and none of
+    their dependencies had to run again. ``restore`` receives the value the step
+    returned last time so skipped steps can reinstate their in-memory results.
+    """
+    unknown = [dep for dep in deps if dep not in steps]
+    if unknown:
+        raise ValueError(f"Step '{name}' depends on unknown steps: {', '.join(unknown)}")
+    steps[name] = {
+        "func": func,
+        "deps": list(deps) + [dep for dep in after if dep in steps],
+        "fingerprint": fingerprint,
+        "verify": verify,
+        "restore": restore,
+        "interactive": interactive,
+    }
+
+
+def run_step_graph(steps, jobs=DEFAULT_JOBS, journal=None, timings=None):
+    """Run install steps on a thread pool, starting each once its dependencies finish.
+
+    Steps without a dependency between them run concurrently, except that only
+    one interactive step runs at a time. The first failure (including a
+    ``SystemExit`` raised by ``cleanup``) is re-raised in the caller once the
+    commands of the other running steps were terminated.
+    When a ``journal`` is given, completed steps are checkpointed in it as they
+    finish and steps checkpointed by a previous run are skipped.
+    Returns a mapping of step name to its ``start``/``end`` offsets in seconds;
+    pass ``timings`` to keep the offsets of a run that fails.
+    """
+    from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+    timings = {} if timings is None else timings
+    pending = dict(steps)
+    running = {}
+    completed = set()
+    executed = set()
+    fingerprints = {}
+    graph_start = time.monotonic()
+
+    def run_step(name, func):
+        timings[name] = {"start": time.monotonic() - graph_start}
+        _EXECUTION.interactive = steps[name]["interactive"]
+        try:
+            with execution_phase(name), span(name, "phase"):
+                return func()
+        finally:
+            timings[name]["end"] = time.monotonic() - graph_start
+
+    def try_resume(name, step):
+        if journal is None or step["fingerprint"] is None:
+            return False
+        fingerprints[name] = step["fingerprint"]()
+        if any(dep in executed for dep in step["deps"]):
+            return False
+        if not journal_checkpoint_valid(journal, name, fingerprints[name]):
+            return False
+        if step["verify"] is not None and not step["verify"]():
+            return False
+        if step["restore"] is not None:
+            step["restore"](journal["steps"][name].get("result"))
+        console.print(f"[green]Resuming: skipping completed step '{name}'.[/green]")
+        return True
+
+    def start_step(name, func):
+        # Daemon threads: a step blocked on a prompt must not keep a failed
+        # install from exiting
+        future = Future()
+
+        def target():
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(run_step(name, func))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=target, name=f"step-{name}", daemon=True).start()
+        return future
+
+    def terminal_busy():
+        return any(steps[name]["interactive"] for name in running.values())
+
+    try:
+        while pending or running:
+            # Resumed steps complete instantly and may unblock others, so keep
+            # scheduling until nothing else can start
+            progressed = True
+            while progressed and len(running) < jobs:
+                progressed = False
+                for name, step in list(pending.items()):
+                    if len(running) >= jobs:
+                        break
+                    if step["interactive"] and terminal_busy():
+                        continue
+                    if all(dep in completed for dep in step["deps"]):
+                        del pending[name]
+                        progressed = True
+                        if try_resume(name, step):
+                            completed.add(name)
+                        else:
+                            running[start_step(name, step["func"])] = name
+
+            if not running:
+                if pending:
+                    raise RuntimeError(
+                        f"Install steps have unsatisfiable dependencies: {', '.join(pending)}"
+                    )
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                result = future.result()
+                completed.add(name)
+                executed.add(name)
+
+                if journal is not None and name in fingerprints:
+                    try:
+                        json.dumps(result)
+                    except (TypeError, ValueError):
+                        console.print(
+                            f"[yellow]Not checkpointing step '{name}': "
+                            "its result cannot be saved.[/yellow]"
+                        )
+                        continue
+                    journal["steps"][name] = {
+                        "fingerprint": fingerprints[name],
+                        "completed_at": time.time(),
+                        "result": result,
+                    }
+                    save_install_journal(journal)
+    finally:
+        if running:
+            # A step failed: stop the commands of the others before exiting
+            terminate_active_processes()
+            wait(running, timeout=STEP_SHUTDOWN_TIMEOUT)
+
+    return timings
+
+
+def critical_path(steps, timings):
+    """Return the chain of steps that determined the total run time."""
+    if not timings:
+        return []
+
+    name = max(timings, key=lambda step: timings[step]["end"])
+    path = [name]
+    while True:
+        deps = [dep for dep in steps[name]["deps"] if dep in timings]
+        if not deps:
+            break
+        name = max(deps, key=lambda dep: timings[dep]["end"])
+        path.append(name)
+
+    return path[::-1]
+
+
+def print_step_summary(steps, timings):
+    """Print how long each step took and which of them formed the critical path."""
+    from rich.table import Table
+
+    path = critical_path(steps, timings)
+
+    table = Table(show_header=True, title="Install Steps")
+    table.add_column("Step", style="magenta")
+    table.add_column("Start", justify="right")
+    table.add_column("Duration", justify="right")
+    table.add_column("Retries", justify="right")
+    table.add_column("Retry time", justify="right")
+    table.add_column("Critical", justify="center", style="bold yellow")
+
+    for name, timing in sorted(timings.items(), key=lambda item: item[1]["start"]):
+        retries = RETRY_STATS.get(name, {"retries": 0, "seconds": 0.0})
+        table.add_row(
+            name,
+            f"{timing['start']:.1f}s",
+            f"{timing['end'] - timing['start']:.1f}s",
+            str(retries["retries"]) if retries["retries"] else "",
+            f"{retries['seconds']:.1f}s" if retries["retries"] else "",
+            "*" if name in path else "",
+        )
+
+    console.print(table)
+    if path:
+        total = timings[path[-1]]["end"]
+        console.print(
+            f"[bold]Critical path:[/bold] {' -> '.join(path)} [dim]({total:.1f}s)[/dim]"
+        )
+
+
 def handle_exit_signal(signum, frame):
     """Handle exit signals by cleaning up and deleting the script."""
     console.print("\n[bold red]Received termination signal. Cleaning up...[/bold red]")
@@ -1866,6 +4466,9 @@ def is_run_from_install_sh():
 
 def cleanup(exit_code=0):
     """Clean up by deleting the script and exiting with the specified code."""
+    GITHUB_AUTH_CANCELLED.set()
+    finish_speculative_build(cancel=True)
+
     script_path = os.path.abspath(__file__)
 
     # Only delete the script if we're being run from install.sh
@@ -1875,6 +4478,10 @@ def cleanup(exit_code=0):
         # If anything goes wrong detecting the source, assume we're not from install.sh
         is_from_installer = False
 
+    # A cached installer bundle is reused by later runs, so never delete it
+    if os.environ.get("DOTFILES_INSTALLER_BUNDLE") == "true":
+        is_from_installer = False
+
     if is_from_installer:
         console.print(
             f"[bold red]Installation failed! Removing script: {script_path}[/bold red]"
@@ -1892,26 +4499,416 @@ def cleanup(exit_code=0):
     sys.exit(exit_code)
 
 
-@app.command()
+def profile_startup():
+    """Print where interpreter start and module import time goes, like -X importtime.
+
+    Returns a non-zero exit code when loading the script takes longer than
+    STARTUP_BUDGET_MS over a bare interpreter start.
+    """
+    script = os.path.abspath(__file__)
+    load = f"import runpy; runpy.run_path({script!r})"
+
+    def fastest(code):
+        times = []
+        for _ in range(STARTUP_SAMPLES):
+            start = time.perf_counter()
+            run_captured([sys.executable, "-c", code])
+            times.append((time.perf_counter() - start) * 1000)
+        return min(times)
+
+    result = run_captured([sys.executable, "-X", "importtime", "-c", load], text=True)
+    interpreter_ms = fastest("pass")
+    total_ms = fastest(load)
+    script_ms = total_ms - interpreter_ms
+
+    # Attribute cumulative time to the top-level package that pulled it in
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.startswith("  "):
+            continue  # Nested import, already counted by its parent
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(cumulative) / 1000
+
+    print(f"{'package':<24} {'import ms':>10}")
+    for package, ms in sorted(packages.items(), key=lambda item: -item[1])[:15]:
+        print(f"{package:<24} {ms:>10.1f}")
+    print(
+        f"\nstartup: {total_ms:.1f} ms = interpreter {interpreter_ms:.1f} ms + "
+        f"script {script_ms:.1f} ms (imports {sum(packages.values()):.1f} ms, "
+        f"budget {STARTUP_BUDGET_MS} ms)"
+    )
+
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        return result.returncode
+    return 0 if script_ms <= STARTUP_BUDGET_MS else 1
+
+
+FLEET_REPORT_PREFIX = "DOTFILES_REPORT "
+# Runs the installer shipped on stdin (a tar of install.py and the answer file)
+FLEET_REMOTE_SCRIPT = (
+    'd=$(mktemp -d) && tar -x -C "$d" && cd "$d" && '
+    "if command -v uv >/dev/null 2>&1; then run='uv run'; else run=python3; fi && "
+    "DOTFILES_REPORT=1 $run install.py install {args}; "
+    'status=$?; rm -rf "$d"; exit $status'
+)
+
+
+def emit_install_report(status, timings, error=None):
+    """Print a machine-readable summary line for the fleet command to collect."""
+    if os.environ.get("DOTFILES_REPORT") != "1":
+        return
+    report = {
+        "status": status,
+        "host": platform.node(),
+        "phases": {
+            name: round(timing.get("end", timing["start"]) - timing["start"], 3)
+            for name, timing in timings.items()
+        },
+        "retries": {phase: stats["retries"] for phase, stats in RETRY_STATS.items()},
+        "error": error,
+    }
+    print(f"{FLEET_REPORT_PREFIX}{json.dumps(report)}", flush=True)
+
+
+def _fleet_payload(config):
+    """Tar up this script and the answer file for a remote target."""
+    import io
+    import tarfile
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        tar.add(os.path.abspath(__file__), arcname="install.py")
+        if config:
+            tar.add(config, arcname="user.toml")
+    return buffer.getvalue()
+
+
+def _fleet_local(target, install_args, config):
+    """Install into a separate HOME on this machine."""
+    home = os.path.abspath(os.path.expanduser(target))
+    os.makedirs(home, exist_ok=True)
+    env = {
+        **os.environ,
+        "HOME": home,
+        "XDG_STATE_HOME": os.path.join(home, ".local", "state"),
+        # Targets share the artifact store; it is content-addressed and locked
+        "XDG_CACHE_HOME": os.path.dirname(CACHE_DIR),
+        "DOTFILES_REPORT": "1",
+    }
+    args = install_args + (["--config", os.path.abspath(config)] if config else [])
+    return [sys.executable, os.path.abspath(__file__), "install", *args], env, None
+
+
+def _fleet_remote(prefix, script_flags=()):
+    """Build a runner that ships the installer to a command prefix over stdin."""
+
+    def runner(target, install_args, config):
+        args = install_args + (["--config", "user.toml"] if config else [])
+        script = FLEET_REMOTE_SCRIPT.format(args=shlex.join(args))
+        command = [*shlex.split(prefix()), target, *script_flags, script]
+        return command, None, _fleet_payload(config)
+
+    return runner
+
+
+# kind -> runner(target, install_args, config) returning (argv, env, stdin bytes).
+# Remote runners call their command prefix with the target and a shell script,
+# so any stand-in accepting "TARGET SCRIPT" can replace ssh.
+FLEET_RUNNERS = {
+    "local": _fleet_local,
+    "ssh": _fleet_remote(
+        lambda: os.environ.get("DOTFILES_FLEET_SSH", "ssh -o BatchMode=yes")
+    ),
+    "docker": _fleet_remote(
+        lambda: os.environ.get("DOTFILES_FLEET_DOCKER", "docker run --rm -i")
+        + " --entrypoint sh",
+        script_flags=("-c",),
+    ),
+}
+# Local targets share this machine's Nix install and daemon, so they run one at
+# a time; only remote targets install in parallel
+_FLEET_LOCAL_LOCK = threading.Lock()
+
+
+def fleet_target_key(spec):
+    """Identify a target, so one spelled two ways is still a duplicate."""
+    kind, _, target = spec.partition(":")
+    if kind == "local":
+        return f"local:{os.path.abspath(os.path.expanduser(target))}"
+    return spec
+
+
+def run_fleet_target(spec, install_args, config):
+    """Run one install and return its report, streaming output prefixed by target."""
+    from rich.text import Text
+
+    kind, _, target = spec.partition(":")
+    start = time.monotonic()
+    report = {}
+
+    def on_line(stream, timestamp, line):
+        if line.startswith(FLEET_REPORT_PREFIX):
+            with contextlib.suppress(ValueError):
+                report.update(json.loads(line.removeprefix(FLEET_REPORT_PREFIX)))
+            return
+        console.print(Text(f"[{spec}] ", style="cyan") + Text.from_ansi(line))
+
+    process = None
+    try:
+        command, env, payload = FLEET_RUNNERS[kind](target, install_args, config)
+        with _FLEET_LOCAL_LOCK if kind == "local" else contextlib.nullcontext():
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE if payload is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=env,
+            )
+            if payload is not None:
+                # Feed the payload from a thread so a chatty target cannot deadlock us
+                def feed():
+                    with contextlib.suppress(OSError):
+                        process.stdin.write(payload)
+                        process.stdin.close()
+
+                threading.Thread(target=feed, daemon=True).start()
+            tail = stream_process_output(process, on_line)
+        returncode = process.returncode
+    except BaseException as e:
+        # SystemExit included: a helper that calls cleanup() fails only this target
+        if process is not None and process.poll() is None:
+            process.kill()
+        tail, returncode = [], None
+        error = f"exited with code {e.code}" if isinstance(e, SystemExit) else str(e)
+        report.setdefault("error", error or type(e).__name__)
+
+    if not report.get("status"):
+        report["status"] = "failed"
+        report.setdefault(
+            "error",
+            (tail[-1][2] if tail else None) or f"exited with code {returncode}",
+        )
+    elif returncode != 0 and report["status"] == "ok":
+        report.update(status="failed", error=f"exited with code {returncode}")
+    report.update(target=spec, duration=time.monotonic() - start)
+    return report
+
+
+def print_fleet_summary(reports, wall_time):
+    """Print per-target status and phase timings for a fleet run."""
+    from rich.table import Table
+
+    phases = list(dict.fromkeys(p for r in reports for p in r.get("phases", {})))
+    table = Table(show_header=True, title="Fleet")
+    table.add_column("Target", style="magenta")
+    table.add_column("Status")
+    table.add_column("Total", justify="right")
+    for phase in phases:
+        table.add_column(phase, justify="right")
+    table.add_column("Error", style="red", no_wrap=True, overflow="ellipsis")
+
+    for report in reports:
+        ok = report["status"] == "ok"
+        table.add_row(
+            report["target"],
+            "[green]ok[/green]" if ok else "[red]failed[/red]",
+            f"{report['duration']:.1f}s",
+            *(
+                f"{report['phases'][phase]:.1f}s"
+                if phase in report.get("phases", {})
+                else ""
+                for phase in phases
+            ),
+            "" if ok else str(report.get("error") or ""),
+        )
+
+    console.print(table)
+    slowest = max((r["duration"] for r in reports), default=0.0)
+    console.print(
+        f"[bold]{sum(r['status'] == 'ok' for r in reports)}/{len(reports)} targets "
+        f"succeeded[/bold] in {wall_time:.1f}s [dim](slowest target {slowest:.1f}s, "
+        f"sum {sum(r['duration'] for r in reports):.1f}s)[/dim]"
+    )
+
+
+@cli_command
+def fleet(
+    targets: list[str] = cli_argument(
+        None,
+        help="Targets as local:HOME_DIR, docker:IMAGE or ssh:[USER@]HOST.",
+    ),
+    targets_file: str = cli_option(
+        None, help="File with one target per line; # starts a comment."
+    ),
+    config: str = cli_option(
+        None, "--config", help="TOML answer file passed to every install."
+    ),
+    jobs: int = cli_option(
+        DEFAULT_JOBS, "--jobs", "-j", min=1, help="Targets to install at the same time."
+    ),
+    dry_run: bool = cli_option(False, help="Run every install as a dry run."),
+):
+    """Install on many targets in parallel and summarize the results.
+
+    Local targets share this machine's Nix install, so they run one at a
+    time. Set DOTFILES_FLEET_SSH or DOTFILES_FLEET_DOCKER to replace the ssh
+    or docker command, e.g. with a local stand-in for testing.
+    """
+    import concurrent.futures
+
+    import typer
+
+    specs = list(targets or [])
+    if targets_file:
+        with open(targets_file, "r") as f:
+            specs += [
+                line.split("#", 1)[0].strip()
+                for line in f
+                if line.split("#", 1)[0].strip()
+            ]
+
+    invalid = [spec for spec in specs if spec.partition(":")[0] not in FLEET_RUNNERS]
+    if not specs or invalid:
+        kinds = ", ".join(f"{kind}:..." for kind in FLEET_RUNNERS)
+        console.print(
+            f"[bold red]Expected targets like {kinds}"
+            f"{'; got ' + ', '.join(invalid) if invalid else ''}[/bold red]"
+        )
+        raise typer.Exit(2)
+    keys = [fleet_target_key(spec) for spec in specs]
+    duplicates = sorted({spec for spec, key in zip(specs, keys) if keys.count(key) > 1})
+    if duplicates:
+        console.print(
+            f"[bold red]Each target may only be given once; repeated: "
+            f"{', '.join(duplicates)}[/bold red]"
+        )
+        raise typer.Exit(2)
+    if config:
+        _, errors = load_answer_file(config)
+        if errors:
+            console.print(f"[bold red]Invalid answer file {config}:[/bold red]")
+            for error in errors:
+                console.print(f"  [red]- {error}[/red]")
+            raise typer.Exit(2)
+
+    install_args = ["--dry-run"] if dry_run else []
+    if not config:
+        install_args.append("--skip-customization")
+
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=jobs, thread_name_prefix="fleet"
+    ) as executor:
+        reports = list(
+            executor.map(
+                in_current_phase(
+                    lambda spec: run_fleet_target(spec, install_args, config)
+                ),
+                specs,
+            )
+        )
+
+    print_fleet_summary(reports, time.monotonic() - start)
+    if any(report["status"] != "ok" for report in reports):
+        raise typer.Exit(1)
+
+
+@cli_command
+def status():
+    """Report what is installed, without prompting or touching the network.
+
+    ``install.py status`` runs without importing typer, see main.
+    """
+    # Reuse the cached Nix environment so a fresh shell still finds nix
+    for profile in NIX_PROFILE_PATHS:
+        if os.path.exists(profile):
+            delta = load_cached_profile_delta(profile)
+            if delta:
+                apply_environment_delta(delta)
+            break
+
+    checks = {
+        "nix": find_executable("nix"),
+        "home-manager": find_executable("home-manager"),
+        "dotfiles": DOTFILES_DIR if os.path.isdir(DOTFILES_DIR) else None,
+    }
+    for name, value in checks.items():
+        print(f"{name + ':':<14} {value or 'missing'}")
+
+    head = git_head(DOTFILES_DIR) if checks["dotfiles"] else None
+    print(f"{'revision:':<14} {head or 'unknown'}")
+
+    journal = load_install_journal()
+    completed = sorted(journal["steps"])
+    state = "complete" if journal.get("status") == "complete" else "resumable"
+    print(
+        f"{'checkpoints:':<14} {', '.join(completed) or 'none'}"
+        + (f" ({state})" if completed else "")
+    )
+
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+@cli_command
 def install(
-    repo_url: str = typer.Option(REPO_URL, help="The URL of the dotfiles repository."),
-    dotfiles_dir: str = typer.Option(
+    repo_url: str = cli_option(REPO_URL, help="The URL of the dotfiles repository."),
+    dotfiles_dir: str = cli_option(
         DOTFILES_DIR, help="The directory to clone the dotfiles into."
     ),
-    impure: bool = typer.Option(True, help="Use the --impure flag for home-manager."),
-    skip_customization: bool = typer.Option(False, help="Skip the customization step."),
-    customize: bool = typer.Option(
+    impure: bool = cli_option(True, help="Use the --impure flag for home-manager."),
+    skip_customization: bool = cli_option(False, help="Skip the customization step."),
+    customize: bool = cli_option(
         False, help="Force customization regardless of username."
     ),
-    dry_run: bool = typer.Option(
+    dry_run: bool = cli_option(
         False, help="Perform a dry run without making any changes."
     ),
-    standalone: bool = typer.Option(
+    standalone: bool = cli_option(
         False, help="Use standalone installation for Home Manager."
     ),
+    jobs: int = cli_option(
+        DEFAULT_JOBS,
+        "--jobs",
+        "-j",
+        min=1,
+        help="Number of independent install steps to run at the same time.",
+    ),
+    fresh: bool = cli_option(
+        False, help="Ignore checkpoints from previous runs and start over."
+    ),
+    config: str = cli_option(
+        None,
+        "--config",
+        help="TOML answer file with the customization settings; never prompts.",
+    ),
+    trace: str = cli_option(
+        None,
+        "--trace",
+        help="Write a Chrome trace of every phase and command to this JSON file.",
+    ),
+    force: bool = cli_option(
+        False,
+        help="Run home-manager switch even if the configuration did not change.",
+    ),
+    input_mirror: str = cli_option(
+        FLAKE_INPUT_MIRROR,
+        help="Fetch locked GitHub flake inputs from this mirror, which serves "
+        "OWNER/REPO/archive/REV.tar.gz (file:// URLs work too).",
+    ),
+    speculative_build: bool = cli_option(
+        None,
+        "--speculative-build/--no-speculative-build",
+        help="Build the configuration in the background while questions are "
+        "answered. Defaults to on when prompting.",
+    ),
 ):
     """Installs Nix, Home Manager, and applies the dotfiles configuration."""
-    global REPO_URL, DOTFILES_DIR
+    global REPO_URL, DOTFILES_DIR, NON_INTERACTIVE
     REPO_URL = repo_url
     DOTFILES_DIR = dotfiles_dir
 
@@ -1919,6 +4916,10 @@ def install(
     signal.signal(signal.SIGINT, handle_exit_signal)  # Ctrl+C
     signal.signal(signal.SIGTERM, handle_exit_signal)  # Termination signal
 
+    timings = {}
+    if trace:
+        start_tracing()
+
     try:
         # Check for incompatible flags
         if skip_customization and customize:
@@ -1926,32 +4927,189 @@ def install(
                 "[bold red]Error: --skip-customization and --customize cannot be used together.[/bold red]"
             )
             cleanup(1)
+        if skip_customization and config:
+            console.print(
+                "[bold red]Error: --skip-customization and --config cannot be used together.[/bold red]"
+            )
+            cleanup(1)
+
+        # Validate the whole answer file before anything is installed
+        answers = None
+        if config:
+            answers, errors = load_answer_file(config)
+            if errors:
+                console.print(f"[bold red]Invalid answer file {config}:[/bold red]")
+                for error in errors:
+                    console.print(f"  [red]- {error}[/red]")
+                cleanup(1)
+            NON_INTERACTIVE = True
 
         if dry_run:
             console.print(
                 "[bold yellow]Running in DRY RUN mode. No changes will be made.[/bold yellow]"
             )
 
+        # Checkpoints from an earlier, interrupted run let a retry resume where
+        # it stopped; after a complete run everything is asked and checked again
+        journal = previous_journal = None
+        if not dry_run:
+            previous_journal = load_install_journal()
+            interrupted = previous_journal.get("status") != "complete"
+            journal = (
+                previous_journal
+                if interrupted and not fresh
+                else {"version": 1, "steps": {}}
+            )
+
+        steps = {}
+
         # Pass dry_run parameter to command_exists
-        if not command_exists("nix", dry_run=dry_run):
-            install_nix(dry_run=dry_run)
-
-        # Check if home-manager needs to be installed
-        if not command_exists("home-manager", dry_run=dry_run) and not dry_run:
-            if standalone:
-                # Use standalone method if explicitly requested
-                install_home_manager_standalone(dry_run=dry_run)
-            else:
-                install_home_manager(dry_run=dry_run)
+        nix_available = command_exists("nix", dry_run=dry_run)
+        if (
+            not nix_available
+            and journal_checkpoint_valid(
+                previous_journal, "nix", fingerprint(platform.system())
+            )
+        ):
+            # Nix was installed by a previous run but is not on PATH in this shell yet
+            nix_available = source_nix_profile()
+
+        if not nix_available:
+            # The download does not need anything else, so it overlaps the clone
+            nix_installer = {}
+            add_step(
+                steps,
+                "nix-download",
+                lambda: nix_installer.update(path=download_nix_installer(dry_run)),
+            )
+            add_step(
+                steps,
+                "nix",
+                lambda: install_nix(dry_run, install_script_path=nix_installer["path"]),
+                deps=["nix-download"],
+                fingerprint=lambda: fingerprint(platform.system()),
+                verify=lambda: command_exists("nix"),
+                interactive=True,  # Falls back to sudo, which may ask for a password
+            )
+
+        def install_home_manager_step():
+            # Check if home-manager needs to be installed
+            if not command_exists("home-manager", dry_run=dry_run) and not dry_run:
+                if standalone:
+                    # Use standalone method if explicitly requested
+                    install_home_manager_standalone(dry_run=dry_run)
+                else:
+                    install_home_manager(dry_run=dry_run)
+
+        add_step(
+            steps,
+            "home-manager",
+            install_home_manager_step,
+            after=["nix"],
+            fingerprint=lambda: fingerprint(standalone),
+            verify=lambda: command_exists("home-manager"),
+            interactive=True,  # The channel method falls back to sudo
+        )
+        add_step(
+            steps,
+            "clone",
+            lambda: clone_dotfiles(dry_run=dry_run),
+            fingerprint=lambda: fingerprint(REPO_URL, DOTFILES_DIR),
+            verify=lambda: os.path.isdir(os.path.join(DOTFILES_DIR, ".git")),
+        )
+
+        if customize or not skip_customization:
+            # Prompting (and SSH/GPG key discovery) only needs the user, not the repo
+            customization = {}
 
-        clone_dotfiles(dry_run=dry_run)
+            def user_info_step():
+                if answers is not None:
+                    configure_from_answers(answers)
+                    customization["apply"] = True
+                else:
+                    customization["apply"] = prompt_customization(
+                        force_customize=customize
+                    )
+                # The key generated during the remaining prompts has to be in
+                # the checkpoint, so wait for it before taking the snapshot
+                signing_key = wait_for_signing_key()
+                return {
+                    "apply": customization["apply"],
+                    "config": dict(USER_CONFIG),
+                    "signing_key": signing_key,
+                }
+
+            def restore_user_info(result):
+                customization["apply"] = result["apply"]
+                USER_CONFIG.update(result["config"])
+
+            def customize_step():
+                if customization.get("apply"):
+                    apply_customization(dry_run=dry_run)
+
+            add_step(
+                steps,
+                "user-info",
+                user_info_step,
+                fingerprint=lambda: fingerprint(CURRENT_USER, customize, answers),
+                restore=restore_user_info,
+                interactive=answers is None,
+            )
+            add_step(
+                steps,
+                "customize",
+                customize_step,
+                deps=["clone", "user-info"],
+                fingerprint=lambda: fingerprint(
+                    customization.get("apply"), USER_CONFIG, git_head(DOTFILES_DIR)
+                ),
+            )
+
+        # Fetch every locked input up front instead of lazily during evaluation
+        add_step(
+            steps,
+            "prefetch",
+            lambda: prefetch_flake_inputs(dry_run, jobs=jobs, mirror=input_mirror),
+            deps=["clone"],
+            after=["nix"],
+        )
+
+        if speculative_build is None:
+            # Only worth it when there is prompting time for the build to hide in
+            speculative_build = not NON_INTERACTIVE and (
+                customize or not skip_customization
+            )
+        if speculative_build and not dry_run:
+            add_step(
+                steps,
+                "speculative-build",
+                start_speculative_build,
+                deps=["clone", "prefetch"],
+                after=["nix"],
+            )
+
+        add_step(
+            steps,
+            "apply",
+            lambda: apply_home_manager(dry_run=dry_run, force=force),
+            deps=["home-manager", "clone", "prefetch"],
+            after=["customize", "speculative-build"],
+        )
 
-        if customize:
-            customize_dotfiles(dry_run=dry_run, force_customize=True)
-        elif not skip_customization:
-            customize_dotfiles(dry_run=dry_run)
+        with span("install", "install", jobs=jobs, dry_run=dry_run) as record:
+            run_step_graph(steps, jobs=jobs, journal=journal, timings=timings)
+            if journal is not None:
+                journal["status"] = "complete"
+                save_install_journal(journal)
 
-        apply_home_manager(dry_run=dry_run)
+            # Steps ran on other threads; charge every child of this process here
+            import resource
+
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            record["child_cpu_s"] = usage.ru_utime + usage.ru_stime
+            record["child_max_rss_kb"] = usage.ru_maxrss
+        print_step_summary(steps, timings)
+        emit_install_report("ok", timings)
 
         if dry_run:
             console.print(
@@ -1960,13 +5118,93 @@ def install(
 
     except Exception as e:
         console.print(f"[bold red]Installation failed with error: {e}[/bold red]")
+        emit_install_report("failed", timings, error=str(e))
         if not dry_run:
             cleanup(1)
+    finally:
+        # Also runs when cleanup exits, so failed installs leave a trace too
+        if trace:
+            write_trace(trace)
+
+
+def build_app():
+    """Create the typer app for the registered commands, importing typer now."""
+    import functools
+    import inspect
+
+    import typer
+
+    app = typer.Typer()
+
+    def run_profile_startup(value):
+        if value:
+            raise typer.Exit(profile_startup())
+
+    @app.callback()
+    def options(
+        profile: bool = typer.Option(
+            False,
+            "--profile-startup",
+            callback=run_profile_startup,
+            is_eager=True,
+            help="Show where startup time goes and exit non-zero when loading the "
+            f"script takes over {STARTUP_BUDGET_MS} ms.",
+        ),
+    ):
+        """Install the dotfiles. Options given without a command go to install."""
+
+    for func in CLI_COMMANDS:
+        signature = inspect.signature(func)
+        parameters = [
+            param.replace(
+                default=getattr(typer, param.default.kind)(
+                    *param.default.args, **param.default.kwargs
+                )
+            )
+            if isinstance(param.default, CliParameter)
+            else param
+            for param in signature.parameters.values()
+        ]
+
+        @functools.wraps(func)
+        def command(*args, func=func, **kwargs):
+            return func(*args, **kwargs)
+
+        command.__signature__ = signature.replace(parameters=parameters)
+        app.command()(command)
+    return app
+
+
+def main():
+    """Run the CLI, defaulting to the install command when none is given.
+
+    ``--profile-startup`` and a bare ``status`` are answered before typer is
+    imported, so they measure and report without paying for it.
+    """
+    args = sys.argv[1:]
+    if args == ["--profile-startup"]:
+        sys.exit(profile_startup())
+    if args == ["status"]:
+        status()
+        sys.exit(0)
+
+    commands = {func.__name__.replace("_", "-") for func in CLI_COMMANDS}
+    top_level = {
+        "--help",
+        "--install-completion",
+        "--show-completion",
+        "--profile-startup",
+    }
+    if not args or args[0] not in commands | top_level:
+        # Keep `install.py --customize` working now that there are subcommands
+        sys.argv.insert(1, "install")
+
+    build_app()()
 
 
 if __name__ == "__main__":
     try:
-        app()
+        main()
     except Exception as e:
         console.print(f"[bold red]Fatal error: {e}[/bold red]")
         cleanup(1)
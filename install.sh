@@ -9,6 +9,53 @@ INSTALL_PY_URL="${REPO_URL}/raw/main/install.py"
 # Set environment variable to indicate script is being run from installer
 export FROM_DOTFILES_INSTALLER="true"
 
+# Optional pinned installer bundle (built with `just bundle-installer`).
+# When a checksum is given the bundle is verified, cached, and run without uv.
+BUNDLE_URL="${DOTFILES_INSTALLER_BUNDLE_URL:-}"
+BUNDLE_SHA256="${DOTFILES_INSTALLER_BUNDLE_SHA256:-}"
+BUNDLE_CACHE_DIR="${XDG_CACHE_HOME:-$HOME/.cache}/dotfiles/installer"
+
+# Function to find a Python that can run the bundle
+get_bundle_python() {
+  if command -v python3 &> /dev/null &&
+    python3 -c 'import sys; sys.exit(sys.version_info < (3, 12))'; then
+    echo "python3"
+    return 0
+  elif UV_PATH=$(get_uv_path) && "$UV_PATH" python find --offline 3.12 2> /dev/null; then
+    return 0
+  fi
+  return 1
+}
+
+# Function to fetch, verify and unpack the bundle into the cache
+fetch_bundle() {
+  local bundle_dir="$1"
+  local archive="${BUNDLE_CACHE_DIR}/${BUNDLE_SHA256}.tar.gz"
+
+  if [ -z "${BUNDLE_URL}" ]; then
+    echo "Installer bundle ${BUNDLE_SHA256} is not cached and DOTFILES_INSTALLER_BUNDLE_URL is not set."
+    return 1
+  fi
+
+  mkdir -p "${BUNDLE_CACHE_DIR}"
+  echo "Downloading installer bundle from ${BUNDLE_URL}..."
+  curl -sSfL "${BUNDLE_URL}" -o "${archive}.part"
+
+  if ! echo "${BUNDLE_SHA256}  ${archive}.part" | sha256sum -c --status; then
+    echo "Installer bundle checksum mismatch, refusing to run it."
+    rm -f "${archive}.part"
+    return 1
+  fi
+  mv "${archive}.part" "${archive}"
+
+  local staging
+  staging=$(mktemp -d "${BUNDLE_CACHE_DIR}/.staging.XXXXXX")
+  tar -xzf "${archive}" -C "${staging}"
+  rm -f "${archive}"
+  rm -rf "${bundle_dir}"
+  mv "${staging}" "${bundle_dir}"
+}
+
 # Function to check for uv and get its path
 get_uv_path() {
   if command -v uv &> /dev/null; then
@@ -21,6 +68,24 @@ get_uv_path() {
   return 1
 }
 
+if [ -n "${BUNDLE_SHA256}" ]; then
+  BUNDLE_DIR="${BUNDLE_CACHE_DIR}/${BUNDLE_SHA256}"
+  if [ ! -f "${BUNDLE_DIR}/install.py" ]; then
+    fetch_bundle "${BUNDLE_DIR}"
+  else
+    echo "Using cached installer bundle ${BUNDLE_SHA256}."
+  fi
+
+  if ! BUNDLE_PYTHON=$(get_bundle_python); then
+    echo "The installer bundle needs Python 3.12 or newer."
+    exit 1
+  fi
+
+  # The cached script must survive failures, so install.py must not delete it
+  export DOTFILES_INSTALLER_BUNDLE="true"
+  PYTHONPATH="${BUNDLE_DIR}/vendor" exec "${BUNDLE_PYTHON}" "${BUNDLE_DIR}/install.py" "$@"
+fi
+
 # Check if uv is installed
 UV_PATH=""
 if ! UV_PATH=$(get_uv_path); then
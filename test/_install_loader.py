@@ -0,0 +1,33 @@
+"""Shared setup for the offline tests and benchmarks that import install.py."""
+
+import importlib.util
+import os
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INSTALL_PY = os.path.join(REPO_DIR, "install.py")
+
+
+def load_install(home, **env):
+    """Import install.py with its home, state and cache directories under ``home``.
+
+    ``env`` is added to the environment first, for the settings install.py reads
+    when it is imported.
+    """
+    os.environ["HOME"] = home
+    os.environ["XDG_STATE_HOME"] = os.path.join(home, ".local", "state")
+    os.environ["XDG_CACHE_HOME"] = os.path.join(home, ".cache")
+    os.environ.update(env)
+    spec = importlib.util.spec_from_file_location("install", INSTALL_PY)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_tests(suite, tests, *args, before_each=None):
+    """Call each test with ``args`` in order; returns 0 once all of them passed."""
+    for test in tests:
+        if before_each is not None:
+            before_each()
+        test(*args)
+    print(f"{suite} tests passed")
+    return 0
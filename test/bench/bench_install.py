@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""Offline benchmarks for install.py against stub nix/home-manager/gh/gpg tools.
+
+Every tool the installer drives is replaced by test/bench/stub on PATH, so the
+suite needs neither the network nor a privileged container. Results are
+compared with baselines.json and the run fails when a benchmark regresses.
+
+    python3 test/bench/bench_install.py             # compare with the baselines
+    python3 test/bench/bench_install.py --update    # record new baselines
+    python3 test/bench/bench_install.py --full      # include the 100k file tree
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))  # For test/_install_loader.py
+from _install_loader import INSTALL_PY, load_install
+
+BASELINES = os.path.join(BENCH_DIR, "baselines.json")
+STUBBED_TOOLS = [
+    "nix",
+    "nix-env",
+    "nix-channel",
+    "home-manager",
+    "gh",
+    "gpg",
+    "ssh-keygen",
+    "curl",
+]
+TREE_SIZES = [1_000, 10_000]
+FULL_TREE_SIZES = TREE_SIZES + [100_000]
+OUTPUT_LINES = 20_000
+NOISE_FLOOR = 0.05  # Seconds of slowdown never reported as a regression
+
+ANSWER_FILE = """\
+username = "bench"
+git_name = "Bench User"
+git_email = "bench@example.com"
+
+[signing]
+method = "ssh"
+create = true
+"""
+GIT_CONFIG_NIX = """\
+{ ... }:
+{
+  programs.git = {
+    enable = true;
+    userName = "hadronomy";
+    userEmail = "hadronomy@example.com";
+    extraConfig = {
+    };
+  };
+}
+"""
+# Two distinct inputs; nixpkgs_2 locks the same tree as nixpkgs
+FLAKE_LOCK = {
+    "nodes": {
+        "home-manager": {
+            "inputs": {"nixpkgs": "nixpkgs_2"},
+            "locked": {
+                "lastModified": 1767225600,
+                "narHash": "sha256-8FJsFqr1zQPaFYCzHKD9el3kk5Y2qOoXKfHV1RKrGrQ=",
+                "owner": "nix-community",
+                "repo": "home-manager",
+                "rev": "a8373b3d44fd5339b4e02d0bb3ce9f2c0e54728d",
+                "type": "github",
+            },
+        },
+        "nixpkgs": {
+            "locked": {
+                "lastModified": 1767225600,
+                "narHash": "sha256-2T/H0Q3fWzComEgjP1J/SDoNiG+nS9bADAz0kXd1Kqo=",
+                "owner": "NixOS",
+                "repo": "nixpkgs",
+                "rev": "c41f53d5be8971e3ace7e4071fca2b18e29ff0bc",
+                "type": "github",
+            },
+        },
+        "nixpkgs_2": {
+            "locked": {
+                "lastModified": 1767225600,
+                "narHash": "sha256-2T/H0Q3fWzComEgjP1J/SDoNiG+nS9bADAz0kXd1Kqo=",
+                "owner": "NixOS",
+                "repo": "nixpkgs",
+                "rev": "c41f53d5be8971e3ace7e4071fca2b18e29ff0bc",
+                "type": "github",
+            },
+        },
+        "root": {"inputs": {"home-manager": "home-manager", "nixpkgs": "nixpkgs"}},
+    },
+    "root": "root",
+    "version": 7,
+}
+
+
+def make_stub_bin(root):
+    """Create a bin directory where every stubbed tool points at the stub."""
+    bin_dir = os.path.join(root, "bin")
+    os.makedirs(bin_dir)
+    for tool in STUBBED_TOOLS:
+        os.symlink(os.path.join(BENCH_DIR, "stub"), os.path.join(bin_dir, tool))
+    return bin_dir
+
+
+def make_dotfiles_repo(root):
+    """Create a small local dotfiles repository to clone instead of GitHub."""
+    repo = os.path.join(root, "dotfiles-src")
+    os.makedirs(os.path.join(repo, "home", "git"))
+    with open(os.path.join(repo, "home", "git", "default.nix"), "w") as f:
+        f.write(GIT_CONFIG_NIX)
+    with open(os.path.join(repo, "flake.nix"), "w") as f:
+        f.write('{ outputs = { ... }: { homeConfigurations."hadronomy" = { }; }; }\n')
+    with open(os.path.join(repo, "flake.lock"), "w") as f:
+        json.dump(FLAKE_LOCK, f, indent=2)
+
+    env = {
+        **os.environ,
+        "GIT_AUTHOR_NAME": "bench",
+        "GIT_AUTHOR_EMAIL": "bench@example.com",
+        "GIT_COMMITTER_NAME": "bench",
+        "GIT_COMMITTER_EMAIL": "bench@example.com",
+    }
+    for command in (["init", "-q"], ["add", "-A"], ["commit", "-q", "-m", "init"]):
+        subprocess.run(["git", "-C", repo, *command], check=True, env=env)
+    return repo
+
+
+def make_input_mirror(root):
+    """Create a file:// mirror serving the GitHub inputs locked in FLAKE_LOCK."""
+    mirror = os.path.join(root, "mirror")
+    for node in FLAKE_LOCK["nodes"].values():
+        locked = node.get("locked")
+        if not locked:
+            continue
+        archive = os.path.join(
+            mirror, locked["owner"], locked["repo"], "archive", f"{locked['rev']}.tar.gz"
+        )
+        os.makedirs(os.path.dirname(archive), exist_ok=True)
+        with open(archive, "wb") as f:
+            f.write(b"stub archive")
+    return mirror
+
+
+def make_tree(root, files, per_dir=100):
+    """Create a synthetic dotfiles tree where one file in ten names the default user."""
+    for index in range(files):
+        directory = os.path.join(root, f"d{index // per_dir:05d}")
+        if index % per_dir == 0:
+            os.makedirs(directory)
+        with open(os.path.join(directory, f"f{index:06d}.nix"), "w") as f:
+            if index % 10 == 0:
+                f.write(f'{{ home.username = "hadronomy"; id = {index}; }}\n')
+            else:
+                f.write(f"{{ id = {index}; }}\n" * 4)
+
+
+def run_installer(home, bin_dir, repo, answer_file, mirror, expect=()):
+    """Run a complete stubbed install and return its wall time.
+
+    Fails unless every string in ``expect`` appears in the installer's output.
+    """
+    env = {
+        **os.environ,
+        "HOME": home,
+        "XDG_STATE_HOME": os.path.join(home, ".local", "state"),
+        "XDG_CACHE_HOME": os.path.join(home, ".cache"),
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+        "SSH_AUTH_SOCK": "",
+        "NIX_STORE_DIR": os.path.join(home, "store"),
+        # Wide enough that rich never wraps a line the checks below look for
+        "COLUMNS": "1000",
+    }
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, INSTALL_PY, "install", "--repo-url", f"file://{repo}"]
+        + ["--config", answer_file, "--input-mirror", f"file://{mirror}"],
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"stubbed install failed:\n{result.stdout[-4000:]}")
+    output = re.sub(r"\x1b\[[0-9;?]*[A-Za-z]", "", result.stdout)
+    missing = [text for text in expect if text not in output]
+    if missing:
+        raise RuntimeError(
+            f"stubbed install did not print {missing}:\n{result.stdout[-4000:]}"
+        )
+    return elapsed
+
+
+def bench_orchestration(workdir):
+    """Time a full install and a repeat run over it with zero-latency stubs."""
+    bin_dir = make_stub_bin(workdir)
+    repo = make_dotfiles_repo(workdir)
+    mirror = make_input_mirror(workdir)
+    answer_file = os.path.join(workdir, "user.toml")
+    with open(answer_file, "w") as f:
+        f.write(ANSWER_FILE)
+
+    home = os.path.join(workdir, "home")
+    os.makedirs(home)
+    # The stub nix can only fetch from the mirror, so both inputs must use it
+    prefetched = [
+        f"Prefetching 2 flake inputs from file://{mirror}",
+        "Fetched home-manager",
+        "Fetched nixpkgs, nixpkgs_2",
+    ]
+    return {
+        "orchestration_fresh": run_installer(
+            home, bin_dir, repo, answer_file, mirror, expect=prefetched
+        ),
+        "orchestration_resume": run_installer(home, bin_dir, repo, answer_file, mirror),
+    }
+
+
+def bench_run_command(install):
+    """Time run_command streaming a high volume of output."""
+    command = [
+        sys.executable,
+        "-c",
+        "import sys\n"
+        f"for i in range({OUTPUT_LINES}):\n"
+        "    print('line', i, file=sys.stderr if i % 7 == 0 else sys.stdout)",
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        install.run_command(command)
+        elapsed = time.perf_counter() - start
+    return {f"run_command_{OUTPUT_LINES // 1000}k_lines": elapsed}
+
+
+def bench_rewrite(install, workdir, sizes):
+    """Time replace_username_in_files on cold and manifest-warm trees."""
+    results = {}
+    install.USER_CONFIG["username"] = "bench"
+    for files in sizes:
+        tree = os.path.join(workdir, f"tree-{files}")
+        make_tree(tree, files)
+        install.DOTFILES_DIR = tree
+        with contextlib.redirect_stdout(io.StringIO()):
+            for label in ("cold", "warm"):
+                start = time.perf_counter()
+                install.replace_username_in_files()
+                results[f"rewrite_{label}_{files // 1000}k"] = (
+                    time.perf_counter() - start
+                )
+        shutil.rmtree(tree)
+    return results
+
+
+def compare(results, baselines, tolerance):
+    """Print results next to their baselines and return the names that regressed."""
+    regressions = []
+    print(f"{'benchmark':<28} {'seconds':>9} {'baseline':>9} {'ratio':>7}")
+    for name, seconds in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            print(f"{name:<28} {seconds:>9.3f} {'-':>9} {'-':>7}")
+            continue
+        ratio = seconds / baseline if baseline else float("inf")
+        regressed = ratio > 1 + tolerance and seconds - baseline > NOISE_FLOOR
+        marker = "  REGRESSION" if regressed else ""
+        print(f"{name:<28} {seconds:>9.3f} {baseline:>9.3f} {ratio:>6.2f}x{marker}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--update", action="store_true", help="Record the results as new baselines."
+    )
+    parser.add_argument(
+        "--full", action="store_true", help="Also benchmark a 100k file tree."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Allowed slowdown over the baseline before failing (0.5 = 50%%).",
+    )
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dotfiles-bench-")
+    try:
+        results = bench_orchestration(workdir)
+        install = load_install(os.path.join(workdir, "home-inproc"))
+        results.update(bench_run_command(install))
+        sizes = FULL_TREE_SIZES if args.full else TREE_SIZES
+        results.update(bench_rewrite(install, workdir, sizes))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES, "r") as f:
+            baselines = json.load(f)
+
+    regressions = compare(results, baselines, args.tolerance)
+    if args.update:
+        baselines.update({name: round(value, 3) for name, value in results.items()})
+        with open(BASELINES, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baselines written to {BASELINES}")
+        return 0
+
+    if regressions:
+        print(f"Regressed: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,12 +21,49 @@ chmod +x ./install.py
 
 # Install dependencies with pip
 echo "Installing dependencies"
-pip install typer rich pygithub requests psutil
+pip install typer rich requests psutil
 
 # Test customization with the --customize flag
 echo "Testing with --customize flag and full installation"
-# Provide predetermined responses to prompts
-echo -e "tester\nTest User\ntest@example.com\ny\n2\n~/.ssh/id_test_ed25519\nn\n" | python3 ./install.py --customize
+# Provide predetermined responses to prompts, in order: username, name, email,
+# use signing, method (2 = SSH), create a new key, algorithm, upload to GitHub,
+# disable 1Password. A fresh container has no keys, so neither the
+# existing-key nor the replace-key question is asked.
+echo -e "tester\nTest User\ntest@example.com\ny\n2\ny\ned25519\nn\ny\n" | python3 ./install.py --customize
+
+# Check the exit status
+EXIT_CODE=$?
+if [ $EXIT_CODE -eq 0 ]; then
+    echo -e "\n\033[32m✓ Test passed! Interactive customization worked successfully\033[0m"
+else
+    echo -e "\n\033[31m✗ Test failed! Interactive customization exited with code ${EXIT_CODE}\033[0m"
+    exit 1
+fi
+
+# Verify the signing key was created without ssh-keygen prompting
+if [ -f ~/.ssh/id_signing_ed25519.pub ]; then
+    echo -e "\033[32m✓ SSH signing key was created\033[0m"
+else
+    echo -e "\033[31m✗ Test failed! SSH signing key was not created\033[0m"
+    exit 1
+fi
+
+# Test customization with an answer file instead of prompts; the key from the
+# previous run is reused because the answer file does not ask to overwrite it
+echo "Testing with --config answer file and full installation"
+cat > user.toml <<'EOF'
+username = "tester"
+git_name = "Test User"
+git_email = "test@example.com"
+onepassword_disable = true
+
+[signing]
+method = "ssh"
+create = true
+algorithm = "ed25519"
+upload = false
+EOF
+python3 ./install.py --config user.toml </dev/null
 
 # Check the exit status
 EXIT_CODE=$?
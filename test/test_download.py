@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Offline test of download_file's resumption and hedging against a local server.
+
+    python3 test/test_download.py
+"""
+
+import hashlib
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from _install_loader import load_install, run_tests
+
+PAYLOAD = os.urandom(512 * 1024)
+ETAG = '"payload-1"'
+
+
+class RangeServer(http.server.BaseHTTPRequestHandler):
+    """Serves PAYLOAD with ETag and single-range support, plus injected faults."""
+
+    protocol_version = "HTTP/1.1"
+    # Faults for successive requests: "drop" sends half the body then closes,
+    # "stall" waits before answering; anything else serves normally
+    faults = []
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        fault = cls.faults.pop(0) if cls.faults else None
+        cls.requests.append(
+            {
+                "range": self.headers.get("Range"),
+                "if_range": self.headers.get("If-Range"),
+            }
+        )
+        if fault == "stall":
+            time.sleep(1.5)
+
+        start = 0
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_header and (if_range is None or if_range == ETAG):
+            start = int(range_header.split("=")[1].rstrip("-"))
+        body = PAYLOAD[start:]
+
+        self.send_response(206 if start else 200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        if start:
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}"
+            )
+        self.end_headers()
+        if fault == "drop":
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+def reset(faults=()):
+    RangeServer.faults = list(faults)
+    RangeServer.requests = []
+
+
+def leftovers(dest):
+    directory, name = os.path.split(dest)
+    return [f for f in os.listdir(directory) if f.startswith(f"{name}.part")]
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_resumes_dropped_download(install, url, dest):
+    reset(["drop"])
+    install.download_file(url, dest, hedge_delay=30)
+    assert read(dest) == PAYLOAD, "a resumed download must splice correctly"
+    assert len(RangeServer.requests) == 2, RangeServer.requests
+    resume = RangeServer.requests[1]
+    assert resume["range"] == f"bytes={len(PAYLOAD) // 2}-", resume
+    assert resume["if_range"] == ETAG, "a resume must be guarded by If-Range"
+    assert not leftovers(dest)
+
+
+def test_stale_part_without_validator_restarts(install, url, dest):
+    reset()
+    with open(f"{dest}.part1", "wb") as f:
+        f.write(b"stale bytes from some other file")
+    install.download_file(url, dest, hedge_delay=30)
+    assert read(dest) == PAYLOAD
+    assert RangeServer.requests[0]["range"] is None, RangeServer.requests
+    assert not leftovers(dest)
+
+
+def test_changed_validator_refetches_whole_file(install, url, dest):
+    reset()
+    with open(f"{dest}.part1", "wb") as f:
+        f.write(b"x" * 1000)
+    with open(f"{dest}.part1.meta", "w") as f:
+        f.write(f'{{"url": "{url}", "validator": "\\"payload-0\\""}}')
+    install.download_file(url, dest, hedge_delay=30)
+    assert read(dest) == PAYLOAD, "a mismatched If-Range must not be spliced"
+    assert RangeServer.requests[0]["if_range"] == '"payload-0"', RangeServer.requests
+
+
+def test_hedges_slow_download(install, url, dest):
+    reset(["stall"])
+    sha256 = hashlib.sha256(PAYLOAD).hexdigest()
+    start = time.monotonic()
+    install.download_file(url, dest, sha256=sha256, hedge_delay=0.2)
+    elapsed = time.monotonic() - start
+    assert read(dest) == PAYLOAD
+    assert len(RangeServer.requests) == 2, "a slow download must be hedged"
+    # download_file waits for the stalled lane before cleaning up after it
+    assert elapsed < 5, elapsed
+    assert not leftovers(dest), leftovers(dest)
+    lanes = [t for t in threading.enumerate() if "(lane)" in t.name]
+    assert not lanes, "lanes must be joined before returning"
+
+
+def main():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RangeServer)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="server", daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/payload.tar.gz"
+
+    with tempfile.TemporaryDirectory(prefix="dotfiles-test-") as home:
+        install = load_install(home)
+        dest = os.path.join(home, "payload.tar.gz")
+
+        def remove_dest():
+            if os.path.exists(dest):
+                os.remove(dest)
+
+        code = run_tests(
+            "Download",
+            (
+                test_resumes_dropped_download,
+                test_stale_part_without_validator_restarts,
+                test_changed_validator_refetches_whole_file,
+                test_hedges_slow_download,
+            ),
+            install,
+            url,
+            dest,
+            before_each=remove_dest,
+        )
+
+    server.shutdown()
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
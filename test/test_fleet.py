@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Offline test of the fleet command with local stand-ins for ssh and installs.
+
+    python3 test/test_fleet.py
+"""
+
+import json
+import os
+import stat
+import sys
+import tempfile
+import time
+
+import typer
+from _install_loader import load_install, run_tests
+
+# Stands in for ssh: "HOST SCRIPT". The script is ignored; the host name says
+# how the pretend install goes
+SSH_STAND_IN = """\
+#!/bin/sh
+host=$1
+cat >/dev/null
+echo "installing on $host"
+case "$host" in
+  slow-*) sleep 1 ;;
+  broken-*) echo "nix: store is corrupt" >&2; exit 3 ;;
+esac
+echo 'DOTFILES_REPORT {"status": "ok", "phases": {"nix": 0.5}, "error": null}'
+"""
+# Stands in for a local install: records when it ran, then reports success
+LOCAL_INSTALL = """\
+import json, sys, time
+start = time.time()
+time.sleep(0.3)
+with open(sys.argv[1], "a") as f:
+    f.write(json.dumps([start, time.time()]) + "\\n")
+print('DOTFILES_REPORT {"status": "ok", "phases": {}, "error": null}')
+"""
+
+
+def run_fleet(install, specs, jobs=4):
+    """Run the fleet command; returns its exit code."""
+    try:
+        install.fleet(
+            targets=specs, targets_file=None, config=None, jobs=jobs, dry_run=True
+        )
+    except typer.Exit as e:
+        return e.exit_code
+    return 0
+
+
+def test_remote_targets_run_in_parallel(install, workdir):
+    ssh = os.path.join(workdir, "ssh")
+    with open(ssh, "w") as f:
+        f.write(SSH_STAND_IN)
+    os.chmod(ssh, os.stat(ssh).st_mode | stat.S_IXUSR)
+    os.environ["DOTFILES_FLEET_SSH"] = ssh
+
+    reports = [
+        install.run_fleet_target(spec, [], None)
+        for spec in ("ssh:fast-1", "ssh:broken-1")
+    ]
+    assert [r["status"] for r in reports] == ["ok", "failed"], reports
+    assert reports[0]["phases"] == {"nix": 0.5}, reports[0]
+    assert "store is corrupt" in reports[1]["error"], reports[1]
+
+    start = time.monotonic()
+    code = run_fleet(install, ["ssh:slow-1", "ssh:slow-2", "ssh:slow-3"])
+    elapsed = time.monotonic() - start
+    assert code == 0, code
+    assert elapsed < 2.5, f"three 1s targets took {elapsed:.1f}s; they must overlap"
+    assert run_fleet(install, ["ssh:fast-1", "ssh:broken-1"]) == 1
+
+
+def test_local_targets_run_one_at_a_time(install, workdir):
+    script = os.path.join(workdir, "local_install.py")
+    with open(script, "w") as f:
+        f.write(LOCAL_INSTALL)
+    log = os.path.join(workdir, "local.log")
+    runner = install.FLEET_RUNNERS["local"]
+    install.FLEET_RUNNERS["local"] = lambda target, args, config: (
+        [sys.executable, script, log],
+        None,
+        None,
+    )
+    try:
+        code = run_fleet(install, [f"local:{workdir}/a", f"local:{workdir}/b"])
+    finally:
+        install.FLEET_RUNNERS["local"] = runner
+    assert code == 0, code
+
+    with open(log) as f:
+        spans = sorted(json.loads(line) for line in f)
+    assert len(spans) == 2, spans
+    assert spans[0][1] <= spans[1][0], f"local installs overlapped: {spans}"
+
+
+def test_duplicate_targets_are_rejected(install, workdir):
+    home = os.path.join(workdir, "a")
+    assert run_fleet(install, [f"local:{home}", f"local:{home}/../a"]) == 2
+    assert run_fleet(install, ["ssh:host", "ssh:host"]) == 2
+
+
+def test_target_exiting_fails_only_itself(install, workdir):
+    def exiting_runner(target, args, config):
+        sys.exit(1)  # What a helper calling cleanup() amounts to
+
+    install.FLEET_RUNNERS["exiting"] = exiting_runner
+    try:
+        report = install.run_fleet_target("exiting:x", [], None)
+    finally:
+        del install.FLEET_RUNNERS["exiting"]
+    assert report["status"] == "failed", report
+    assert report["error"] == "exited with code 1", report
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix="dotfiles-test-") as workdir:
+        install = load_install(workdir)
+        return run_tests(
+            "Fleet",
+            (
+                test_remote_targets_run_in_parallel,
+                test_local_targets_run_one_at_a_time,
+                test_duplicate_targets_are_rejected,
+                test_target_exiting_fails_only_itself,
+            ),
+            install,
+            workdir,
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Offline test of the GitHub device flow and key sync against a mock OAuth server.
+
+    python3 test/test_github_device_flow.py
+"""
+
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from _install_loader import load_install, run_tests
+
+PUBLIC_KEY = (
+    "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIBmJm8QeCp8pU8MiK7bL9h4NqM8D3FKi8fQ1Ss0YqZ0b"
+)
+
+
+class MockGitHub(http.server.BaseHTTPRequestHandler):
+    """Just enough of github.com and api.github.com for the installer."""
+
+    # Replies to successive token polls; the last one repeats
+    token_replies = []
+    polls = 0
+    keys = []
+    uploads = 0
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        cls = type(self)
+        if self.path == "/login/device/code":
+            self.reply(
+                200,
+                {
+                    "device_code": "device-123",
+                    "user_code": "ABCD-1234",
+                    "verification_uri": "http://localhost/device",
+                    "expires_in": 30,
+                    "interval": 0.01,
+                },
+            )
+        elif self.path == "/login/oauth/access_token":
+            reply = cls.token_replies[min(cls.polls, len(cls.token_replies) - 1)]
+            cls.polls += 1
+            self.reply(200, reply)
+        elif self.path == "/user/keys":
+            cls.uploads += 1
+            key = json.loads(body)["key"]
+            cls.keys.append({"id": len(cls.keys) + 1, "key": key})
+            self.reply(201, cls.keys[-1])
+        else:
+            self.reply(404, {"message": "Not Found"})
+
+    def do_GET(self):
+        if self.path.startswith("/user/keys"):
+            etag = f'"keys-{len(type(self).keys)}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.reply(304, headers={"ETag": etag})
+            else:
+                self.reply(200, type(self).keys, headers={"ETag": etag})
+        else:
+            self.reply(404, {"message": "Not Found"})
+
+
+def test_device_flow_honours_slow_down(install, home):
+    MockGitHub.polls = 0
+    MockGitHub.token_replies = [
+        {"error": "authorization_pending"},
+        {"error": "slow_down", "interval": 0.05},
+        {"access_token": "token-abc"},
+    ]
+    device = install.request_device_code("admin:public_key")
+    sleeps = []
+    token = install.poll_device_token(device, sleep=sleeps.append)
+    assert token == "token-abc", token
+    assert sleeps == [0.01, 0.01, 0.05], sleeps
+
+
+def test_device_flow_denied(install, home):
+    MockGitHub.polls = 0
+    MockGitHub.token_replies = [
+        {"error": "access_denied", "error_description": "The user denied access"}
+    ]
+    device = install.request_device_code("admin:public_key")
+    try:
+        install.poll_device_token(device, sleep=lambda interval: None)
+    except Exception as e:
+        assert "denied" in str(e), e
+    else:
+        raise AssertionError("a denied authorization must raise")
+
+
+def test_cancelling_stops_the_poll(install, home):
+    MockGitHub.polls = 0
+    MockGitHub.token_replies = [{"error": "authorization_pending"}]
+    device = install.request_device_code("admin:public_key")
+    device["interval"] = 5  # Only cancellation can end this poll quickly
+
+    cancelled = threading.Event()
+    future = install.start_device_poll(device, cancelled)
+    poller = next(t for t in threading.enumerate() if t.name == "device-flow")
+    assert poller.daemon, "the poll must never keep the interpreter alive"
+
+    start = time.monotonic()
+    cancelled.set()
+    try:
+        future.result(timeout=2)
+    except Exception as e:
+        assert "cancelled" in str(e), e
+    else:
+        raise AssertionError("a cancelled poll must raise")
+    assert time.monotonic() - start < 1, "cancellation must not wait out the interval"
+
+
+def test_key_sync_uploads_once(install, home):
+    key_path = os.path.join(home, ".ssh", "id_test")
+    os.makedirs(os.path.dirname(key_path), exist_ok=True)
+    with open(f"{key_path}.pub", "w") as f:
+        f.write(f"{PUBLIC_KEY} test@example.com\n")
+
+    MockGitHub.keys, MockGitHub.uploads = [], 0
+    assert install.sync_key_to_github("token-abc", "ssh", key_path) is True
+    assert MockGitHub.uploads == 1
+    # The key is now in the index, so a second run only revalidates it
+    assert install.sync_key_to_github("token-abc", "ssh", key_path) is True
+    assert MockGitHub.uploads == 1, "an existing key must not be uploaded again"
+
+
+def main():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), MockGitHub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    with tempfile.TemporaryDirectory(prefix="dotfiles-test-") as home:
+        install = load_install(
+            home, DOTFILES_GITHUB_URL=url, DOTFILES_GITHUB_API_URL=url
+        )
+        code = run_tests(
+            "GitHub device flow",
+            (
+                test_device_flow_honours_slow_down,
+                test_device_flow_denied,
+                test_cancelling_stops_the_poll,
+                test_key_sync_uploads_once,
+            ),
+            install,
+            home,
+        )
+
+    server.shutdown()
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
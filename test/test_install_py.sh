@@ -21,7 +21,7 @@ chmod +x ./install.py
 
 # Install dependencies with pip
 echo "Installing dependencies"
-pip install typer rich pygithub requests psutil
+pip install typer rich requests psutil
 
 # Run the install.py with full installation
 echo "Running full installation - this will install nix and home-manager"